@@ -0,0 +1,146 @@
+"""
+Batch routing. Computes routes for many (start, destination) pairs -- or every pair of stations -- on a
+process pool and streams the results to a CSV or JSON lines file as they finish.
+
+Usage: MetroBatch -s <network snapshot> -o <output .csv/.jsonl> [-i <pairs csv>] [-p <processes>]
+
+The pairs file has one "start,destination" pair of station codes per line. Without it, every pair
+of distinct stations is routed.
+"""
+import csv, getopt, json, os, sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import MetroMetrics
+from MetroNetwork import Network
+from MetroRouter import Router
+
+# Router for the current worker process, created once by _initWorker
+_router = None
+
+def _initWorker(snapshotPath):
+    """Process pool initializer: loads the (memory-mapped, so shared) network snapshot once per worker."""
+    global _router
+    MetroMetrics.initWorker()
+    _router = Router(Network.load(snapshotPath))
+
+def _errorResult(startCode, destCode, message):
+    """Returns the result dictionary for a pair that couldn't be routed, e.g. because of an unknown station."""
+    return {"start": startCode, "destination": destCode, "miles": None, "transfers": 0, "path": None, "error": message}
+
+def _routeToDestination(destCode, startCodes):
+    """
+    Worker task: routes every start station to one destination. Returns a list of result dictionaries; pairs
+    with an unknown station get an "error" entry instead of a route, so one bad pair doesn't stop the batch.
+    """
+    network = _router.network
+    if destCode not in network.stationIds:
+        return [_errorResult(startCode, destCode, "Unknown station: " + destCode) for startCode in startCodes]
+
+    results = [_errorResult(startCode, destCode, "Unknown station: " + startCode)
+               for startCode in startCodes if startCode not in network.stationIds]
+    knownCodes = [startCode for startCode in startCodes if startCode in network.stationIds]
+    for startCode, path, miles in _router.findShortestPaths(knownCodes, destCode):
+        results.append({
+            "start": startCode,
+            "destination": destCode,
+            "miles": round(miles, 3) if path else None,
+            "transfers": len(path) - 2 if path and len(path) > 1 else 0,
+            "path": [station.name for station in path] if path else None,
+        })
+    return results
+
+def allPairs(network):
+    """Returns every (start, destination) pair of distinct stations, by primary station code."""
+    codes = [station.codeList[0] for station in network.stations]
+    return [(start, dest) for dest in codes for start in codes if start != dest]
+
+def groupByDestination(pairs):
+    """Returns a dictionary of destination code to the list of start codes routed to it."""
+    groups = {}
+    for startCode, destCode in pairs:
+        groups.setdefault(destCode, []).append(startCode)
+    return groups
+
+class ResultWriter:
+    """
+    Streams result dictionaries (see _routeToDestination) to a CSV or JSON lines file.
+
+    Args:
+        path (str): Output file. The format is picked by extension: ".jsonl" for JSON lines, otherwise CSV.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.jsonLines = path.endswith(".jsonl")
+        if not self.jsonLines:
+            self.csvWriter = csv.writer(self.file)
+            self.csvWriter.writerow(["start", "destination", "miles", "transfers", "path", "error"])
+
+    def write(self, result):
+        if self.jsonLines:
+            self.file.write(json.dumps(result) + "\n")
+        else:
+            path = ";".join(result["path"]) if result["path"] else ""
+            self.csvWriter.writerow([result["start"], result["destination"], result["miles"], result["transfers"], path,
+                                     result.get("error", "")])
+
+    def close(self):
+        self.file.close()
+
+def routeBatch(snapshotPath, pairs, outputPath, processes=None):
+    """
+    Routes many (start, destination) pairs in parallel and streams the results to a file.
+
+    Work is grouped by destination: each task routes every start for one destination, so the
+    per-destination data is prepared once per task. Results are written as tasks complete, in
+    no particular order.
+
+    Args:
+        snapshotPath (str): Network snapshot (see MetroNetwork.Network.save) loaded by each worker.
+        pairs (list): (start code, destination code) tuples.
+        outputPath (str): CSV or JSON lines file to write (see ResultWriter).
+        processes (int): Number of worker processes; defaults to the number of CPUs.
+
+    Returns:
+        The number of routes written.
+    """
+    writer = ResultWriter(outputPath)
+    written = 0
+    try:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_initWorker, initargs=(snapshotPath,)) as executor:
+            futures = [executor.submit(_routeToDestination, destCode, startCodes)
+                    for destCode, startCodes in groupByDestination(pairs).items()]
+            for future in as_completed(futures):
+                for result in future.result():
+                    writer.write(result)
+                    written += 1
+    finally:
+        writer.close()
+    return written
+
+def readPairs(path):
+    """Reads (start, destination) station code pairs from a two-column CSV file."""
+    with open(path, newline="") as f:
+        return [(row[0].strip(), row[1].strip()) for row in csv.reader(f) if len(row) >= 2]
+
+def main(argv):
+    usage = "MetroBatch -s <network snapshot> -o <output .csv/.jsonl> [-i <pairs csv>] [-p <processes>]"
+    try:
+        opts,_ = getopt.getopt(argv, "hs:o:i:p:")
+    except getopt.GetoptError:
+        print(usage)
+        exit()
+
+    opts = dict(opts)
+    if "-h" in opts or "-s" not in opts or "-o" not in opts:
+        print(usage)
+        exit()
+
+    snapshotPath = opts["-s"]
+    pairs = readPairs(opts["-i"]) if "-i" in opts else allPairs(Network.load(snapshotPath))
+    processes = int(opts["-p"]) if "-p" in opts else os.cpu_count()
+
+    written = routeBatch(snapshotPath, pairs, opts["-o"], processes)
+    print("Wrote " + str(written) + " routes to " + opts["-o"])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,309 @@
+"""
+Routing benchmark. Builds the network from recorded API responses (see MetroStubServer), runs fixed
+workloads through each routing engine in both modes, and saves the results so runs on different commits
+can be compared.
+
+Workloads:
+    single: a few fixed station pairs, each routed repeatedly.
+    allpairs: every pair of distinct stations, once.
+    closures: seeded random pairs, with seeded station closures, segment closures and a line delay applied.
+
+Engines: router (MetroRouter.Router), contracted (MetroContraction.ContractedRouter) and raptor
+(MetroRaptor.RaptorRouter); the route cache is off so every query is searched.
+
+For each workload, engine and mode the p50 / p99 query latency, nodes expanded and f(n) evaluations per query,
+and the peak memory allocated while answering the queries (measured with tracemalloc in a separate pass over
+the first MEMORY_QUERIES, so tracing doesn't skew the latencies) are reported, followed by how routing by time
+compares with routing by distance for each workload and engine.
+
+Usage: MetroBenchmark [-f <fixture directory>] [-o <results directory>] [-c <results to compare with>]
+                      [-w <workloads>] [-e <engines>] [-r <repeats>]
+
+Workloads and engines are comma-separated. Results are saved as <results directory>/<time>-<commit>.json;
+with -c, they are compared with an earlier results file and the exit status is 1 if anything regressed.
+"""
+import gc, getopt, json, math, os, random, subprocess, sys, time, tracemalloc
+from MetroContraction import ContractedGraph, ContractedRouter
+from MetroNetwork import Network
+from MetroRaptor import RaptorRouter
+from MetroRateLimit import TokenBucket
+from MetroRouter import Router, DISTANCE, TIME
+from MetroStubServer import StubServer
+
+_USAGE = ("MetroBenchmark [-f <fixture directory>] [-o <results directory>] [-c <results to compare with>] "
+          "[-w <workloads>] [-e <engines>] [-r <repeats>]")
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIRECTORY = os.path.join(_HERE, "benchmarks", "fixtures")
+RESULTS_DIRECTORY = os.path.join(_HERE, "benchmarks", "results")
+
+WORKLOADS = ("single", "allpairs", "closures")
+ENGINES = ("router", "contracted", "raptor")
+MODES = (DISTANCE, TIME)
+
+# Workload parameters. Everything random is seeded, so each run routes the same queries.
+SINGLE_PAIRS = [("C04", "E04"), ("A15", "F11"), ("K08", "G05"), ("J03", "B11"), ("N06", "E10"), ("C15", "D13")]
+SINGLE_REPEATS = 200
+CLOSURE_QUERIES = 2000
+CLOSED_STATIONS = 3
+CLOSED_SEGMENTS = 3
+DELAY_MINUTES = 10
+# Queries routed in the (slow, traced) memory pass
+MEMORY_QUERIES = 500
+_SEED = 6511
+
+# Latency and memory vary from run to run, so they have to grow by more than this fraction to count as
+# a regression. The search counters are deterministic and may not grow at all.
+NOISE_THRESHOLD = 0.10
+_MEASURED_KEYS = ("p50Us", "p99Us", "peakBytes")
+_COUNTER_KEYS = ("expandedPerQuery", "evaluationsPerQuery")
+
+def buildNetwork(fixtureDirectory):
+    """
+    Builds the network through MetroInterface from a stub server replaying the fixtures.
+
+    Returns:
+        (MetroNetwork.Network, dictionary of build measurements)
+    """
+    from MetroInterface import MetroInterface
+    with StubServer(fixtureDirectory) as server:
+        # No response cache and no rate limit: every query goes over HTTP, as fast as the stub allows
+        metroAPI = MetroInterface("benchmark", cacheDirectory=None, baseUrl=server.url,
+                                  rateLimiter=TokenBucket(1e9, 1e9))
+        start = time.perf_counter()
+        network = Network.build(metroAPI, matrixPath=None)
+        seconds = time.perf_counter() - start
+
+        assert not server.misses(), "Missing fixtures: " + ", ".join(server.misses())
+        requestCount = server.requestCount()
+
+    return network, {"seconds": seconds, "requests": requestCount, "stations": network.size,
+                     "lines": len(network.lineInfos)}
+
+def primaryCodes(network):
+    """Returns the primary code of every station, by station id."""
+    return [station.codeList[0] for station in network.stations]
+
+def workloadQueries(network, workload, repeats=SINGLE_REPEATS):
+    """Returns the list of (start code, destination code) queries for a workload; single pairs are repeated."""
+    if workload == "single":
+        return SINGLE_PAIRS * repeats
+
+    codes = primaryCodes(network)
+    if workload == "allpairs":
+        return [(start, dest) for dest in codes for start in codes if start != dest]
+
+    rng = random.Random(_SEED)
+    return [tuple(rng.sample(codes, 2)) for _ in range(CLOSURE_QUERIES)]
+
+def applyClosures(network):
+    """
+    Applies the closures workload's disruptions to the network.
+
+    Returns:
+        A function that undoes them.
+    """
+    rng = random.Random(_SEED)
+    closedStations = rng.sample(primaryCodes(network), CLOSED_STATIONS)
+
+    closedSegments = []
+    lineCodes = sorted(network.lineInfos)
+    for _ in range(CLOSED_SEGMENTS):
+        lineCode = rng.choice(lineCodes)
+        stations = network.lineInfos[lineCode].stations
+        position = rng.randrange(1, len(stations))
+        closedSegments.append((lineCode, stations[position - 1], stations[position]))
+    delayedLine = rng.choice(lineCodes)
+
+    for code in closedStations:
+        network.closeStation(code)
+    for segment in closedSegments:
+        network.closeSegment(*segment)
+    network.setLineDelay(delayedLine, DELAY_MINUTES)
+
+    def undo():
+        for code in closedStations:
+            network.reopenStation(code)
+        for segment in closedSegments:
+            network.reopenSegment(*segment)
+        network.setLineDelay(delayedLine, 0)
+    return undo
+
+def makeRouter(engine, network, mode, contracted):
+    if engine == "router":
+        return Router(network, mode=mode)
+    if engine == "contracted":
+        return ContractedRouter(network, contracted, mode=mode)
+    return RaptorRouter(network, mode)
+
+def percentile(sortedValues, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    return sortedValues[max(0, math.ceil(fraction * len(sortedValues)) - 1)]
+
+def measure(router, queries):
+    """
+    Routes every query; returns a dictionary of latency percentiles (in microseconds), search counters per
+    query and peak memory (in bytes).
+    """
+    # Warm up (imports, first-touch of the snapshot's pages, ...) before timing
+    for startCode, destCode in queries[:50]:
+        router.findShortestPath(startCode, destCode)
+
+    stats = {}
+    latencies = []
+    unreachable = 0
+    clock = time.perf_counter
+    for startCode, destCode in queries:
+        start = clock()
+        path = router.findShortestPath(startCode, destCode, stats=stats)
+        latencies.append(clock() - start)
+        if path is None:
+            unreachable += 1
+    latencies.sort()
+
+    # Separate (shorter) pass for memory, since tracing slows every allocation down
+    gc.collect()
+    tracemalloc.start()
+    for startCode, destCode in queries[:MEMORY_QUERIES]:
+        router.findShortestPath(startCode, destCode)
+    _, peakBytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = len(queries)
+    return {
+        "queries": count,
+        "unreachable": unreachable,
+        "p50Us": percentile(latencies, 0.50) * 1e6,
+        "p99Us": percentile(latencies, 0.99) * 1e6,
+        "meanUs": sum(latencies) / count * 1e6,
+        "expandedPerQuery": stats.get("expanded", 0) / count,
+        "evaluationsPerQuery": stats.get("evaluations", 0) / count,
+        "pushesPerQuery": stats.get("pushes", 0) / count,
+        "fringePeak": stats.get("fringePeak", 0),
+        "peakBytes": peakBytes,
+    }
+
+def runBenchmarks(fixtureDirectory, workloads=WORKLOADS, engines=ENGINES, repeats=SINGLE_REPEATS):
+    """
+    Builds the network and runs each workload with each engine, in each mode.
+
+    Returns:
+        Results dictionary: "build" measurements and "results", keyed "<workload>/<engine>/<mode>".
+    """
+    network, build = buildNetwork(fixtureDirectory)
+
+    start = time.perf_counter()
+    contracted = ContractedGraph(network)
+    build["contractSeconds"] = time.perf_counter() - start
+
+    results = {}
+    for workload in workloads:
+        queries = workloadQueries(network, workload, repeats)
+        undo = applyClosures(network) if workload == "closures" else None
+        try:
+            for engine in engines:
+                for mode in MODES:
+                    name = workload + "/" + engine + "/" + mode
+                    results[name] = measure(makeRouter(engine, network, mode, contracted), queries)
+                    printResult(name, results[name])
+        finally:
+            if undo:
+                undo()
+
+    return {"commit": gitRevision(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+            "fixtures": fixtureDirectory, "build": build, "results": results}
+
+def gitRevision():
+    """Returns the short hash of the checked-out commit ("-dirty" if there are uncommitted changes), or "unknown"."""
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_HERE, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        changes = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=_HERE,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return revision + ("-dirty" if changes else "")
+
+def saveResults(results, directory):
+    """Writes results to <directory>/<time>-<commit>.json; returns the path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime("%Y%m%d-%H%M%S") + "-" + results["commit"] + ".json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    return path
+
+def printResult(name, result):
+    print("%-30s p50 %9.1f us  p99 %9.1f us  expanded %8.1f  evaluations %9.1f  peak %8.1f KiB" % (
+        name, result["p50Us"], result["p99Us"], result["expandedPerQuery"], result["evaluationsPerQuery"],
+        result["peakBytes"] / 1024))
+
+def compareModes(results):
+    """
+    Prints how routing by time compares with routing by distance for each workload and engine: the time-based
+    search should be at least as fast (see MetroMatrix.DistanceMatrix).
+    """
+    for name in sorted(results["results"]):
+        workload, engine, mode = name.split("/")
+        other = workload + "/" + engine + "/" + DISTANCE
+        if mode != TIME or other not in results["results"]:
+            continue
+        byTime, byDistance = results["results"][name], results["results"][other]
+        print("%-30s time vs distance: p50 %+.1f%%, expanded %+.1f%%, evaluations %+.1f%%" % (
+            workload + "/" + engine,
+            (byTime["p50Us"] / byDistance["p50Us"] - 1) * 100,
+            (byTime["expandedPerQuery"] / byDistance["expandedPerQuery"] - 1) * 100,
+            (byTime["evaluationsPerQuery"] / byDistance["evaluationsPerQuery"] - 1) * 100))
+
+def compare(baseline, results):
+    """
+    Prints how each result changed from a baseline run.
+
+    Returns:
+        Number of regressions: latencies or peak memory that grew by more than NOISE_THRESHOLD, or
+        search counters (expansions, evaluations) that grew at all.
+    """
+    print("Compared with " + baseline["commit"] + " (" + baseline["time"] + "):")
+    regressions = 0
+    for name in sorted(results["results"]):
+        if name not in baseline["results"]:
+            continue
+        old, new = baseline["results"][name], results["results"][name]
+        changes = []
+        for key in _MEASURED_KEYS + _COUNTER_KEYS:
+            if not old.get(key):
+                continue
+            change = (new[key] - old[key]) / old[key]
+            worse = change > NOISE_THRESHOLD if key in _MEASURED_KEYS else change > 1e-9
+            regressions += worse
+            changes.append("%s %+.1f%%%s" % (key, change * 100, " (REGRESSION)" if worse else ""))
+        print("%-30s %s" % (name, ", ".join(changes)))
+    return regressions
+
+def main(argv):
+    try:
+        opts,_ = getopt.getopt(argv, "hf:o:c:w:e:r:")
+    except getopt.GetoptError:
+        print (_USAGE)
+        exit()
+
+    opts = dict(opts)
+    workloads = opts["-w"].split(",") if "-w" in opts else WORKLOADS
+    engines = opts["-e"].split(",") if "-e" in opts else ENGINES
+    if "-h" in opts or not set(workloads) <= set(WORKLOADS) or not set(engines) <= set(ENGINES):
+        print (_USAGE)
+        exit()
+
+    repeats = int(opts.get("-r", SINGLE_REPEATS))
+    results = runBenchmarks(opts.get("-f", FIXTURE_DIRECTORY), workloads, engines, repeats)
+    compareModes(results)
+    print("Build: %(seconds).3f s, %(requests)d requests, %(stations)d stations, %(lines)d lines" % results["build"])
+    print("Results saved to " + saveResults(results, opts.get("-o", RESULTS_DIRECTORY)))
+
+    if "-c" in opts:
+        with open(opts["-c"], "r") as f:
+            baseline = json.load(f)
+        if compare(baseline, results):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
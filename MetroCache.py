@@ -0,0 +1,79 @@
+import hashlib, json, os, tempfile, time
+
+class ResponseCache:
+    """
+    Stores parsed API responses on disk so repeated queries (and cold restarts) don't hit the API.
+
+    Responses are keyed on the endpoint URL and its query parameters (the API key is never part
+    of the key) and expire after a per-endpoint time-to-live.
+
+    Args:
+        directory (str): Directory the cached responses are written to. Created if missing.
+        ttls (dict): Endpoint URL (str) to time-to-live in seconds. Endpoints not listed use defaultTtl.
+        defaultTtl (float): Time-to-live in seconds for endpoints missing from ttls.
+    """
+
+    def __init__(self, directory, ttls=None, defaultTtl=3600):
+        self.directory = directory
+        self.ttls = ttls or {}
+        self.defaultTtl = defaultTtl
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def makeKey(url, params):
+        """Returns a stable string key for an endpoint URL and dictionary of query parameters."""
+        query = "&".join(k + "=" + str(params[k]) for k in sorted(params) if k != "api_key")
+        return url + "?" + query
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url, params):
+        """
+        Looks up a cached response.
+
+        Args:
+            url (str): Endpoint URL (one of the MetroConstants URLs).
+            params (dict): Query parameters sent with the request.
+
+        Returns:
+            The parsed JSON response, or None if nothing is cached or the entry has expired.
+        """
+        try:
+            with open(self._path(self.makeKey(url, params)), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry["time"] > self.ttls.get(url, self.defaultTtl):
+            return None
+        return entry["response"]
+
+    def put(self, url, params, response):
+        """
+        Writes a parsed JSON response to the cache, replacing any previous entry.
+
+        The entry is written to a temporary file first and then renamed, so readers never see
+        a partially written response.
+        """
+        key = self.makeKey(url, params)
+        entry = {"key": key, "time": time.time(), "response": response}
+
+        fd, tmpPath = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmpPath, self._path(key))
+        except BaseException:
+            # Don't leave a partial temporary file behind (e.g. unserializable response, full disk)
+            try:
+                os.remove(tmpPath)
+            except OSError:
+                pass
+            raise
+
+    def clear(self):
+        """Removes every cached response."""
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
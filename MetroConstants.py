@@ -1,8 +1,18 @@
 """API URLs and JSON parsing keys."""
-URL_LINES_LIST = "https://api.wmata.com/Rail.svc/json/jLines"
-URL_STATION_LIST = "https://api.wmata.com/Rail.svc/json/jStations" # ?LineCode=<code>
-URL_STATION_STATION_INFO = "https://api.wmata.com/Rail.svc/json/jSrcStationToDstStationInfo" # ?ToStationCode=<code>
-URL_STATION_PATH = "https://api.wmata.com/Rail.svc/json/jPath" # ?FromStationCode=<code1> &ToStationCode=<code2>
+API_BASE_URL = "https://api.wmata.com"
+URL_LINES_LIST = API_BASE_URL + "/Rail.svc/json/jLines"
+URL_STATION_LIST = API_BASE_URL + "/Rail.svc/json/jStations" # ?LineCode=<code>
+URL_STATION_STATION_INFO = API_BASE_URL + "/Rail.svc/json/jSrcStationToDstStationInfo" # ?ToStationCode=<code>
+URL_STATION_PATH = API_BASE_URL + "/Rail.svc/json/jPath" # ?FromStationCode=<code1> &ToStationCode=<code2>
+URL_INCIDENTS = API_BASE_URL + "/Incidents.svc/json/Incidents"
+URL_TRAIN_POSITIONS = API_BASE_URL + "/TrainPositions/TrainPositions" # ?contentType=json
+
+# WMATA allows 10 requests / sec. Requests share one token bucket (see MetroRateLimit.TokenBucket).
+API_RATE_LIMIT = 10
+API_BURST = 10
+# Maximum concurrent requests (also the HTTP connection pool size), and per-request timeout in seconds
+API_WORKERS = 8
+API_TIMEOUT = 30
 
 LINES_TOP = "Lines"
 LINES_DISPLAY_NAME = "DisplayName"
@@ -19,11 +29,108 @@ STATION_LIST_LC3 = "LineCode3"
 STATION_LIST_LC4 = "LineCode4"
 STATION_LIST_ST1 = "StationTogether1"
 STATION_LIST_ST2 = "StationTogether2"
+STATION_LIST_LAT = "Lat"
+STATION_LIST_LON = "Lon"
 
 STATION_STATION_TOP = "StationToStationInfos"
 STATION_STATION_MILES = "CompositeMiles"
 STATION_STATION_TIME = "RailTime"
 STATION_STATION_SOURCE = "SourceStation"
+STATION_STATION_DEST = "DestinationStation"
 
 STATION_PATH_TOP = "Path"
 STATION_PATH_CODE = "StationCode"
+STATION_PATH_DIST_PREV = "DistanceToPrev" # In feet
+
+FEET_PER_MILE = 5280
+
+INCIDENTS_TOP = "Incidents"
+INCIDENT_ID = "IncidentID"
+INCIDENT_TYPE = "IncidentType"
+INCIDENT_DESCRIPTION = "Description"
+INCIDENT_LINES = "LinesAffected" # e.g. "RD; OR;"
+INCIDENT_TYPE_DELAY = "Delay"
+
+TRAIN_POSITIONS_TOP = "TrainPositions"
+TRAIN_ID = "TrainId"
+TRAIN_LINE = "LineCode"
+TRAIN_CIRCUIT = "CircuitId"
+TRAIN_DESTINATION = "DestinationStationCode"
+TRAIN_SECONDS_AT_LOCATION = "SecondsAtLocation"
+TRAIN_SERVICE_TYPE = "ServiceType"
+TRAIN_SERVICE_NORMAL = "Normal"
+
+# Time-based routing: added for each transfer at a station with several platforms (codes), and the
+# smallest travel time assumed between adjacent stations (RailTime is in whole minutes, so adjacent
+# stations can appear 0 minutes apart)
+TRANSFER_PENALTY_MINUTES = 5
+MIN_SEGMENT_MINUTES = 0.5
+
+# On-disk response cache: directory and time-to-live (seconds) per endpoint.
+# Line and station lists rarely change; station-to-station info (distances, times) may.
+CACHE_DIRECTORY = ".metrocache"
+CACHE_DEFAULT_TTL = 60 * 60
+CACHE_TTLS = {
+    URL_LINES_LIST: 7 * 24 * 60 * 60,
+    URL_STATION_LIST: 7 * 24 * 60 * 60,
+    URL_STATION_PATH: 7 * 24 * 60 * 60,
+    URL_STATION_STATION_INFO: 24 * 60 * 60,
+}
+
+# Live feeds (see MetroFeeds): seconds between polls of each feed, the delay assumed for a line with a
+# "Delay" incident, and how long a train can sit at one track circuit before its line counts as delayed
+# (by the time beyond that). Train positions update every few seconds; incidents change rarely.
+FEED_INCIDENTS_INTERVAL = 60
+FEED_TRAIN_POSITIONS_INTERVAL = 10
+INCIDENT_DELAY_MINUTES = 10
+TRAIN_HOLD_SECONDS = 180
+
+# Precomputed station-by-station distance matrix (see MetroMatrix.DistanceMatrix)
+DISTANCE_MATRIX_FILE = "distances.matrix"
+
+# Most ALT landmarks picked by default (see MetroLandmarks.Landmarks.build); WMATA's line termini are fewer
+MAX_LANDMARKS = 16
+
+# GTFS static feeds (see MetroGTFS): file names and the columns read from each
+GTFS_STOPS = "stops.txt"
+GTFS_STOP_ID = "stop_id"
+GTFS_STOP_NAME = "stop_name"
+GTFS_STOP_LAT = "stop_lat"
+GTFS_STOP_LON = "stop_lon"
+GTFS_LOCATION_TYPE = "location_type" # 0 or empty: stop / platform, 1: station, others: entrances, nodes etc.
+GTFS_PARENT_STATION = "parent_station"
+
+GTFS_ROUTES = "routes.txt"
+GTFS_ROUTE_ID = "route_id"
+GTFS_ROUTE_SHORT_NAME = "route_short_name"
+GTFS_ROUTE_LONG_NAME = "route_long_name"
+GTFS_ROUTE_TYPE = "route_type" # 0: tram, 1: subway, 2: rail, 3: bus, ...
+
+GTFS_TRIPS = "trips.txt"
+GTFS_TRIP_ID = "trip_id"
+
+GTFS_STOP_TIMES = "stop_times.txt"
+GTFS_ARRIVAL_TIME = "arrival_time" # HH:MM:SS, may be past 24:00:00; empty between timepoints
+GTFS_DEPARTURE_TIME = "departure_time"
+GTFS_STOP_SEQUENCE = "stop_sequence"
+GTFS_SHAPE_DIST = "shape_dist_traveled" # In the feed's own units
+
+EARTH_RADIUS_MILES = 3958.8
+
+# Metrics (see MetroMetrics): environment variables selecting the sink and the export interval (seconds),
+# and the prefix of exported metric names
+METRICS_ENV = "METROPY_METRICS"
+METRICS_INTERVAL_ENV = "METROPY_METRICS_INTERVAL"
+METRICS_DEFAULT_INTERVAL = 60
+METRICS_PREFIX = "metropy_"
+
+# Routing service (see MetroService): default address, worker threads, most searches queued or running
+# before requests are turned away (503), most pairs per batch request, route cache size per mode and
+# largest request body (bytes)
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_WORKERS = 4
+SERVICE_MAX_PENDING = 64
+SERVICE_MAX_BATCH = 10000
+SERVICE_CACHE_SIZE = 4096
+SERVICE_MAX_BODY = 1024 * 1024
@@ -0,0 +1,73 @@
+import bisect
+from array import array
+from MetroRouter import Router, DISTANCE
+
+class ContractedGraph:
+    """
+    The network contracted down to its transfer stations.
+
+    A transfer station is one served by more than one line, or with more than one code (platform). Every other
+    station only passes traffic through, so a search only needs to visit one if it is the origin or destination.
+    The contracted graph keeps the transfer stations as nodes, joined along each line to every other transfer
+    station on it; the costs of those edges are read from the lines' cumulative mileage and times at query time.
+
+    Args:
+        network (MetroNetwork.Network): Network to contract. Disruptions are applied at query time, not here.
+    """
+
+    def __init__(self, network):
+        self.network = network
+        lineCounts = (network.stationLineStart[stationId + 1] - network.stationLineStart[stationId]
+                for stationId in range(network.size))
+        self.isTransfer = bytearray(lineCount > 1 or multiPlatform
+                for lineCount, multiPlatform in zip(lineCounts, network.multiPlatform))
+        self.transferIds = tuple(stationId for stationId in range(network.size) if self.isTransfer[stationId])
+
+        # Line code -> positions of the transfer stations along the line, in order
+        self.transferPositions = {}
+        for lineCode, ids in network.lineStationIds.items():
+            self.transferPositions[lineCode] = array("i", (position for position, stationId in enumerate(ids)
+                    if self.isTransfer[stationId]))
+
+    def transfersBetween(self, lineCode, first, last):
+        """Returns the positions of the transfer stations on a line from position first to last (inclusive)."""
+        positions = self.transferPositions[lineCode]
+        return positions[bisect.bisect_left(positions, first):bisect.bisect_right(positions, last)]
+
+    def edgeCount(self):
+        """Returns the number of (directed) edges between transfer stations."""
+        return sum(len(positions) * (len(positions) - 1) for positions in self.transferPositions.values())
+
+class ContractedRouter(Router):
+    """
+    MetroRouter.Router that searches the transfer-station graph (ContractedGraph) instead of every station.
+
+    The search loop is Router's: only the stops it considers along a line differ (see _stopsBetween()). The
+    origin is expanded like any other station, and the destination is offered as a stop wherever a line being
+    ridden serves it. Routes, costs, caching and disruption handling are the same as Router's, and one-to-all
+    sweeps (costsFrom) consider every stop, since they need every station's cost.
+
+    Args:
+        network (MetroNetwork.Network): Prebuilt network to route on.
+        contracted (ContractedGraph): Contraction of the network; built if None.
+        cacheSize (int): See Router.
+        mode (str): See Router.
+    """
+
+    engine = "contracted"
+
+    def __init__(self, network, contracted=None, cacheSize=0, mode=DISTANCE):
+        Router.__init__(self, network, cacheSize, mode)
+        self.contracted = contracted or ContractedGraph(network)
+
+    def _stopsBetween(self, lineCode, first, last, destId):
+        """Returns the transfer stations between two positions on a line, plus the destination if it is there."""
+        if destId == -1:
+            return Router._stopsBetween(self, lineCode, first, last, destId)
+
+        stops = self.contracted.transfersBetween(lineCode, first, last)
+        if not self.contracted.isTransfer[destId]:
+            destPosition = self.network.lineInfos[lineCode].positionOf(self.network.stations[destId])
+            if destPosition is not None and first <= destPosition <= last:
+                stops.append(destPosition)
+        return stops
@@ -1,3 +1,15 @@
+import sys
+from array import array
+
+def _cumulative(values):
+    """Returns the running totals of a list of numbers as an array of doubles."""
+    totals = array("d")
+    total = 0.0
+    for value in values:
+        total += value
+        totals.append(total)
+    return totals
+
 class Line:
     """
     Represents a Metro line - name, line code / abbreviation, starting & ending stations.
@@ -12,12 +24,58 @@ class Line:
         endStationCOde (str): Station code for the other end of the lin.
     """
 
+    # Fixed attributes (no per-instance dict), since a network may keep many lines and versions in memory
+    __slots__ = ("displayName", "lineCode", "startStationCode", "endStationCode", "mph", "stations",
+                 "segmentMiles", "segmentMinutes", "positions", "cumulativeMiles", "cumulativeMinutes")
+
     def __init__(self, displayName, lineCode, startStationCode, endStationCode):
         self.displayName = displayName
         self.lineCode = lineCode
         self.startStationCode = startStationCode
         self.endStationCode = endStationCode
 
+    def setStations(self, stations, segmentMiles, segmentMinutes=None):
+        """
+        Stores the ordered station list for the line and precomputes lookups over it.
+
+        positions maps each station code on the line to its index in the list, and cumulativeMiles[i]
+        is the track distance from the start of the line to station i, so the distance between any
+        two stations on the line is a single subtraction. cumulativeMinutes does the same for travel time.
+
+        Station codes are stored as a tuple of interned strings, and distances and times as arrays of doubles.
+
+        Args:
+            stations (list): Station codes (str) in order along the line.
+            segmentMiles (list): Distance (float, miles) from each station to the previous one; the first entry is 0.
+            segmentMinutes (list): Travel time (float, minutes) from each station to the previous one; the first
+                entry is 0. If None, times are estimated from the line's average speed ("mph").
+        """
+        if segmentMinutes is None:
+            segmentMinutes = [miles * 60 / self.mph for miles in segmentMiles]
+
+        self.stations = tuple(sys.intern(code) for code in stations)
+        self.segmentMiles = array("d", segmentMiles)
+        self.segmentMinutes = array("d", segmentMinutes)
+        self.positions = {code: i for i, code in enumerate(self.stations)}
+        self.cumulativeMiles = _cumulative(segmentMiles)
+        self.cumulativeMinutes = _cumulative(segmentMinutes)
+
+    def positionOf(self, station):
+        """Returns the index of a Station along this line, or None if the line does not serve it."""
+        # Only one of a station's codes (platforms) belongs to any given line
+        for code in station.codeList:
+            if code in self.positions:
+                return self.positions[code]
+        return None
+
+    def milesBetween(self, startPosition, endPosition):
+        """Returns the track distance (miles) between two station indices on this line, in either direction."""
+        return abs(self.cumulativeMiles[endPosition] - self.cumulativeMiles[startPosition])
+
+    def minutesBetween(self, startPosition, endPosition):
+        """Returns the travel time (minutes) between two station indices on this line, in either direction."""
+        return abs(self.cumulativeMinutes[endPosition] - self.cumulativeMinutes[startPosition])
+
     def __str__(self):
         return "Display Name: " + self.displayName + \
         " Line Code: " + self.lineCode + \
@@ -40,22 +98,20 @@ class Station:
         lineCode4 (str): Same as previous, may be None.
         stationTogether1: Alternate station code (for multiple platforms), may be None.
         stationTogether2: Same as previous, may be None.
-    """
 
-    def __init__(self, name, code, lineCode1, lineCode2, lineCode3, lineCode4, stationTogether1, stationTogether2):
-        self.name = name
-
-        self.lineList = [lineCode1]
-        for i in [lineCode2, lineCode3, lineCode4]:
-            if i:
-                self.lineList.append(i)
+    The name, codes and line codes are interned strings; codeList and lineList are tuples. latitude and
+    longitude (degrees) are those of the first platform listed (the WMATA station list's Lat/Lon, or GTFS stop
+    coordinates), or None if the source has none.
+    """
 
-        self.codeList = [code]
-        for i in [stationTogether1, stationTogether2]:
-            if i:
-                self.codeList.append(i)
+    __slots__ = ("name", "codeList", "lineList", "latitude", "longitude")
 
-        self.distance = None
+    def __init__(self, name, code, lineCode1, lineCode2, lineCode3, lineCode4, stationTogether1, stationTogether2):
+        self.name = sys.intern(name)
+        self.lineList = tuple(sys.intern(i) for i in [lineCode1, lineCode2, lineCode3, lineCode4] if i)
+        self.codeList = tuple(sys.intern(i) for i in [code, stationTogether1, stationTogether2] if i)
+        self.latitude = None
+        self.longitude = None
 
     def __str__(self):
         return self.name + " | " + str(self.codeList) + " | " + str(self.lineList)
@@ -65,8 +121,8 @@ class Station:
 
     def addStation(self, code):
         if code not in self.codeList:
-            self.codeList.append(code)
+            self.codeList += (sys.intern(code),)
 
     def addLine(self, line):
         if line not in self.lineList:
-            self.lineList.append(line)
+            self.lineList += (sys.intern(line),)
@@ -0,0 +1,235 @@
+"""
+Live feeds: polls WMATA's rail incidents and train positions and applies what changed to a network.
+
+Each feed is polled on its own interval through one MetroInterface, so polls share its token bucket with
+every other request. A payload identical to the previous poll's is dropped without further work; otherwise
+it is diffed against the previous one and only lines whose derived delay changed are updated on the
+network (see MetroNetwork.Network.setLineDelay), so routers and route caches see small, targeted changes.
+
+    Incidents: a line with a "Delay" incident is delayed by Constants.INCIDENT_DELAY_MINUTES.
+    Train positions: a line with a train held at one track circuit for longer than Constants.TRAIN_HOLD_SECONDS
+        is delayed by the whole minutes beyond that.
+
+A line's delay is the larger of the two. Only delays set by the poller are ever changed or cleared by it.
+
+Usage: MetroFeeds -s <network snapshot> [-k <API key>] [-b <base URL>]         (poll and print changes)
+       MetroFeeds -r <fixture directory> [-k <API key>] [-b <base URL>] [-n <polls>]   (record feeds)
+
+-b sends requests to another server, e.g. a MetroStubServer replaying recorded feeds.
+"""
+import getopt, sys, threading, time
+import MetroConstants as Constants
+import MetroMetrics
+
+INCIDENTS = "incidents"
+TRAIN_POSITIONS = "trainPositions"
+
+def diff(previous, current):
+    """
+    Compares two payloads keyed by id (e.g. incident or train id).
+
+    Returns:
+        Dictionary with "added", "removed" and "changed" (id -> item, the old item for removals), each only if non-empty.
+    """
+    changes = {}
+    added = {key: item for key, item in current.items() if key not in previous}
+    removed = {key: item for key, item in previous.items() if key not in current}
+    changed = {key: item for key, item in current.items() if key in previous and previous[key] != item}
+    for name, items in (("added", added), ("removed", removed), ("changed", changed)):
+        if items:
+            changes[name] = items
+    return changes
+
+class FeedPoller:
+    """
+    Polls the live feeds on a background thread (start() / stop()), or on demand with poll().
+
+    Args:
+        metroAPI (MetroInterface.MetroInterface): Interface the feeds are fetched through.
+        network (MetroNetwork.Network): Network to apply delays to.
+        intervals (dict): Feed name (INCIDENTS, TRAIN_POSITIONS) to seconds between polls; feeds left out use
+            the Constants defaults, and a feed mapped to None is not polled.
+    """
+
+    def __init__(self, metroAPI, network, intervals=None):
+        self.network = network
+        self.feeds = {
+            INCIDENTS: (metroAPI.getIncidents, self._incidentLines, Constants.FEED_INCIDENTS_INTERVAL),
+            TRAIN_POSITIONS: (metroAPI.getTrainPositions, self._trainLines, Constants.FEED_TRAIN_POSITIONS_INTERVAL),
+        }
+        self.intervals = {feed: interval for feed, (_, _, interval) in self.feeds.items()}
+        self.intervals.update(intervals or {})
+
+        # Last payload of each feed, and the delay (minutes) per line each feed implies
+        self.payloads = {feed: {} for feed in self.feeds}
+        self.delays = {feed: {} for feed in self.feeds}
+        # Line code -> delay the poller last set on the network
+        self.applied = {}
+
+        self.listeners = []
+        self.errors = 0
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def addListener(self, callback):
+        """
+        Registers a function called after a poll changes a feed, as callback(feed, changes) with changes as
+        returned by diff(). Called on the polling thread.
+        """
+        self.listeners.append(callback)
+
+    def poll(self, feed):
+        """
+        Fetches one feed and applies whatever changed since its previous poll.
+
+        Returns:
+            The changes (see diff()); empty if the payload was unchanged.
+        """
+        fetch, affectedLines, _ = self.feeds[feed]
+        metrics = MetroMetrics.metrics
+        with metrics.timer("feed_poll_seconds", feed=feed):
+            payload = fetch()
+        metrics.count("feed_polls_total", feed=feed)
+
+        previous = self.payloads[feed]
+        if payload == previous:
+            metrics.count("feed_unchanged_total", feed=feed)
+            return {}
+        self.payloads[feed] = payload
+
+        # Lines on either side of a change: an incident moving off a line, or a train leaving it (or service),
+        # must clear the delay it implied there too. Removals already hold the old items.
+        changes = diff(previous, payload)
+        lines = set()
+        for items in changes.values():
+            lines.update(affectedLines(items.values()))
+        lines.update(affectedLines(previous[key] for key in changes.get("changed", {})))
+        self._updateDelays(feed, lines)
+
+        for callback in self.listeners:
+            callback(feed, changes)
+        return changes
+
+    def start(self):
+        """Starts polling every feed on a daemon thread; the first polls happen immediately."""
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the polling thread (after any poll in progress)."""
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        due = {feed: time.monotonic() for feed, interval in self.intervals.items() if interval}
+        while due and not self.stopping.is_set():
+            feed = min(due, key=due.get)
+            wait = due[feed] - time.monotonic()
+            if wait > 0:
+                self.stopping.wait(wait)
+                continue
+
+            try:
+                self.poll(feed)
+            except Exception as e:
+                # A failed poll (network error, bad payload) is retried at the next interval
+                self.errors += 1
+                MetroMetrics.metrics.count("feed_errors_total", feed=feed)
+                MetroMetrics.metrics.event("feed_error", feed=feed, error=type(e).__name__ + ": " + str(e))
+            due[feed] = max(due[feed] + self.intervals[feed], time.monotonic())
+
+    @staticmethod
+    def _incidentLines(incidents):
+        """Lines affected by some incidents (see MetroInterface.getIncidents)."""
+        return [lineCode for _, _, lines in incidents for lineCode in lines]
+
+    @staticmethod
+    def _trainLines(trains):
+        """Lines of some trains (see MetroInterface.getTrainPositions)."""
+        return [train[0] for train in trains if train[0]]
+
+    def _lineDelay(self, feed, lineCode):
+        """Returns the delay (minutes) a feed's current payload implies for a line."""
+        if feed == INCIDENTS:
+            delayed = any(incidentType == Constants.INCIDENT_TYPE_DELAY and lineCode in lines
+                          for incidentType, _, lines in self.payloads[feed].values())
+            return Constants.INCIDENT_DELAY_MINUTES if delayed else 0
+
+        held = max((seconds for line, _, _, seconds, service in self.payloads[feed].values()
+                    if line == lineCode and service == Constants.TRAIN_SERVICE_NORMAL), default=0)
+        return max(0, int(held - Constants.TRAIN_HOLD_SECONDS) // 60)
+
+    def _updateDelays(self, feed, lines):
+        """Recomputes a feed's delays for some lines and pushes any line whose overall delay changed."""
+        metrics = MetroMetrics.metrics
+        for lineCode in lines:
+            if lineCode not in self.network.lineInfos:
+                continue
+            self.delays[feed][lineCode] = self._lineDelay(feed, lineCode)
+
+            delay = max(delays.get(lineCode, 0) for delays in self.delays.values())
+            if delay != self.applied.get(lineCode, 0):
+                self.network.setLineDelay(lineCode, delay)
+                self.applied[lineCode] = delay
+                metrics.count("feed_network_updates_total", feed=feed)
+                metrics.event("line_delay", feed=feed, lineCode=lineCode, minutes=delay)
+
+def recordFeeds(metroAPI, directory, polls, interval=Constants.FEED_TRAIN_POSITIONS_INTERVAL):
+    """
+    Records successive polls of both feeds as MetroStubServer fixtures (response sequences).
+
+    Args:
+        metroAPI (MetroInterface.MetroInterface): Interface the feeds are fetched through.
+        directory (str): Fixture directory.
+        polls (int): Number of polls to record.
+        interval (float): Seconds between polls.
+    """
+    from MetroStubServer import writeSequence
+    queries = [(Constants.URL_INCIDENTS, {}), (Constants.URL_TRAIN_POSITIONS, {"contentType": "json"})]
+    recorded = [[] for _ in queries]
+    for poll in range(polls):
+        if poll:
+            time.sleep(interval)
+        for responses, (url, params) in zip(recorded, queries):
+            responses.append(metroAPI._query(url, params, cached=False))
+
+    for responses, (url, params) in zip(recorded, queries):
+        writeSequence(directory, url, params, responses)
+
+def main(argv):
+    usage = ("MetroFeeds -s <network snapshot> [-k <API key>] [-b <base URL>] | "
+             "-r <fixture directory> [-k <API key>] [-b <base URL>] [-n <polls>]")
+    try:
+        opts,_ = getopt.getopt(argv, "hs:k:b:r:n:")
+    except getopt.GetoptError:
+        print(usage)
+        exit()
+
+    opts = dict(opts)
+    if "-h" in opts or ("-s" in opts) == ("-r" in opts):
+        print(usage)
+        exit()
+
+    from MetroInterface import MetroInterface
+    metroAPI = MetroInterface(opts.get("-k", "stub"), cacheDirectory=None, baseUrl=opts.get("-b"))
+
+    if "-r" in opts:
+        recordFeeds(metroAPI, opts["-r"], int(opts.get("-n", 10)))
+        return
+
+    from MetroNetwork import Network
+    poller = FeedPoller(metroAPI, Network.load(opts["-s"]))
+    poller.addListener(lambda feed, changes: print(feed + ": " + ", ".join(
+            name + " " + str(len(items)) for name, items in changes.items()) + ", delays " + str(poller.applied)))
+    poller.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        poller.stop()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
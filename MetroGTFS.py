@@ -0,0 +1,312 @@
+"""
+Builds a MetroNetwork.Network from a GTFS static feed (a directory or .zip of stops.txt, routes.txt, trips.txt
+and stop_times.txt), so the routers can run on networks other than WMATA's.
+
+The model has one ordered station list per line, so each GTFS route becomes a Line following one
+representative trip: the one with the most stops (ties go to the smallest trip id), cut short where it
+first returns to a station it already served (loops, out-and-back patterns). Branches served only by
+other trips of the route are not included.
+
+Stops are grouped into stations by parent_station. A station's codes are the stop ids of its platforms
+that the chosen trips serve, so as with WMATA a transfer between platforms counts as a platform change
+(see MetroNetwork.Network.multiPlatform). Stations are looked up by name or by any of those stop ids;
+names shared by several stations are made unique by appending the station's stop id.
+
+Segment distances come from shape_dist_traveled if its unit is given (-u, miles per unit), otherwise from
+the straight-line distance between stops, and travel times from the trip's arrival times (interpolated by
+distance between timepoints).
+
+stop_times.txt is usually by far the largest file; it is streamed twice (once to count the stops of each
+trip and pick the representative trips, once to read theirs) rather than loaded. The other files are
+streamed too, keeping only the columns needed.
+
+Large networks are built without a distance matrix (n * n doubles) unless -m is given; routing then uses
+the ALT landmark bounds for its heuristic (see MetroRouter.Router).
+
+Usage: MetroGTFS -g <GTFS directory or zip> -s <network snapshot> [-t <route types>] [-u <miles per shape unit>] [-m]
+
+Route types are comma-separated GTFS route_type values, e.g. 0,1,2 for tram, subway and rail; default all.
+"""
+import csv, getopt, io, math, os, sys, zipfile
+import MetroConstants as Constants
+import MetroMetrics
+from MetroData import Line, Station
+from MetroMatrix import DistanceMatrix
+from MetroNetwork import Network, segmentMinutes
+
+_USAGE = "MetroGTFS -g <GTFS directory or zip> -s <network snapshot> [-t <route types>] [-u <miles per shape unit>] [-m]"
+
+def haversineMiles(latitude1, longitude1, latitude2, longitude2):
+    """Returns the great-circle distance (miles) between two points given in degrees."""
+    phi1 = math.radians(latitude1)
+    phi2 = math.radians(latitude2)
+    dPhi = phi2 - phi1
+    dLambda = math.radians(longitude2 - longitude1)
+    a = math.sin(dPhi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dLambda / 2) ** 2
+    return 2 * Constants.EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+def parseTime(text):
+    """Returns the seconds past midnight of a GTFS time (HH:MM:SS, hours may exceed 23), or None if empty."""
+    text = text.strip()
+    if not text:
+        return None
+    hours, minutes, seconds = text.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+def readRows(feed, name, columns):
+    """
+    Streams one file of a GTFS feed.
+
+    Args:
+        feed (str): Feed directory or .zip file.
+        name (str): File name, e.g. Constants.GTFS_STOPS.
+        columns (list): Column names to return; columns missing from the file read as "".
+
+    Returns:
+        Generator of tuples of the requested columns, one per row.
+    """
+    if zipfile.is_zipfile(feed):
+        with zipfile.ZipFile(feed) as archive, archive.open(name) as raw:
+            yield from _csvRows(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""), columns)
+    else:
+        with open(os.path.join(feed, name), "r", encoding="utf-8-sig", newline="") as f:
+            yield from _csvRows(f, columns)
+
+def _csvRows(f, columns):
+    reader = csv.reader(f)
+    header = [column.strip() for column in next(reader)]
+    indices = [header.index(column) if column in header else None for column in columns]
+    for row in reader:
+        if row:
+            yield tuple(row[i].strip() if i is not None and i < len(row) else "" for i in indices)
+
+def readStops(feed):
+    """
+    Returns {stop id: (station id, name, latitude, longitude)} for every stop, where the station id is the stop's
+    parent_station (or its own id if it has none). Stops without coordinates take their station's. Entrances,
+    generic nodes and boarding areas are skipped.
+    """
+    stops = {}
+    for stopId, name, latitude, longitude, locationType, parent in readRows(feed, Constants.GTFS_STOPS, [
+            Constants.GTFS_STOP_ID, Constants.GTFS_STOP_NAME, Constants.GTFS_STOP_LAT, Constants.GTFS_STOP_LON,
+            Constants.GTFS_LOCATION_TYPE, Constants.GTFS_PARENT_STATION]):
+        if locationType not in ("", "0", "1"):
+            continue
+        stops[stopId] = (parent if locationType != "1" and parent else stopId, name,
+                         float(latitude) if latitude else None, float(longitude) if longitude else None)
+
+    for stopId, (stationId, name, latitude, longitude) in stops.items():
+        if latitude is None and stationId in stops:
+            stops[stopId] = (stationId, name) + stops[stationId][2:]
+    return stops
+
+def readRoutes(feed, routeTypes=None):
+    """Returns {route id: display name} for the routes of the given route types (str), or every route if None."""
+    routes = {}
+    for routeId, shortName, longName, routeType in readRows(feed, Constants.GTFS_ROUTES, [
+            Constants.GTFS_ROUTE_ID, Constants.GTFS_ROUTE_SHORT_NAME, Constants.GTFS_ROUTE_LONG_NAME,
+            Constants.GTFS_ROUTE_TYPE]):
+        if routeTypes is None or routeType in routeTypes:
+            routes[routeId] = shortName or longName or routeId
+    return routes
+
+def representativeTrips(feed, routes):
+    """
+    Picks one trip per route: the one with the most stops (first pass over stop_times.txt).
+
+    Returns:
+        Dictionary of trip id to route id.
+    """
+    tripRoutes = {}
+    for tripId, routeId in readRows(feed, Constants.GTFS_TRIPS, [Constants.GTFS_TRIP_ID, Constants.GTFS_ROUTE_ID]):
+        if routeId in routes:
+            tripRoutes[tripId] = routeId
+
+    stopCounts = dict.fromkeys(tripRoutes, 0)
+    for (tripId,) in readRows(feed, Constants.GTFS_STOP_TIMES, [Constants.GTFS_TRIP_ID]):
+        if tripId in stopCounts:
+            stopCounts[tripId] += 1
+
+    best = {}
+    for tripId, count in stopCounts.items():
+        routeId = tripRoutes[tripId]
+        if routeId not in best or (-count, tripId) < (-best[routeId][1], best[routeId][0]):
+            best[routeId] = (tripId, count)
+    return {tripId: routeId for routeId, (tripId, count) in best.items() if count > 1}
+
+def readTripStops(feed, trips):
+    """
+    Reads the stops of some trips (second pass over stop_times.txt).
+
+    Args:
+        trips (dict): Trip ids to read (keys).
+
+    Returns:
+        {trip id: [(stop id, seconds past midnight or None, shape distance or None), ...]} in stop_sequence order.
+    """
+    tripStops = {tripId: [] for tripId in trips}
+    for tripId, stopId, sequence, arrival, departure, shapeDist in readRows(feed, Constants.GTFS_STOP_TIMES, [
+            Constants.GTFS_TRIP_ID, Constants.GTFS_STOP_ID, Constants.GTFS_STOP_SEQUENCE, Constants.GTFS_ARRIVAL_TIME,
+            Constants.GTFS_DEPARTURE_TIME, Constants.GTFS_SHAPE_DIST]):
+        if tripId in tripStops:
+            seconds = parseTime(arrival)
+            if seconds is None:
+                seconds = parseTime(departure)
+            tripStops[tripId].append((int(sequence), stopId, seconds, float(shapeDist) if shapeDist else None))
+
+    for tripId, rows in tripStops.items():
+        rows.sort()
+        tripStops[tripId] = [row[1:] for row in rows]
+    return tripStops
+
+def _interpolateMinutes(seconds, cumulativeMiles):
+    """
+    Returns minutes from the first stop for every stop of a trip, filling stops without a time in proportion to
+    distance between the surrounding timepoints (or with the nearest time, before the first / after the last).
+    """
+    known = [i for i, value in enumerate(seconds) if value is not None]
+    if not known:
+        return [0.0] * len(seconds)
+
+    minutes = []
+    for i, value in enumerate(seconds):
+        if value is None:
+            before = max((k for k in known if k < i), default=None)
+            after = min((k for k in known if k > i), default=None)
+            if before is None or after is None:
+                value = seconds[after if before is None else before]
+            else:
+                span = cumulativeMiles[after] - cumulativeMiles[before]
+                fraction = (cumulativeMiles[i] - cumulativeMiles[before]) / span if span else 0.0
+                value = seconds[before] + fraction * (seconds[after] - seconds[before])
+        minutes.append((value - seconds[known[0]]) / 60.0)
+    return minutes
+
+def readFeed(feed, routeTypes=None, milesPerShapeUnit=None):
+    """
+    Reads a GTFS feed into the data model.
+
+    Args:
+        feed (str): Feed directory or .zip file.
+        routeTypes (list): GTFS route_type values (str) to import, or None for every route.
+        milesPerShapeUnit (float): Miles per unit of shape_dist_traveled, or None to use straight-line distances.
+
+    Returns:
+        (lineInfos, stationInfos) as taken by MetroNetwork.Network: line code (route id) to MetroData.Line, and
+        station name and platform stop id to MetroData.Station.
+    """
+    routes = readRoutes(feed, routeTypes)
+    stops = readStops(feed)
+    trips = representativeTrips(feed, routes)
+    tripStops = readTripStops(feed, trips)
+    metrics = MetroMetrics.metrics
+
+    lineInfos = {}
+    # Station id -> MetroData.Station (named later, once every station's name is known)
+    stations = {}
+    for tripId, routeId in sorted(trips.items(), key=lambda item: item[1]):
+        codes = []
+        served = set()
+        rows = []
+        for stopId, seconds, shapeDist in tripStops[tripId]:
+            if stopId not in stops:
+                continue
+            stationId = stops[stopId][0]
+            if stationId in served:
+                break
+            served.add(stationId)
+            codes.append(stopId)
+            rows.append((seconds, shapeDist))
+        if len(codes) < 2:
+            continue
+
+        segmentMiles = [0.0]
+        for i in range(1, len(codes)):
+            (_, previousDist), (_, dist) = rows[i-1], rows[i]
+            if milesPerShapeUnit and previousDist is not None and dist is not None:
+                segmentMiles.append(max(0.0, dist - previousDist) * milesPerShapeUnit)
+            else:
+                _, _, latitude1, longitude1 = stops[codes[i-1]]
+                _, _, latitude2, longitude2 = stops[codes[i]]
+                segmentMiles.append(haversineMiles(latitude1, longitude1, latitude2, longitude2)
+                                    if None not in (latitude1, longitude1, latitude2, longitude2) else 0.0)
+
+        cumulativeMiles = [0.0]
+        for miles in segmentMiles[1:]:
+            cumulativeMiles.append(cumulativeMiles[-1] + miles)
+        railTimes = dict(zip(codes, _interpolateMinutes([seconds for seconds, _ in rows], cumulativeMiles)))
+
+        line = Line(routes[routeId], routeId, codes[0], codes[-1])
+        minutes = segmentMinutes(codes, railTimes)
+        line.mph = 60 * cumulativeMiles[-1] / sum(minutes)
+        line.setStations(codes, segmentMiles, minutes)
+        lineInfos[routeId] = line
+        metrics.event("line", lineCode=routeId, mph=line.mph, stations=len(codes))
+
+        for stopId in codes:
+            stationId, _, latitude, longitude = stops[stopId]
+            station = stations.get(stationId)
+            if station is None:
+                station = stations[stationId] = Station(stationId, stopId, routeId, None, None, None, None, None)
+                station.latitude, station.longitude = stops[stationId][2:] if stationId in stops else (latitude, longitude)
+            station.addStation(stopId)
+            station.addLine(routeId)
+
+    # Names must identify stations, so shared ones get the station id appended
+    names = {}
+    for stationId in stations:
+        name = stops[stationId][1] if stationId in stops else stationId
+        names.setdefault(name or stationId, []).append(stationId)
+
+    stationInfos = {}
+    for name, stationIds in names.items():
+        for stationId in stationIds:
+            station = stations[stationId]
+            station.name = sys.intern(name if len(stationIds) == 1 else name + " (" + stationId + ")")
+            stationInfos[station.name] = station
+            for code in station.codeList:
+                stationInfos[code] = station
+    return lineInfos, stationInfos
+
+def importFeed(feed, routeTypes=None, milesPerShapeUnit=None, withMatrix=False):
+    """
+    Builds a Network from a GTFS feed (see readFeed()).
+
+    Args:
+        withMatrix (bool): Also build the distance matrix, which takes time and memory quadratic in the number
+            of stations; without it routing uses the ALT landmark bounds.
+
+    Returns:
+        A new MetroNetwork.Network.
+    """
+    metrics = MetroMetrics.metrics
+    with metrics.timer("phase_seconds", phase="build"):
+        with metrics.timer("phase_seconds", phase="gtfs"):
+            lineInfos, stationInfos = readFeed(feed, routeTypes, milesPerShapeUnit)
+
+        distanceMatrix = None
+        if withMatrix:
+            with metrics.timer("phase_seconds", phase="distance_matrix"):
+                distanceMatrix = DistanceMatrix.build(stationInfos, lineInfos)
+        return Network(lineInfos, stationInfos, distanceMatrix)
+
+def main(argv):
+    try:
+        opts,_ = getopt.getopt(argv, "hg:s:t:u:m")
+    except getopt.GetoptError:
+        print (_USAGE)
+        exit()
+
+    opts = dict(opts)
+    if "-h" in opts or "-g" not in opts or "-s" not in opts:
+        print (_USAGE)
+        exit()
+
+    routeTypes = opts["-t"].split(",") if "-t" in opts else None
+    milesPerShapeUnit = float(opts["-u"]) if "-u" in opts else None
+    network = importFeed(opts["-g"], routeTypes, milesPerShapeUnit, "-m" in opts)
+    network.save(opts["-s"])
+    print(str(len(network.lineInfos)) + " lines, " + str(network.size) + " stations, saved to " + opts["-s"])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
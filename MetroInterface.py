@@ -1,7 +1,9 @@
-import requests, json
+import requests, json, time
 import MetroConstants as Constants
+import MetroMetrics
 from MetroData import Line,Station
-from time import sleep
+from MetroCache import ResponseCache
+from MetroRateLimit import TokenBucket
 
 class MetroInterface:
     """
@@ -10,11 +12,69 @@ class MetroInterface:
     For more info, see the Rail Station Information API at:
     https://developer.wmata.com/docs/services/
 
+    Responses are cached on disk (see MetroCache.ResponseCache) so that repeated queries and
+    restarts reuse previously fetched data instead of hitting the API again. Requests that do go
+    out share a pooled HTTP session and a token bucket, so the interface can be used from several
+    threads at once while staying under the API's rate limit. Request counts and latencies are reported to
+    MetroMetrics per endpoint.
+
     Args:
         apiKey (str): WMATA API key.
+        cacheDirectory (str): Directory for cached responses, or None to disable caching.
+        baseUrl (str): Scheme and host to send requests to instead of the WMATA API, e.g. a local
+            stub server ("http://127.0.0.1:8000"). Cache keys are unaffected.
+        rateLimiter (MetroRateLimit.TokenBucket): Limiter shared by every request; by default
+            Constants.API_RATE_LIMIT requests / sec.
     """
-    def __init__(self, apiKey):
+    def __init__(self, apiKey, cacheDirectory=Constants.CACHE_DIRECTORY, baseUrl=None, rateLimiter=None):
         self.apiKey = apiKey
+        self.cache = None
+        if cacheDirectory:
+            self.cache = ResponseCache(cacheDirectory, Constants.CACHE_TTLS, Constants.CACHE_DEFAULT_TTL)
+
+        self.baseUrl = baseUrl
+        self.rateLimiter = rateLimiter or TokenBucket(Constants.API_RATE_LIMIT, Constants.API_BURST)
+        self.maxWorkers = Constants.API_WORKERS
+
+        # Keep-alive connections, enough for every worker thread to have its own
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.maxWorkers, pool_maxsize=self.maxWorkers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _query(self, url, params=None, cached=True):
+        """
+        Returns the parsed JSON response for an endpoint, from the cache if possible.
+
+        Args:
+            url (str): Endpoint URL (one of the MetroConstants URLs).
+            params (dict): Query parameters, not including the API key.
+            cached (bool): False for live feeds, which are neither read from nor written to the cache.
+        """
+        params = params or {}
+        metrics = MetroMetrics.metrics
+        endpoint = url.rsplit("/", 1)[-1]
+        if self.cache and cached:
+            jsonResp = self.cache.get(url, params)
+            if jsonResp is not None:
+                metrics.count("http_cache_hits_total", endpoint=endpoint)
+                return jsonResp
+
+        requestUrl = url
+        if self.baseUrl:
+            requestUrl = self.baseUrl + url[len(Constants.API_BASE_URL):]
+
+        self.rateLimiter.acquire()
+        start = time.perf_counter()
+        resp = self.session.get(requestUrl, params=dict(params, api_key=self.apiKey), timeout=Constants.API_TIMEOUT)
+        metrics.observe("http_request_seconds", time.perf_counter() - start, endpoint=endpoint)
+        metrics.count("http_requests_total", endpoint=endpoint, status=resp.status_code)
+        jsonResp = json.loads(resp.text)
+
+        # Only successful responses are cached; errors (bad key, rate limiting) are retried next time
+        if self.cache and cached and resp.status_code == 200:
+            self.cache.put(url, params, jsonResp)
+        return jsonResp
 
     def getLineInfos(self):
         """
@@ -23,7 +83,7 @@ class MetroInterface:
         Returns:
             List of MetroData.Line for each line parsed.
         """
-        jsonResp = json.loads(requests.get(Constants.URL_LINES_LIST + "?api_key=" +self.apiKey).text)
+        jsonResp = self._query(Constants.URL_LINES_LIST)
         lineInfos = {}
         for i in jsonResp[Constants.LINES_TOP]:
             displayName = i[Constants.LINES_DISPLAY_NAME]
@@ -39,8 +99,9 @@ class MetroInterface:
 
         Returns:
             A dictionary which can be indexed by station name or code (keys) and yields MetroData.Station objects (value).
+            Stations have the coordinates of their first platform listed, if the response includes them.
         """
-        jsonResp = json.loads(requests.get(Constants.URL_STATION_LIST + "?api_key=" +self.apiKey).text)
+        jsonResp = self._query(Constants.URL_STATION_LIST)
         stationInfos = {}
         for i in jsonResp[Constants.STATION_LIST_TOP]:
             name = i[Constants.STATION_LIST_NAME]
@@ -54,6 +115,8 @@ class MetroInterface:
 
             if name not in stationInfos:
                 station = Station(name, code, lc1, lc2, lc3, lc4, st1, st2)
+                station.latitude = i.get(Constants.STATION_LIST_LAT)
+                station.longitude = i.get(Constants.STATION_LIST_LON)
                 # Want the station information to be indexed by name or station code
                 stationInfos[name] = station
                 stationInfos[code] = station
@@ -90,17 +153,18 @@ class MetroInterface:
         Returns:
             Approximate speed in MPH (float)
         """
-        jsonResp = json.loads(requests.get(Constants.URL_STATION_STATION_INFO+ "?FromStationCode=" + startCode + "&ToStationCode=" + endCode + "&api_key=" +self.apiKey).text)
+        jsonResp = self._query(Constants.URL_STATION_STATION_INFO, {"FromStationCode": startCode, "ToStationCode": endCode})
        
         info = jsonResp[Constants.STATION_STATION_TOP][0]
         totalMiles = info[Constants.STATION_STATION_MILES]
-        time = info[Constants.STATION_STATION_TIME]
-        return totalMiles * 60 / time
+        minutes = info[Constants.STATION_STATION_TIME]
+        return totalMiles * 60 / minutes
 
 
-    def getOrderedStationList(self, lineCode, startCode, endCode):
+    def getLinePath(self, lineCode, startCode, endCode):
         """
-        Determines the stations, in order, for a given line.
+        Determines the stations, in order, for a given line and the track distance between consecutive ones,
+        from a single Path API request.
 
         Args:
             lineCode (str): Two-letter abbreviation for a line.
@@ -108,15 +172,68 @@ class MetroInterface:
             endCode (str): End station code of the line.
 
         Returns:
-            List of station codes (str) sorted in order of sequence along the line.
+            (stations, segmentMiles): list of station codes (str) sorted in order of sequence along the line,
+            and list of distances (float, in miles) from each station to the previous one. The first
+            distance is always 0.
         """
-        jsonResp = json.loads(requests.get(Constants.URL_STATION_PATH + "?FromStationCode=" + startCode + "&ToStationCode=" + endCode + "&api_key=" +self.apiKey).text)
+        jsonResp = self._query(Constants.URL_STATION_PATH, {"FromStationCode": startCode, "ToStationCode": endCode})
 
         orderedStations = []
+        segmentMiles = []
         for i in jsonResp[Constants.STATION_PATH_TOP]:
             orderedStations.append(i[Constants.STATION_PATH_CODE])
+            segmentMiles.append(i[Constants.STATION_PATH_DIST_PREV] / Constants.FEET_PER_MILE)
+        if segmentMiles:
+            segmentMiles[0] = 0.0
+
+        return orderedStations, segmentMiles
+
+
+    def getOrderedStationList(self, lineCode, startCode, endCode):
+        """
+        Determines the stations, in order, for a given line.
+
+        Args:
+            lineCode (str): Two-letter abbreviation for a line.
+            startCode (str): Start station code of the line.
+            endCode (str): End station code of the line.
+
+        Returns:
+            List of station codes (str) sorted in order of sequence along the line.
+        """
+        return self.getLinePath(lineCode, startCode, endCode)[0]
 
-        return orderedStations
+
+    def getLineSegmentMiles(self, lineCode, startCode, endCode):
+        """
+        Determines the track distance between consecutive stations on a given line.
+
+        Makes the same Path API request as getOrderedStationList; to get both, call getLinePath once instead.
+
+        Returns:
+            List of distances (float, in miles) from each station to the previous one on the line, in
+            the same order as getOrderedStationList. The first entry is always 0.
+        """
+        return self.getLinePath(lineCode, startCode, endCode)[1]
+
+
+    def getRailTimesFrom(self, startCode):
+        """
+        Queries the approximate travel time from a station to every other station.
+
+        Args:
+            startCode (str): Source station code.
+
+        Returns:
+            A dictionary of station codes to travel times (in minutes). The source station maps to 0.
+        """
+        jsonResp = self._query(Constants.URL_STATION_STATION_INFO, {"FromStationCode": startCode})
+        railTimes = {}
+
+        for i in jsonResp[Constants.STATION_STATION_TOP]:
+            railTimes[i[Constants.STATION_STATION_DEST]] = i[Constants.STATION_STATION_TIME]
+        railTimes[startCode] = 0
+        return railTimes
 
 
     def getDistancesToGoal(self, destCode):
@@ -129,7 +246,7 @@ class MetroInterface:
         Returns:
             A dictionary of station codes to approximate distances (in miles).
         """
-        jsonResp = json.loads(requests.get(Constants.URL_STATION_STATION_INFO + "?ToStationCode=" + destCode + "&api_key=" +self.apiKey).text)
+        jsonResp = self._query(Constants.URL_STATION_STATION_INFO, {"ToStationCode": destCode})
         stationDists = {}
 
         for i in jsonResp[Constants.STATION_STATION_TOP]:
@@ -138,3 +255,35 @@ class MetroInterface:
         stationDists[destCode] = 0
         return stationDists
 
+
+    def getIncidents(self):
+        """
+        Queries the Incidents API for current rail incidents (live, never cached).
+
+        Returns:
+            Dictionary of incident id to (incident type, description, tuple of affected line codes).
+        """
+        jsonResp = self._query(Constants.URL_INCIDENTS, cached=False)
+        incidents = {}
+
+        for i in jsonResp[Constants.INCIDENTS_TOP]:
+            lines = tuple(code.strip() for code in (i[Constants.INCIDENT_LINES] or "").split(";") if code.strip())
+            incidents[i[Constants.INCIDENT_ID]] = (i[Constants.INCIDENT_TYPE], i[Constants.INCIDENT_DESCRIPTION], lines)
+        return incidents
+
+
+    def getTrainPositions(self):
+        """
+        Queries the Train Positions API for every train on the system (live, never cached).
+
+        Returns:
+            Dictionary of train id to (line code, track circuit id, destination station code, seconds at the
+            current circuit, service type). Line and destination may be None, e.g. for trains out of service.
+        """
+        jsonResp = self._query(Constants.URL_TRAIN_POSITIONS, {"contentType": "json"}, cached=False)
+        trains = {}
+
+        for i in jsonResp[Constants.TRAIN_POSITIONS_TOP]:
+            trains[i[Constants.TRAIN_ID]] = (i[Constants.TRAIN_LINE], i[Constants.TRAIN_CIRCUIT],
+                    i[Constants.TRAIN_DESTINATION], i[Constants.TRAIN_SECONDS_AT_LOCATION], i[Constants.TRAIN_SERVICE_TYPE])
+        return trains
@@ -0,0 +1,177 @@
+import heapq
+from array import array
+from operator import sub
+import MetroConstants as Constants
+
+class Landmarks:
+    """
+    Landmark tables for the ALT (A*, landmarks, triangle inequality) heuristic.
+
+    Holds the exact network distance (miles) and travel time (minutes) from each of a few landmark stations
+    to every station. For any station v and destination t, and any landmark L, the triangle inequality gives
+    cost(v, t) >= |cost(L, t) - cost(L, v)|; the largest of these over all landmarks is an admissible h(n)
+    for any destination, with no per-destination data or API access. Transfer penalties and delays only add
+    to the real cost, so the bound holds with those too.
+
+    The tables are station-major, so one station's costs from every landmark are adjacent, and a bound is
+    computed only for the stations a search asks about (see lowerBounds()).
+
+    Args:
+        landmarkIds (list): Station ids (int) of the landmarks.
+        miles (array.array): n * len(landmarkIds) doubles; miles[v * len(landmarkIds) + i] = distance from
+            landmark i to station v.
+        minutes (array.array): Same layout as miles, for travel time.
+    """
+
+    def __init__(self, landmarkIds, miles, minutes):
+        assert len(miles) == len(minutes) and len(miles) % max(len(landmarkIds), 1) == 0
+        self.landmarkIds = landmarkIds
+        self.miles = miles
+        self.minutes = minutes
+        self.size = len(miles) // len(landmarkIds) if landmarkIds else 0
+
+    def lowerBounds(self, destId, timeBased=False, milesPerMinute=None):
+        """
+        Returns the ALT lower bound on the cost from every station to one destination.
+
+        Args:
+            destId (int): Destination station id.
+            timeBased (bool): Bound travel time (minutes) instead of distance (miles).
+            milesPerMinute (float): For time, also bound it by the distance bound covered at this speed (the
+                network's fastest), keeping the larger of the two bounds.
+
+        Returns:
+            LowerBounds, indexed by station id like an array; each station's bound is computed on first use.
+        """
+        return LowerBounds(self, destId, timeBased, milesPerMinute)
+
+    @staticmethod
+    def defaultLandmarks(network):
+        """Returns the station ids of every line terminus (Line.startStationCode / endStationCode), without duplicates."""
+        landmarkIds = []
+        for line in network.lineInfos.values():
+            for code in (line.startStationCode, line.endStationCode):
+                stationId = network.stationId(code)
+                if stationId not in landmarkIds:
+                    landmarkIds.append(stationId)
+        return landmarkIds
+
+    @classmethod
+    def build(cls, network, landmarkIds=None):
+        """
+        Computes the landmark tables by running Dijkstra's algorithm from each landmark over the track segments.
+
+        Args:
+            network (MetroNetwork.Network): Network to compute distances on (disruptions are ignored).
+            landmarkIds (list): Station ids to use as landmarks; defaults to every line terminus, or if there are
+                more than Constants.MAX_LANDMARKS termini, that many of them spread out by spreadLandmarks().
+
+        Returns:
+            A new Landmarks.
+        """
+        n = network.size
+
+        # Adjacency lists of (neighbor id, miles, minutes) for every track segment
+        neighbors = [[] for _ in range(n)]
+        for lineCode, line in network.lineInfos.items():
+            ids = network.lineStationIds[lineCode]
+            for i in range(1, len(ids)):
+                neighbors[ids[i-1]].append((ids[i], line.segmentMiles[i], line.segmentMinutes[i]))
+                neighbors[ids[i]].append((ids[i-1], line.segmentMiles[i], line.segmentMinutes[i]))
+
+        if landmarkIds is None:
+            landmarkIds = cls.defaultLandmarks(network)
+            if len(landmarkIds) > Constants.MAX_LANDMARKS:
+                landmarkIds = cls.spreadLandmarks(neighbors, landmarkIds, Constants.MAX_LANDMARKS)
+
+        count = len(landmarkIds)
+        miles = array("d", [0.0]) * (n * count)
+        minutes = array("d", [0.0]) * (n * count)
+        for i, landmarkId in enumerate(landmarkIds):
+            miles[i::count] = _dijkstra(neighbors, landmarkId, 1)
+            minutes[i::count] = _dijkstra(neighbors, landmarkId, 2)
+        return cls(landmarkIds, miles, minutes)
+
+    @staticmethod
+    def spreadLandmarks(neighbors, candidateIds, count):
+        """
+        Picks landmarks far apart from each other: starting with the first candidate, repeatedly adds the
+        candidate farthest (in miles) from every landmark picked so far. A network with many lines (e.g. a
+        GTFS import) has too many termini to use them all, since each one costs a table column and a term in
+        every bound a search computes.
+
+        Args:
+            neighbors (list): Adjacency lists of (neighbor id, miles, minutes), indexed by station id.
+            candidateIds (list): Station ids to pick from.
+            count (int): Number of landmarks to pick.
+
+        Returns:
+            List of station ids.
+        """
+        landmarkIds = [candidateIds[0]]
+        nearest = _dijkstra(neighbors, candidateIds[0], 1)
+        while len(landmarkIds) < count:
+            # Unreachable candidates (another component) come first, as they are infinitely far away
+            farthest = max(candidateIds, key=lambda stationId: nearest[stationId])
+            if nearest[farthest] == 0.0:
+                break
+            landmarkIds.append(farthest)
+            for stationId, miles in enumerate(_dijkstra(neighbors, farthest, 1)):
+                if miles < nearest[stationId]:
+                    nearest[stationId] = miles
+        return landmarkIds
+
+class LowerBounds:
+    """
+    The ALT lower bounds on the cost from every station to one destination (see Landmarks.lowerBounds()).
+
+    Indexed by station id like the array of bounds, but a station's bound is only computed (and kept) the first
+    time it is asked for, so a search pays for the stations it reaches rather than every station in the network.
+    """
+
+    __slots__ = ("table", "count", "toDest", "miles", "milesToDest", "milesPerMinute", "bounds")
+
+    def __init__(self, landmarks, destId, timeBased, milesPerMinute=None):
+        count = len(landmarks.landmarkIds)
+        self.table = landmarks.minutes if timeBased else landmarks.miles
+        self.count = count
+        self.toDest = self.table[destId * count:(destId + 1) * count]
+        self.miles = None
+        if timeBased and milesPerMinute:
+            self.miles = landmarks.miles
+            self.milesToDest = landmarks.miles[destId * count:(destId + 1) * count]
+            self.milesPerMinute = milesPerMinute
+        # -1 until computed
+        self.bounds = array("d", [-1.0]) * landmarks.size
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __getitem__(self, stationId):
+        bound = self.bounds[stationId]
+        if bound < 0.0:
+            # max(|cost(L, t) - cost(L, v)|) over the landmarks L. Starting from 0 skips the NaN of a landmark
+            # that reaches neither station.
+            start = stationId * self.count
+            end = start + self.count
+            bound = max(0.0, *map(abs, map(sub, self.toDest, self.table[start:end])))
+            if self.miles is not None:
+                bound = max(bound, max(0.0, *map(abs, map(sub, self.milesToDest, self.miles[start:end])))
+                        / self.milesPerMinute)
+            self.bounds[stationId] = bound
+        return bound
+
+def _dijkstra(neighbors, source, weight):
+    """Returns the cost from source to every node, using element <weight> of each adjacency tuple as the edge cost."""
+    costs = array("d", [float("inf")]) * len(neighbors)
+    costs[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > costs[node]:
+            continue
+        for edge in neighbors[node]:
+            if cost + edge[weight] < costs[edge[0]]:
+                costs[edge[0]] = cost + edge[weight]
+                heapq.heappush(heap, (cost + edge[weight], edge[0]))
+    return costs
@@ -0,0 +1,162 @@
+"""
+Demand-driven network loading, for short-lived processes that answer a few queries.
+
+Network.build fetches every line (three rate-limited requests each) and builds the distance matrix and
+landmark tables before the first query. A LazyNetwork only fetches the line and station lists up front and
+loads a line when a search first reaches a station it serves. A query that stays on one line and never
+expands a transfer station costs two requests plus that line's three; expanding a transfer station loads
+every line serving it, so routes through the core of the network end up loading most lines.
+"""
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import MetroMetrics
+from MetroGTFS import haversineMiles
+from MetroNetwork import Network, segmentMinutes
+from MetroRouter import Router
+
+class LazyNetwork(Network):
+    """
+    Network whose lines are fetched from the API the first time they are needed.
+
+    Stations (and so station ids) are known from the start. A line's speed, ordered stations, segment
+    distances and travel times are loaded by loadLine(), which linesOf() -- the hook MetroRouter.Router's
+    search reaches a station's lines through -- calls for the lines serving a station the first time it is
+    asked about it. line() loads the line it is asked for, so disruptions to a line load it too. Loaded
+    lines are kept, and loading is thread-safe: each line is fetched once, however many searches reach it
+    at the same time.
+
+    Without the whole network there is no distance matrix and there are no landmark tables or compressed
+    rows: Router searches it with a zero heuristic, and LazyRouter with a straight-line one. complete() loads
+    the remaining lines and returns the equivalent full Network, which save() writes.
+
+    Args:
+        metroAPI (MetroInterface.MetroInterface): Interface used to query lines and stations.
+    """
+
+    def __init__(self, metroAPI):
+        self.metroAPI = metroAPI
+        with MetroMetrics.metrics.timer("phase_seconds", phase="fetch"), \
+                ThreadPoolExecutor(max_workers=2) as executor:
+            linesFuture = executor.submit(metroAPI.getLineInfos)
+            stationsFuture = executor.submit(metroAPI.getStationInfos)
+            lineInfos = linesFuture.result()
+            stationInfos = stationsFuture.result()
+        self.distanceMatrix = None
+        self.landmarks = None
+
+        # Station ids in the same order as a Network without a distance matrix (sorted by name)
+        self._indexStations(stationInfos)
+        self._indexLines(lineInfos)
+
+        # Line code -> station ids along the line, for loaded lines only; station id -> linesOf() once asked
+        self.lineStationIds = {}
+        self.stationLines = [None] * self.size
+        self.loadLock = threading.Lock()
+
+        self._initDisruptions()
+
+    def line(self, lineCode):
+        """Returns the MetroData.Line for a line code, loading it first if needed (see loadLine())."""
+        return self.loadLine(lineCode)
+
+    def loadLine(self, lineCode):
+        """Returns the MetroData.Line for a line code, fetching its data first if it isn't loaded yet."""
+        line = self.lineInfos[lineCode]
+        if lineCode in self.lineStationIds:
+            return line
+
+        with self.loadLock:
+            if lineCode in self.lineStationIds:
+                return line
+
+            metroAPI = self.metroAPI
+            metrics = MetroMetrics.metrics
+            with metrics.timer("phase_seconds", phase="line"), \
+                    ThreadPoolExecutor(max_workers=metroAPI.maxWorkers) as executor:
+                speed = executor.submit(metroAPI.getLineAvgSpeed, lineCode, line.startStationCode, line.endStationCode)
+                path = executor.submit(metroAPI.getLinePath, lineCode, line.startStationCode, line.endStationCode)
+                railTimes = executor.submit(metroAPI.getRailTimesFrom, line.startStationCode)
+
+                line.mph = speed.result()
+                stations, segmentMiles = path.result()
+                line.setStations(stations, segmentMiles, segmentMinutes(stations, railTimes.result()))
+            metrics.event("line", lineCode=lineCode, mph=line.mph, stations=len(stations))
+
+            # Published last: once the line code is here, the line is complete
+            self.lineStationIds[lineCode] = array("i", (self.stationIds[code] for code in line.stations))
+        return line
+
+    def loadedLines(self):
+        """Returns the codes of the lines loaded so far."""
+        return list(self.lineStationIds)
+
+    def linesOf(self, stationId):
+        """Returns [(line code, position along the line)] for every line serving a station, loading them as needed."""
+        lines = self.stationLines[stationId]
+        if lines is None:
+            station = self.stations[stationId]
+            lines = []
+            for lineCode in station.lineList:
+                position = self.loadLine(lineCode).positionOf(station)
+                if position is not None:
+                    lines.append((lineCode, position))
+            self.stationLines[stationId] = lines
+        return lines
+
+    def neighborsOf(self, stationId):
+        """Returns the ids of the stations adjacent to a station on any line."""
+        neighbors = set()
+        for lineCode, position in self.linesOf(stationId):
+            ids = self.lineStationIds[lineCode]
+            neighbors.update(ids[other] for other in (position - 1, position + 1) if 0 <= other < len(ids))
+        return sorted(neighbors)
+
+    def loadAll(self):
+        """Loads every line not loaded yet."""
+        for lineCode in self.lineCodes:
+            self.loadLine(lineCode)
+
+    def complete(self):
+        """
+        Loads every remaining line and returns the equivalent full Network (same station ids, with landmark
+        tables but no distance matrix). Disruptions applied here are not carried over.
+        """
+        self.loadAll()
+        stationInfos = {key: self.stations[stationId] for key, stationId in self.stationIds.items()}
+        return Network(self.lineInfos, stationInfos, None)
+
+    def save(self, path):
+        """Loads every remaining line and writes a snapshot of the full network (see complete() and Network.save)."""
+        self.complete().save(path)
+
+class LazyRouter(Router):
+    """
+    MetroRouter.Router for a LazyNetwork. The search is Router's, reaching each station's lines through
+    LazyNetwork.linesOf() so lines are loaded as the search gets to them; one-to-all sweeps (costsFrom) load
+    the lines they reach too, so a budget keeps them local.
+
+    h(n) is the straight-line distance to the destination when routing by distance and both stations have
+    coordinates (track is never shorter), and 0 otherwise -- a bound that needs no data about lines that
+    haven't been loaded.
+
+    Args:
+        network (LazyNetwork): Network to route on.
+        cacheSize (int): See Router.
+        mode (str): See Router.
+    """
+
+    engine = "lazy"
+
+    def _heuristicRow(self, destId):
+        """Returns h(n) for every station id with respect to one destination (see the class docstring)."""
+        stations = self.network.stations
+        row = array("d", [0.0]) * len(stations)
+        dest = stations[destId]
+        if self.timeBased or dest.latitude is None or dest.longitude is None:
+            return row
+
+        for stationId, station in enumerate(stations):
+            if station.latitude is not None and station.longitude is not None:
+                row[stationId] = haversineMiles(station.latitude, station.longitude, dest.latitude, dest.longitude)
+        return row
@@ -0,0 +1,181 @@
+import hashlib, heapq, json, sys
+from array import array
+import MetroConstants as Constants
+
+# Bumped whenever the on-disk layout changes; older files are rebuilt rather than misread.
+_FILE_VERSION = 3
+
+class DistanceMatrix:
+    """
+    Approximate track distance (in miles) and travel time (in minutes) between every pair of stations.
+
+    Stations are mapped to integer indices (by name, since a Station object may have several
+    codes) and the distances are kept in a single flat array of doubles, row-major, so a
+    lookup is one dictionary access per station plus one array index. Travel times are kept the
+    same way. They are the cost of the fastest route as MetroRouter.Router computes it when routing
+    by time, including Constants.TRANSFER_PENALTY_MINUTES for each change of platforms, and they start
+    with a change of trains: row i is the remaining time to station i from any station a route passes
+    through. That makes each row as tight (and consistent) a heuristic for the time-based search as a
+    row of distances is for the distance-based one.
+
+    Args:
+        names (list): Station names (str); a station's position in the list is its index.
+        distances (array.array): n * n doubles, distances[i * n + j] = miles from station i to j.
+        inputs (str): Fingerprint of the stations and segment mileage and times the matrix was built from
+            (see fingerprint()), or None if unknown.
+        minutes (array.array): n * n doubles, minutes[i * n + j] = minutes to station i from station j,
+            counting the transfer penalty for boarding at j (0 if i == j); or None.
+    """
+
+    def __init__(self, names, distances, inputs=None, minutes=None):
+        assert len(distances) == len(names) * len(names)
+        assert minutes is None or len(minutes) == len(distances)
+        self.names = names
+        self.size = len(names)
+        self.index = {name: i for i, name in enumerate(names)}
+        self.distances = distances
+        self.inputs = inputs
+        self.minutes = minutes
+
+    def indexOf(self, station):
+        """Returns the integer index of a MetroData.Station."""
+        return self.index[station.name]
+
+    def distance(self, startStation, endStation):
+        """Returns the track distance (miles) between two MetroData.Station objects."""
+        return self.distances[self.index[startStation.name] * self.size + self.index[endStation.name]]
+
+    @staticmethod
+    def fingerprint(stationInfos, lineInfos):
+        """
+        Returns a hash of everything the matrix is built from: the stations (names and codes), the transfer
+        penalty and each line's ordered stations, segment mileage and segment times. A matrix is only reused
+        for a network with the same fingerprint.
+        """
+        digest = hashlib.sha1()
+        stations = {station.name: station for station in stationInfos.values()}
+        for name in sorted(stations):
+            digest.update(json.dumps([name, sorted(stations[name].codeList)]).encode("utf-8"))
+        digest.update(json.dumps(Constants.TRANSFER_PENALTY_MINUTES).encode("utf-8"))
+        for lineCode in sorted(lineInfos):
+            line = lineInfos[lineCode]
+            digest.update(json.dumps([lineCode, list(line.stations), list(line.segmentMiles),
+                    list(line.segmentMinutes)]).encode("utf-8"))
+        return digest.hexdigest()
+
+    def matches(self, stationInfos, lineInfos):
+        """Returns True if the matrix was built from exactly these stations, segment mileage and times (see fingerprint())."""
+        names = sorted(set(station.name for station in stationInfos.values()))
+        return self.names == names and self.inputs == self.fingerprint(stationInfos, lineInfos)
+
+    @classmethod
+    def build(cls, stationInfos, lineInfos):
+        """
+        Builds the matrix from per-line segment mileage and times, running Dijkstra's algorithm from every station:
+        over the track segments for distances, and over boarding, riding and getting off trains for travel times.
+
+        Args:
+            stationInfos (dict): Station name / code to MetroData.Station, as returned by MetroInterface.getStationInfos.
+            lineInfos (dict): Line code to MetroData.Line. Each line must have its "stations" (ordered
+                station codes), "segmentMiles" and "segmentMinutes" (from the previous station) filled in.
+
+        Returns:
+            A new DistanceMatrix.
+        """
+        names = sorted(set(station.name for station in stationInfos.values()))
+        index = {name: i for i, name in enumerate(names)}
+        n = len(names)
+
+        # Adjacency lists of (neighbor index, segment miles), keeping the shortest parallel segment
+        neighbors = [{} for _ in range(n)]
+        for line in lineInfos.values():
+            for i in range(1, len(line.stations)):
+                a = index[stationInfos[line.stations[i-1]].name]
+                b = index[stationInfos[line.stations[i]].name]
+                miles = line.segmentMiles[i]
+                if miles < neighbors[a].get(b, float("inf")):
+                    neighbors[a][b] = miles
+                    neighbors[b][a] = miles
+
+        distances = array("d", [float("inf")]) * (n * n)
+        for source in range(n):
+            distances[source * n:(source + 1) * n] = _dijkstra(neighbors, source)
+
+        # Travel times: nodes 0 to n - 1 are the stations and the rest a seat on a train at each station of each
+        # line. Boarding at a station with several platforms costs the transfer penalty, including at the source,
+        # and riding on to the next station costs the segment's minutes. Column j holds the times from station j.
+        penalties = [Constants.TRANSFER_PENALTY_MINUTES if len(stationInfos[name].codeList) > 1 else 0.0
+                for name in names]
+        ridesAndStations = [{} for _ in range(n)]
+        for line in lineInfos.values():
+            first = len(ridesAndStations)
+            for i, code in enumerate(line.stations):
+                station = index[stationInfos[code].name]
+                ridesAndStations.append({station: 0.0})
+                ridesAndStations[station][first + i] = penalties[station]
+                if i > 0:
+                    ridesAndStations[first + i - 1][first + i] = line.segmentMinutes[i]
+                    ridesAndStations[first + i][first + i - 1] = line.segmentMinutes[i]
+
+        minutes = array("d", [float("inf")]) * (n * n)
+        for source in range(n):
+            times = _dijkstra(ridesAndStations, source)
+            minutes[source::n] = times[:n]
+
+        return cls(names, distances, cls.fingerprint(stationInfos, lineInfos), minutes)
+
+    def save(self, path):
+        """
+        Writes the matrix to a file: one JSON header line (station names, byte order, input fingerprint)
+        followed by the raw doubles of the distances, then of the travel times if there are any.
+        """
+        header = {"version": _FILE_VERSION, "byteorder": sys.byteorder, "names": self.names, "inputs": self.inputs,
+                  "minutes": self.minutes is not None}
+        with open(path, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            f.write(self.distances.tobytes())
+            if self.minutes is not None:
+                f.write(self.minutes.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a matrix previously written with save().
+
+        Returns:
+            A DistanceMatrix, or None if the file is missing or was written by an older version.
+        """
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline().decode("utf-8"))
+                if header.get("version") != _FILE_VERSION:
+                    return None
+                distances = array("d")
+                distances.frombytes(f.read())
+        except (OSError, ValueError):
+            return None
+
+        if header["byteorder"] != sys.byteorder:
+            distances.byteswap()
+
+        n = len(header["names"])
+        minutes = None
+        if header["minutes"]:
+            minutes = distances[n * n:]
+            del distances[n * n:]
+        return cls(header["names"], distances, header["inputs"], minutes)
+
+def _dijkstra(neighbors, source):
+    """Returns the cost from source to every node of a graph given as adjacency dictionaries (node -> edge cost)."""
+    costs = array("d", [float("inf")]) * len(neighbors)
+    costs[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > costs[node]:
+            continue
+        for neighbor, weight in neighbors[node].items():
+            if cost + weight < costs[neighbor]:
+                costs[neighbor] = cost + weight
+                heapq.heappush(heap, (cost + weight, neighbor))
+    return costs
@@ -0,0 +1,286 @@
+"""
+Metrics and tracing: counters, timers and per-query events, exported through a pluggable sink.
+
+Instrumented code reads the module-level "metrics" object at the point of use. By default it is a
+NullMetrics, whose methods do nothing and whose timer is a shared no-op, so instrumentation costs a
+lookup and a call. Setting the Constants.METRICS_ENV environment variable switches it on without any
+code change:
+
+    METROPY_METRICS=jsonl                  JSON lines on stderr
+    METROPY_METRICS=jsonl:<path>           JSON lines appended to a file
+    METROPY_METRICS=prometheus:<path>      Prometheus text exposition format, rewritten on every export
+
+"{pid}" in a path is replaced with the process id. Worker processes (MetroBatch, MetroScenario) call
+initWorker() to get metrics of their own, so use "{pid}" to give each process its own file. Aggregates
+are exported every Constants.METRICS_INTERVAL_ENV seconds (default Constants.METRICS_DEFAULT_INTERVAL)
+and at exit; JSON lines sinks also receive each event as it happens.
+
+Metric names used:
+    phase_seconds{phase}: build, fetch, gtfs, line (lazy loading), distance_matrix, landmarks, search, sweep
+        and reconstruction timers.
+    search_expanded_total, search_evaluations_total, search_pushes_total{engine, mode}: search counters.
+    search_fringe_peak{engine, mode}: largest fringe seen (timer-style: count, sum and max).
+    route_cache_hits_total{engine, mode}: queries answered from the route cache.
+    http_requests_total{endpoint, status}, http_cache_hits_total{endpoint}: API requests.
+    http_request_seconds{endpoint}: API request latency.
+    feed_polls_total, feed_unchanged_total, feed_errors_total{feed}: live feed polls (see MetroFeeds).
+    feed_poll_seconds{feed}: feed poll latency; feed_network_updates_total{feed}: line delays changed.
+"""
+import atexit, json, multiprocessing.util, os, sys, tempfile, threading, time
+import MetroConstants as Constants
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class NullMetrics:
+    """Metrics that are switched off: every method is a no-op."""
+    enabled = False
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return _NULL_TIMER
+
+    def event(self, name, **fields):
+        pass
+
+    def search(self, engine, mode, expanded, evaluations, pushes, fringePeak):
+        pass
+
+    def flush(self):
+        pass
+
+class _Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.metrics.observe(self.name, self.seconds, **self.labels)
+        return False
+
+class Metrics:
+    """
+    Collects counters and observations (timers) in memory and exports them through a sink.
+
+    Counters are summed; observations keep a count, sum and maximum. Both are keyed by name and labels.
+    Safe to use from several threads.
+
+    Args:
+        sink: Object with write(record) for events and export(snapshot) for aggregates (see JsonLinesSink).
+        interval (float): Seconds between exports on a background thread, or None to only export on flush().
+    """
+    enabled = True
+
+    def __init__(self, sink, interval=None):
+        self.sink = sink
+        self.counters = {}
+        self.observations = {}
+        self.lock = threading.Lock()
+
+        if interval:
+            thread = threading.Thread(target=self._exportEvery, args=(interval,), daemon=True)
+            thread.start()
+
+    def count(self, name, value=1, **labels):
+        """Adds value to a counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Records one observation (e.g. a duration in seconds)."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            summary = self.observations.get(key)
+            if summary is None:
+                self.observations[key] = [1, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                if value > summary[2]:
+                    summary[2] = value
+
+    def timer(self, name, **labels):
+        """Returns a context manager that observes the seconds spent inside it."""
+        return _Timer(self, name, labels)
+
+    def event(self, name, **fields):
+        """Passes one structured event (e.g. a query) straight to the sink."""
+        fields["event"] = name
+        fields["time"] = time.time()
+        self.sink.write(fields)
+
+    def search(self, engine, mode, expanded, evaluations, pushes, fringePeak):
+        """Records the counters of one search, as aggregates and as a "search" event."""
+        self.count("search_expanded_total", expanded, engine=engine, mode=mode)
+        self.count("search_evaluations_total", evaluations, engine=engine, mode=mode)
+        self.count("search_pushes_total", pushes, engine=engine, mode=mode)
+        self.observe("search_fringe_peak", fringePeak, engine=engine, mode=mode)
+        self.event("search", engine=engine, mode=mode, expanded=expanded, evaluations=evaluations,
+                   pushes=pushes, fringePeak=fringePeak)
+
+    def snapshot(self):
+        """
+        Returns the current aggregates: {"counters": [...], "observations": [...]}, each entry a dictionary with
+        "name" and "labels" plus "value" (counters) or "count", "sum" and "max" (observations).
+        """
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            observations = [{"name": name, "labels": dict(labels), "count": count, "sum": total, "max": peak}
+                            for (name, labels), (count, total, peak) in sorted(self.observations.items())]
+        return {"counters": counters, "observations": observations}
+
+    def flush(self):
+        """Exports the current aggregates to the sink."""
+        self.sink.export(self.snapshot())
+
+    def _exportEvery(self, interval):
+        while True:
+            time.sleep(interval)
+            self.flush()
+
+class JsonLinesSink:
+    """
+    Writes each event, and each export of the aggregates (as a "snapshot" event), as one JSON object per line.
+
+    Args:
+        stream: Open text file to write to.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+    def export(self, snapshot):
+        self.write(dict(snapshot, event="snapshot", time=time.time()))
+
+class PrometheusSink:
+    """
+    Writes the aggregates in the Prometheus text exposition format, e.g. for node_exporter's textfile collector.
+
+    The file is replaced atomically on each export; events are not written (they are already counted).
+
+    Args:
+        path (str): File to write.
+        prefix (str): Prepended to every metric name.
+    """
+
+    def __init__(self, path, prefix=Constants.METRICS_PREFIX):
+        self.path = path
+        self.prefix = prefix
+
+    def write(self, record):
+        pass
+
+    def export(self, snapshot):
+        lines = []
+        typed = set()
+        for counter in snapshot["counters"]:
+            name = self.prefix + counter["name"]
+            if name not in typed:
+                typed.add(name)
+                lines.append("# TYPE " + name + " counter")
+            lines.append(name + _labelText(counter["labels"]) + " " + repr(counter["value"]))
+
+        # Observations are summaries (count and sum), with their maximum as a separate gauge
+        maxima = []
+        for observation in snapshot["observations"]:
+            name = self.prefix + observation["name"]
+            labels = _labelText(observation["labels"])
+            if name not in typed:
+                typed.add(name)
+                lines.append("# TYPE " + name + " summary")
+            lines.append(name + "_count" + labels + " " + repr(observation["count"]))
+            lines.append(name + "_sum" + labels + " " + repr(observation["sum"]))
+            if name + "_max" not in typed:
+                typed.add(name + "_max")
+                maxima.append("# TYPE " + name + "_max gauge")
+            maxima.append(name + "_max" + labels + " " + repr(observation["max"]))
+        lines.extend(maxima)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmpPath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmpPath, self.path)
+
+def _labelText(labels):
+    """Returns labels formatted for the Prometheus text format, e.g. {endpoint="jLines",status="200"}."""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(key + "=\"" + value + "\"")
+    return "{" + ",".join(pairs) + "}"
+
+def fromEnvironment(environ=os.environ):
+    """
+    Returns the Metrics configured by the Constants.METRICS_ENV environment variable (see the module
+    docstring), or a NullMetrics if it is unset. Raises ValueError for an unknown sink.
+    """
+    spec = environ.get(Constants.METRICS_ENV)
+    if not spec:
+        return NullMetrics()
+
+    kind, _, path = spec.partition(":")
+    path = path.replace("{pid}", str(os.getpid()))
+    if kind == "jsonl":
+        sink = JsonLinesSink(open(path, "a") if path else sys.stderr)
+    elif kind == "prometheus" and path:
+        sink = PrometheusSink(path)
+    else:
+        raise ValueError("Unknown " + Constants.METRICS_ENV + " sink: " + spec)
+
+    interval = float(environ.get(Constants.METRICS_INTERVAL_ENV, Constants.METRICS_DEFAULT_INTERVAL))
+    return Metrics(sink, interval)
+
+def setMetrics(newMetrics):
+    """Replaces the module-level metrics (e.g. with a Metrics using a custom sink); exported at exit. Returns it."""
+    global metrics
+    metrics = newMetrics
+    atexit.register(newMetrics.flush)
+    return newMetrics
+
+def initWorker():
+    """
+    Sets up metrics in a process pool worker; call it from the pool's initializer. Returns the new metrics.
+
+    A forked worker inherits the parent's metrics, which write to the parent's file and are never exported
+    from the worker. They are replaced with new ones from the environment, so "{pid}" names the worker's own
+    file. The new metrics are exported when the worker exits, through multiprocessing's exit hooks: pool
+    workers end with os._exit, which skips atexit.
+    """
+    global metrics
+    metrics = fromEnvironment()
+    if metrics.enabled:
+        multiprocessing.util.Finalize(None, metrics.flush, exitpriority=0)
+    return metrics
+
+metrics = fromEnvironment()
+if metrics.enabled:
+    atexit.register(metrics.flush)
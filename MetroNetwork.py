@@ -0,0 +1,487 @@
+import bisect, json, mmap, struct, sys, threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import MetroConstants as Constants
+import MetroMetrics
+from MetroData import Line, Station
+from MetroLandmarks import Landmarks
+from MetroMatrix import DistanceMatrix
+
+# Snapshot file layout: magic, format version, header length, JSON header, padding to an 8-byte boundary,
+# then raw doubles: the distance matrix (if the network has one) and its travel times, the landmark miles
+# and the landmark minutes (station-major). Bump the version whenever any of that changes.
+_SNAPSHOT_MAGIC = b"METROPY\0"
+_SNAPSHOT_VERSION = 6
+_SNAPSHOT_PREFIX = struct.Struct("<8sII")
+
+def segmentMinutes(stations, railTimes):
+    """
+    Derives the travel time between consecutive stations of a line.
+
+    Args:
+        stations (list): Station codes (str) in order along the line.
+        railTimes (dict): Station code to travel time (minutes) from the first station, see MetroInterface.getRailTimesFrom.
+
+    Returns:
+        List of travel times (float, minutes) from each station to the previous one; the first entry is 0.
+        Every other entry is at least Constants.MIN_SEGMENT_MINUTES.
+    """
+    minutes = [0.0]
+    for i in range(1, len(stations)):
+        minutes.append(max(Constants.MIN_SEGMENT_MINUTES, float(railTimes[stations[i]] - railTimes[stations[i-1]])))
+    return minutes
+
+def _compressRows(rows, width):
+    """
+    Packs rows of equal-width tuples of ints into compressed sparse row form.
+
+    Returns:
+        (start, columns): start is an array of len(rows) + 1 offsets, and columns a tuple of <width> arrays
+        holding the tuples' elements, row after row; row i is entries start[i] up to start[i + 1].
+    """
+    start = array("i", [0])
+    columns = tuple(array("i") for _ in range(width))
+    for row in rows:
+        for entry in row:
+            for column, value in zip(columns, entry):
+                column.append(value)
+        start.append(len(columns[0]))
+    return start, columns
+
+class Network:
+    """
+    Prebuilt, read-only model of the Metro used by MetroRouter.Router.
+
+    Stations are identified by integer ids (the same indices as the distance matrix) and lines by
+    integer ids (their order in lineInfos). Everything a search needs is precomputed here, mostly as
+    flat arrays indexed by those ids, and never modified afterwards, so one Network can be shared
+    by any number of concurrent searches and many can be held in memory at once.
+
+    The one exception is disruption state (closed stations and line segments, line delays). Every
+    change to it increments "version" and is reported to the callbacks registered with addListener(),
+    e.g. so MetroRouteCache.RouteCache can drop routes the change affects.
+
+    Args:
+        lineInfos (dict): Line code to MetroData.Line, with setStations() applied and "mph" set.
+        stationInfos (dict): Station name / code to MetroData.Station, as returned by MetroInterface.getStationInfos.
+            Only used to build stationIds; look stations up with stationId() and stations.
+        distanceMatrix (MetroMatrix.DistanceMatrix): Distances between every pair of stations, or None for
+            networks too large for an n * n matrix (e.g. from MetroGTFS); routing then relies on the landmarks.
+        landmarks (MetroLandmarks.Landmarks): ALT landmark tables; computed from the line termini if None.
+    """
+
+    def __init__(self, lineInfos, stationInfos, distanceMatrix, landmarks=None):
+        self.distanceMatrix = distanceMatrix
+        self._indexStations(stationInfos, distanceMatrix.index if distanceMatrix else None)
+        self._indexLines(lineInfos)
+
+        # Line code -> station ids in order along the line
+        self.lineStationIds = {}
+        memberships = [[] for _ in range(self.size)]
+        neighbors = [set() for _ in range(self.size)]
+        for lineId, line in enumerate(self.lines):
+            ids = array("i", (self.stationIds[code] for code in line.stations))
+            self.lineStationIds[line.lineCode] = ids
+            for position, stationId in enumerate(ids):
+                memberships[stationId].append((lineId, position))
+                if position > 0:
+                    neighbors[stationId].add(ids[position-1])
+                    neighbors[ids[position-1]].add(stationId)
+
+        # Compressed (CSR) rows, indexed by station id: entries stationLineStart[id] up to stationLineStart[id + 1]
+        # of stationLineIds / stationLinePositions are the lines serving the station and its position along each,
+        # and likewise neighborIds lists the adjacent stations on any line (see linesOf() and neighborsOf()).
+        self.stationLineStart, (self.stationLineIds, self.stationLinePositions) = _compressRows(memberships, 2)
+        self.neighborStart, (self.neighborIds,) = _compressRows(
+                [[(neighbor,) for neighbor in sorted(adjacent)] for adjacent in neighbors], 1)
+
+        # Time-based routing: the fastest speed (miles / minute) between any two adjacent stations, which turns
+        # distances into lower bounds on travel time
+        self.maxMilesPerMinute = max((miles / minutes for line in lineInfos.values()
+                for miles, minutes in zip(line.segmentMiles[1:], line.segmentMinutes[1:])), default=float("inf"))
+
+        if landmarks is None:
+            with MetroMetrics.metrics.timer("phase_seconds", phase="landmarks"):
+                landmarks = Landmarks.build(self)
+        self.landmarks = landmarks
+
+        self._initDisruptions()
+
+    def _indexStations(self, stationInfos, index=None):
+        """
+        Sets up the station tables from MetroInterface.getStationInfos' dictionary. Station ids follow index
+        (station name -> id, e.g. the distance matrix's), or without one the stations sorted by name.
+        """
+        if index is None:
+            index = {name: i for i, name in enumerate(sorted(set(station.name for station in stationInfos.values())))}
+        self.size = len(index)
+
+        # Station id -> MetroData.Station. stationIds is the one lookup table from names and codes: every station
+        # name and code (interned, so the keys are the Stations' own strings) maps to the station id.
+        stations = [None] * self.size
+        self.stationIds = {}
+        for key, station in stationInfos.items():
+            stationId = index[station.name]
+            stations[stationId] = station
+            self.stationIds[sys.intern(key)] = stationId
+        self.stations = tuple(stations)
+
+        # Time-based routing: 1 for stations where changing lines means changing platforms (several codes)
+        self.multiPlatform = bytearray(len(station.codeList) > 1 for station in self.stations)
+
+    def _indexLines(self, lineInfos):
+        """Sets up the line tables: line id -> MetroData.Line and line code, and line code -> line id."""
+        self.lineInfos = lineInfos
+        self.lines = tuple(lineInfos.values())
+        self.lineCodes = tuple(line.lineCode for line in self.lines)
+        self.lineIds = {lineCode: lineId for lineId, lineCode in enumerate(self.lineCodes)}
+
+    def _initDisruptions(self):
+        """
+        Sets up the disruption state, patched in place by closeStation(), closeSegment(), setLineDelay() etc.
+
+        closedStations[id] is 1 for a closed station. closedEdges maps a line code to the sorted positions of
+        its closed segments, where segment i joins stations i-1 and i; the tuple is replaced rather than
+        modified so searches in progress always see a consistent one. linePenalties is the extra cost (in
+        miles, like every other cost) of boarding a delayed line.
+        """
+        self.closedStations = bytearray(self.size)
+        self.closedEdges = {}
+        self.lineDelays = {}
+        self.linePenalties = {}
+
+        # Disruption state version and change listeners
+        self.version = 0
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def line(self, lineCode):
+        """Returns the MetroData.Line for a line code, with its stations and costs. Raises KeyError for unknown lines."""
+        return self.lineInfos[lineCode]
+
+    def linesOf(self, stationId):
+        """Returns [(line code, position along the line)] for every line serving a station."""
+        lineCodes = self.lineCodes
+        return [(lineCodes[self.stationLineIds[k]], self.stationLinePositions[k])
+                for k in range(self.stationLineStart[stationId], self.stationLineStart[stationId + 1])]
+
+    def neighborsOf(self, stationId):
+        """Returns the ids of the stations adjacent to a station on any line."""
+        return self.neighborIds[self.neighborStart[stationId]:self.neighborStart[stationId + 1]]
+
+    def closeStation(self, code):
+        """
+        Closes a station: trains still pass through it, but it can't be used to board, exit or transfer.
+
+        Args:
+            code (str): Station code (or name).
+        """
+        stationId = self.stationId(code)
+        with self.lock:
+            if self.closedStations[stationId]:
+                return
+            self.closedStations[stationId] = 1
+            notify = self._changed([], [stationId], False)
+        notify()
+
+    def reopenStation(self, code):
+        """Reopens a station closed with closeStation()."""
+        stationId = self.stationId(code)
+        with self.lock:
+            if not self.closedStations[stationId]:
+                return
+            self.closedStations[stationId] = 0
+            notify = self._changed([], [stationId], True)
+        notify()
+
+    def closeSegment(self, lineCode, fromCode, toCode):
+        """
+        Closes the track of a line between two of its stations (in either order); trains on that line can't
+        run through it. Other lines sharing the track are unaffected.
+
+        Args:
+            lineCode (str): Two-letter abbreviation for the line.
+            fromCode (str): Code of the station at one end of the closed stretch.
+            toCode (str): Code of the station at the other end.
+        """
+        self._setSegment(lineCode, fromCode, toCode, True)
+
+    def reopenSegment(self, lineCode, fromCode, toCode):
+        """Reopens track closed with closeSegment(). The stretch may be all or part of a closed one."""
+        self._setSegment(lineCode, fromCode, toCode, False)
+
+    def setLineDelay(self, lineCode, minutes):
+        """
+        Sets the delay on a line. Boarding the line then costs the delay (when routing by time), or the
+        distance its trains cover in that time (when routing by distance).
+
+        Args:
+            lineCode (str): Two-letter abbreviation for the line.
+            minutes (float): Expected delay in minutes; 0 clears it.
+        """
+        line = self.line(lineCode)
+        with self.lock:
+            previous = self.lineDelays.get(lineCode, 0)
+            if minutes == previous:
+                return
+
+            if minutes:
+                self.lineDelays[lineCode] = minutes
+                self.linePenalties[lineCode] = minutes / 60 * line.mph
+            else:
+                self.lineDelays.pop(lineCode, None)
+                self.linePenalties.pop(lineCode, None)
+            notify = self._changed([(lineCode, 0, len(line.stations) - 1)], [], minutes < previous)
+        notify()
+
+    def _setSegment(self, lineCode, fromCode, toCode, closed):
+        """Closes or reopens the segments of a line between two stations."""
+        line = self.line(lineCode)
+        positions = (line.positionOf(self.stations[self.stationId(fromCode)]),
+                line.positionOf(self.stations[self.stationId(toCode)]))
+        if None in positions:
+            raise ValueError(fromCode + " and " + toCode + " must both be on the " + lineCode + " line")
+        start, end = min(positions), max(positions)
+
+        with self.lock:
+            edges = set(self.closedEdges.get(lineCode, ()))
+            before = len(edges)
+            if closed:
+                edges.update(range(start + 1, end + 1))
+            else:
+                edges.difference_update(range(start + 1, end + 1))
+            if len(edges) == before:
+                return
+
+            if edges:
+                self.closedEdges[lineCode] = tuple(sorted(edges))
+            else:
+                del self.closedEdges[lineCode]
+            notify = self._changed([(lineCode, start, end)], [], not closed)
+        notify()
+
+    def reachableRange(self, lineCode, position):
+        """
+        Returns the (first, last) positions on a line that can be reached from a position without crossing
+        a closed segment.
+        """
+        last = len(self.lineStationIds[lineCode]) - 1
+        edges = self.closedEdges.get(lineCode)
+        if not edges:
+            return 0, last
+
+        # The closest closed segments on either side of the position
+        i = bisect.bisect_right(edges, position)
+        first = edges[i-1] if i > 0 else 0
+        if i < len(edges):
+            last = edges[i] - 1
+        return first, last
+
+    def addListener(self, callback):
+        """
+        Registers a callback for disruption state changes.
+
+        The callback is called as callback(version, segments, stationIds, improved) after each change:
+            version (int): The network's new version.
+            segments (list): (line code, start position, end position) tuples for the parts of lines that changed.
+            stationIds (list): Ids of stations that changed.
+            improved (bool): True if the change can only make routes cheaper (a reopening or shorter delay),
+                False if it can only make them more expensive.
+
+        Callbacks run after the change is made and the network's lock is released, so they may change the
+        network themselves. Changes made from several threads at once can be reported out of order; compare
+        versions rather than relying on the order of the calls.
+        """
+        with self.lock:
+            self.listeners.append(callback)
+
+    def _changed(self, segments, stationIds, improved):
+        """
+        Bumps the version and returns a function that notifies the listeners of the change. Must be called
+        with self.lock held; call the returned function once the lock is released.
+        """
+        self.version += 1
+        version, listeners = self.version, list(self.listeners)
+
+        def notify():
+            for callback in listeners:
+                callback(version, segments, stationIds, improved)
+        return notify
+
+    def save(self, path):
+        """
+        Writes the network to a single binary snapshot file that load() can read back without any API access.
+
+        Args:
+            path (str): Snapshot file to write.
+        """
+        header = {
+            "byteorder": sys.byteorder,
+            "lines": [{
+                "displayName": line.displayName,
+                "lineCode": line.lineCode,
+                "startStationCode": line.startStationCode,
+                "endStationCode": line.endStationCode,
+                "mph": line.mph,
+                "stations": line.stations,
+                "segmentMiles": line.segmentMiles.tolist(),
+                "segmentMinutes": line.segmentMinutes.tolist(),
+            } for line in self.lineInfos.values()],
+            # In station id order, which is also the distance matrix order
+            "stations": [{
+                "name": station.name,
+                "codes": station.codeList,
+                "lines": station.lineList,
+                "latitude": station.latitude,
+                "longitude": station.longitude,
+            } for station in self.stations],
+            "landmarks": self.landmarks.landmarkIds,
+            "distanceMatrix": self.distanceMatrix is not None,
+            "matrixMinutes": self.distanceMatrix is not None and self.distanceMatrix.minutes is not None,
+        }
+        headerBytes = json.dumps(header).encode("utf-8")
+        padding = -(_SNAPSHOT_PREFIX.size + len(headerBytes)) % 8
+
+        with open(path, "wb") as f:
+            f.write(_SNAPSHOT_PREFIX.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, len(headerBytes)))
+            f.write(headerBytes)
+            f.write(b"\0" * padding)
+            if self.distanceMatrix:
+                f.write(self.distanceMatrix.distances.tobytes())
+                if self.distanceMatrix.minutes is not None:
+                    f.write(self.distanceMatrix.minutes.tobytes())
+            f.write(self.landmarks.miles.tobytes())
+            f.write(self.landmarks.minutes.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a network written by save().
+
+        The file is memory-mapped and the distance matrix and landmark tables are used in place, so loading
+        does not copy them and processes loading the same snapshot share their pages.
+
+        Args:
+            path (str): Snapshot file to read.
+
+        Returns:
+            A new Network.
+
+        Raises:
+            ValueError: If the file is not a snapshot or was written by a different version.
+        """
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, headerLength = _SNAPSHOT_PREFIX.unpack_from(data, 0)
+        if magic != _SNAPSHOT_MAGIC:
+            raise ValueError(path + " is not a network snapshot")
+        if version != _SNAPSHOT_VERSION:
+            raise ValueError(path + " is snapshot version " + str(version) + ", expected " + str(_SNAPSHOT_VERSION))
+
+        headerEnd = _SNAPSHOT_PREFIX.size + headerLength
+        header = json.loads(data[_SNAPSHOT_PREFIX.size:headerEnd].decode("utf-8"))
+        start = headerEnd + (-headerEnd % 8)
+
+        def doubles(count):
+            """Returns the next <count> doubles of the file, in place unless the byte order differs."""
+            nonlocal start
+            end = start + count * 8
+            if header["byteorder"] == sys.byteorder:
+                values = memoryview(data)[start:end].cast("d")
+            else:
+                values = array("d")
+                values.frombytes(data[start:end])
+                values.byteswap()
+            start = end
+            return values
+
+        n = len(header["stations"])
+        landmarkIds = header["landmarks"]
+        distances = doubles(n * n) if header["distanceMatrix"] else None
+        matrixMinutes = doubles(n * n) if header["matrixMinutes"] else None
+        landmarks = Landmarks(landmarkIds, doubles(len(landmarkIds) * n), doubles(len(landmarkIds) * n))
+
+        lineInfos = {}
+        for info in header["lines"]:
+            line = Line(info["displayName"], info["lineCode"], info["startStationCode"], info["endStationCode"])
+            line.mph = info["mph"]
+            line.setStations(info["stations"], info["segmentMiles"], info["segmentMinutes"])
+            lineInfos[line.lineCode] = line
+
+        stationInfos = {}
+        names = []
+        for info in header["stations"]:
+            codes = info["codes"]
+            lines = info["lines"]
+            station = Station(info["name"], codes[0], lines[0], None, None, None, None, None)
+            for code in codes[1:]:
+                station.addStation(code)
+            for lineCode in lines[1:]:
+                station.addLine(lineCode)
+            station.latitude = info["latitude"]
+            station.longitude = info["longitude"]
+
+            names.append(station.name)
+            stationInfos[station.name] = station
+            for code in codes:
+                stationInfos[code] = station
+
+        distanceMatrix = DistanceMatrix(names, distances, minutes=matrixMinutes) if distances is not None else None
+        return cls(lineInfos, stationInfos, distanceMatrix, landmarks)
+
+    def stationId(self, key):
+        """Returns the integer id for a station name or code. Raises KeyError for unknown stations."""
+        return self.stationIds[key]
+
+    @classmethod
+    def build(cls, metroAPI, matrixPath=Constants.DISTANCE_MATRIX_FILE):
+        """
+        Builds a Network from the WMATA API.
+
+        Args:
+            metroAPI (MetroInterface.MetroInterface): Interface used to query lines and stations.
+            matrixPath (str): File the distance matrix is loaded from, or built and saved to if
+                missing or out of date. None to always build it in memory.
+
+        Returns:
+            A new Network.
+        """
+        metrics = MetroMetrics.metrics
+        with metrics.timer("phase_seconds", phase="build"):
+            # Requests are independent (other than lines before per-line data), so they run on a thread pool
+            # and the interface's rate limiter, rather than round-trip latency, sets the pace.
+            with metrics.timer("phase_seconds", phase="fetch"), \
+                    ThreadPoolExecutor(max_workers=metroAPI.maxWorkers) as executor:
+                # Retrieve Metro lines and stations
+                linesFuture = executor.submit(metroAPI.getLineInfos)
+                stationsFuture = executor.submit(metroAPI.getStationInfos)
+                lineInfos = linesFuture.result()
+
+                # For each line, calculate the approximate speed of the trains and retrieve the ordered
+                # station list with its segment lengths (one request) and travel times from the start of the line
+                lineFutures = {}
+                for lineCode, line in lineInfos.items():
+                    lineFutures[lineCode] = (
+                        executor.submit(metroAPI.getLineAvgSpeed, lineCode, line.startStationCode, line.endStationCode),
+                        executor.submit(metroAPI.getLinePath, lineCode, line.startStationCode, line.endStationCode),
+                        executor.submit(metroAPI.getRailTimesFrom, line.startStationCode))
+
+                stationInfos = stationsFuture.result()
+
+                for lineCode, (speed, path, railTimes) in lineFutures.items():
+                    line = lineInfos[lineCode]
+                    line.mph = speed.result()
+                    stations, segmentMiles = path.result()
+                    line.setStations(stations, segmentMiles, segmentMinutes(stations, railTimes.result()))
+                    metrics.event("line", lineCode=lineCode, mph=line.mph, stations=len(stations))
+
+            # Load the station-by-station distance matrix, (re)building it if it is missing or out of date
+            with metrics.timer("phase_seconds", phase="distance_matrix"):
+                distanceMatrix = DistanceMatrix.load(matrixPath) if matrixPath else None
+                if distanceMatrix is None or not distanceMatrix.matches(stationInfos, lineInfos):
+                    distanceMatrix = DistanceMatrix.build(stationInfos, lineInfos)
+                    if matrixPath:
+                        distanceMatrix.save(matrixPath)
+
+            return cls(lineInfos, stationInfos, distanceMatrix)
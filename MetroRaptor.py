@@ -0,0 +1,208 @@
+from array import array
+import MetroConstants as Constants
+import MetroMetrics
+from MetroRouter import Router, DISTANCE, TIME
+
+# Path costs closer than this (in miles or minutes) are considered equal
+_EPSILON = 1e-9
+
+class RaptorRouter:
+    """
+    Round-based line-scanning router (in the style of RAPTOR), an alternative to MetroRouter.Router's node A*.
+
+    Round k finds the cheapest way to reach every station using exactly k rides (k - 1 transfers). Each round
+    scans the station array of every line touched by the previous round once in each direction, from the first
+    station improved in the previous round and only as far as an arrival could still beat the best one at the
+    destination, carrying the cheapest "boarded" cost along, so it never expands individual nodes. A station is
+    only marked for the next round if the round improved on the cheapest cost seen in any earlier round, so the
+    answer for the destination after the last round is the Pareto set of (transfers, cost).
+
+    Costs, closures and delays follow the same rules as MetroRouter.Router, and like it the router only reads the
+    network, keeping every round's labels local to the query.
+
+    Args:
+        network (MetroNetwork.Network): Prebuilt network to route on.
+        mode (str): MetroRouter.DISTANCE or MetroRouter.TIME.
+    """
+
+    # Name of the search algorithm, as reported to MetroMetrics
+    engine = "raptor"
+
+    def __init__(self, network, mode=DISTANCE):
+        assert mode in (DISTANCE, TIME)
+        self.network = network
+        self.mode = mode
+        self.timeBased = mode == TIME
+
+    def findParetoPaths(self, startCode, destCode, maxTransfers=8, stats=None):
+        """
+        Finds every route to the destination that is not beaten on both transfers and cost by another.
+
+        Args:
+            startCode (str): Starting station code (or name).
+            destCode (str): Destination station code (or name).
+            maxTransfers (int): Most transfers to consider.
+            stats (dict): If given, search counters are added to it, as for MetroRouter.Router.recordStats:
+                "expanded" counts station visits during line scans, "evaluations" arrival costs computed,
+                "pushes" labels set and "fringePeak" the most stations marked in one round. They are also
+                reported to MetroMetrics.
+
+        Returns:
+            List of (transfers, cost, path) tuples ordered by increasing transfers (and so decreasing cost), where
+            path is a list of MetroData.Station as returned by MetroRouter.Router.findShortestPath. Empty if the
+            destination cannot be reached.
+        """
+        startId = self.network.stationId(startCode)
+        destId = self.network.stationId(destCode)
+        with MetroMetrics.metrics.timer("phase_seconds", phase="search"):
+            return self._scan(startId, destId, maxTransfers, stats)
+
+    def _scan(self, startId, destId, maxTransfers, stats):
+        """Runs the rounds for findParetoPaths()."""
+        network = self.network
+        n = network.size
+
+        closedStations = network.closedStations
+        if closedStations[startId] or closedStations[destId]:
+            return []
+        if startId == destId:
+            return [(0, 0.0, [network.stations[startId]])]
+
+        if self.timeBased:
+            linePenalties = network.lineDelays
+            transferPenalty = Constants.TRANSFER_PENALTY_MINUTES
+        else:
+            linePenalties = network.linePenalties
+            transferPenalty = 0.0
+
+        inf = float("inf")
+        # Cheapest cost to each station over all rounds so far, used to prune labels
+        bestCost = array("d", [inf]) * n
+        bestCost[startId] = 0.0
+
+        # Per round: cost to each station with exactly that many rides, and the station boarded at to get there
+        roundCosts = [array("d", [inf]) * n]
+        roundCosts[0][startId] = 0.0
+        boardedAt = [array("i", [-1]) * n]
+        marked = [startId]
+
+        pareto = []
+        visits = 0
+        evaluations = 0
+        labels = 0
+        mostMarked = 1
+        for ride in range(1, maxTransfers + 2):
+            previous = roundCosts[-1]
+            costs = array("d", [inf]) * n
+            parents = array("i", [-1]) * n
+            improved = []
+
+            # Every line serving a station improved in the last round, with the first and last such station along
+            # it: riders can only board at those stations, so each pass starts at the first one in its direction
+            boardingRanges = {}
+            for stationId in marked:
+                for k in range(network.stationLineStart[stationId], network.stationLineStart[stationId + 1]):
+                    lineId = network.stationLineIds[k]
+                    position = network.stationLinePositions[k]
+                    bounds = boardingRanges.get(lineId)
+                    if bounds is None:
+                        boardingRanges[lineId] = [position, position]
+                    elif position < bounds[0]:
+                        bounds[0] = position
+                    elif position > bounds[1]:
+                        bounds[1] = position
+
+            for lineId, (firstBoarding, lastBoarding) in boardingRanges.items():
+                lineCode = network.lineCodes[lineId]
+                line = network.lineInfos[lineCode]
+                cumulative = line.cumulativeMinutes if self.timeBased else line.cumulativeMiles
+                ids = network.lineStationIds[lineCode]
+                closedEdges = network.closedEdges.get(lineCode, ())
+                penalty = linePenalties.get(lineCode, 0.0)
+
+                # One pass in each direction along the line
+                for positions in (range(firstBoarding, len(ids)), range(lastBoarding, -1, -1)):
+                    forward = positions.step > 0
+                    carried = inf
+                    carriedFrom = -1
+                    lastPosition = None
+                    for position in positions:
+                        stationId = ids[position]
+                        visits += 1
+                        offset = cumulative[position] if forward else -cumulative[position]
+
+                        # Closed track between the previous station and this one: the train can't get here
+                        if lastPosition is not None and (position if forward else lastPosition) in closedEdges:
+                            carried = inf
+                            carriedFrom = -1
+                        lastPosition = position
+
+                        # Past the last boarding station, arrivals only get costlier: stop once nothing further
+                        # along can beat the best route to the destination found so far
+                        bound = bestCost[destId] if bestCost[destId] < costs[destId] else costs[destId]
+                        if (position > lastBoarding if forward else position < firstBoarding) and \
+                                carried + offset >= bound - _EPSILON:
+                            break
+
+                        if closedStations[stationId]:
+                            continue
+
+                        # Get off here, if that improves on every earlier round (and could still lead to
+                        # something cheaper than the best route to the destination found so far)
+                        if carriedFrom != -1:
+                            arrival = carried + offset
+                            evaluations += 1
+                            if arrival < bestCost[stationId] - _EPSILON and arrival < costs[stationId] - _EPSILON and \
+                                    arrival < bound - _EPSILON:
+                                if costs[stationId] == inf and stationId != destId:
+                                    improved.append(stationId)
+                                costs[stationId] = arrival
+                                parents[stationId] = carriedFrom
+
+                        # Or board here, if that is cheaper than staying on from further back: the delay, plus a
+                        # platform change unless it is the first ride
+                        if previous[stationId] < inf:
+                            boarding = previous[stationId] + penalty
+                            if transferPenalty and ride > 1 and network.multiPlatform[stationId]:
+                                boarding += transferPenalty
+                            if boarding - offset < carried:
+                                carried = boarding - offset
+                                carriedFrom = stationId
+
+            marked = improved
+            labels += len(marked)
+            if len(marked) > mostMarked:
+                mostMarked = len(marked)
+            for stationId in marked:
+                bestCost[stationId] = costs[stationId]
+            if costs[destId] < inf:
+                bestCost[destId] = costs[destId]
+            roundCosts.append(costs)
+            boardedAt.append(parents)
+
+            if costs[destId] < inf:
+                pareto.append((ride - 1, costs[destId], self._reconstructPath(boardedAt, ride, destId)))
+            if not marked:
+                break
+
+        if stats is not None:
+            Router.recordStats(stats, visits, evaluations, labels, mostMarked)
+        MetroMetrics.metrics.search(self.engine, self.mode, visits, evaluations, labels, mostMarked)
+        return pareto
+
+    def findShortestPath(self, startCode, destCode, maxTransfers=8, stats=None):
+        """Returns the cheapest path (as MetroRouter.Router.findShortestPath does), or None if unreachable."""
+        pareto = self.findParetoPaths(startCode, destCode, maxTransfers, stats)
+        return pareto[-1][2] if pareto else None
+
+    def _reconstructPath(self, boardedAt, ride, destId):
+        """Follows the boarding stations back through the rounds; returns the stations in travel order."""
+        with MetroMetrics.metrics.timer("phase_seconds", phase="reconstruction"):
+            path = [self.network.stations[destId]]
+            stationId = destId
+            while ride > 0:
+                stationId = boardedAt[ride][stationId]
+                path.append(self.network.stations[stationId])
+                ride -= 1
+            path.reverse()
+        return path
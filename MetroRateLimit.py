@@ -0,0 +1,44 @@
+import threading, time
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to keep API requests under WMATA's rate limit.
+
+    Tokens refill continuously at a fixed rate up to a maximum (the burst size); each request takes one,
+    blocking until one is available. Callers on any number of threads share the same budget.
+
+    Args:
+        rate (float): Tokens added per second (the sustained request rate).
+        capacity (float): Maximum number of tokens that can accumulate (the burst size).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        """Takes tokens from the bucket, sleeping until enough have accumulated."""
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def tryAcquire(self, tokens=1):
+        """Takes tokens from the bucket if they are available right now. Returns True on success."""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
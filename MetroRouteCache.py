@@ -0,0 +1,195 @@
+import threading
+from collections import OrderedDict
+
+class RouteCache:
+    """
+    Bounded LRU cache of routes keyed by start station, destination station and disruption version.
+
+    Each entry remembers which stations it stops at and which stretches of which lines it rides. When the
+    network's disruption state changes (see MetroNetwork.Network.addListener), only the entries the
+    change can affect are evicted, and the rest carry over to the new version:
+        - A change that makes routes more expensive (a closure or delay) evicts the entries that use
+          the changed stations or ride through the changed line segments.
+        - A change that makes routes cheaper (a reopening) additionally evicts every entry computed since
+          the matching closure, since those routes may have been detouring around it.
+
+    Safe to use from several threads at once.
+
+    Args:
+        network (MetroNetwork.Network): Network the routes are computed on; the cache registers itself as a listener.
+        maxEntries (int): Maximum number of routes kept; the least recently used are evicted beyond that.
+        rideCost (function): Cost of riding a line between two positions, rideCost(line code, start, end), as
+            used by the router. Determines which line a route rode where several connect the same stops.
+    """
+
+    def __init__(self, network, maxEntries, rideCost):
+        self.network = network
+        self.maxEntries = maxEntries
+        self.rideCost = rideCost
+        self.version = network.version
+        self.lock = threading.Lock()
+
+        # (start id, destination id) -> (version, path, cost, station ids, segments), least recently used first
+        self.entries = OrderedDict()
+        # Reverse indexes for invalidation: station id -> keys, line code -> keys
+        self.byStation = {}
+        self.byLine = {}
+        # Degraded segment / station -> version it was degraded at, to find routes that may have avoided it
+        self.degradedSince = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        network.addListener(self._onChange)
+
+    def get(self, startId, destId, countMiss=True):
+        """
+        Looks up a cached route.
+
+        Args:
+            startId (int): Start station id.
+            destId (int): Destination station id.
+            countMiss (bool): False to leave a miss out of the statistics, for a lookup that a search (with
+                its own lookup) follows on a miss.
+
+        Returns:
+            (path, cost) as computed by the router, or None on a miss.
+        """
+        with self.lock:
+            entry = self.entries.get((startId, destId))
+            if entry is None:
+                if countMiss:
+                    self.misses += 1
+                return None
+            self.entries.move_to_end((startId, destId))
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, startId, destId, version, path, cost):
+        """
+        Adds a route to the cache.
+
+        Args:
+            startId (int): Start station id.
+            destId (int): Destination station id.
+            version (int): Network version the route was computed at (read before the search started). If the
+                network has changed since, the route may be stale and is not cached.
+            path (list): MetroData.Station list returned by the router, or None if unreachable.
+            cost (float): Cost of the route.
+        """
+        stationIds, segments = self.routeDependencies(path) if path else ((), ())
+        key = (startId, destId)
+
+        with self.lock:
+            if version != self.version:
+                return
+            if key in self.entries:
+                self._remove(key)
+
+            self.entries[key] = (version, path, cost, stationIds, segments)
+            for stationId in stationIds:
+                self.byStation.setdefault(stationId, set()).add(key)
+            for lineCode, _, _ in segments:
+                self.byLine.setdefault(lineCode, set()).add(key)
+
+            while len(self.entries) > self.maxEntries:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def routeDependencies(self, path):
+        """
+        Returns the station ids a route stops at and the (line code, start position, end position) segments it rides.
+        """
+        network = self.network
+        stationIds = tuple(network.stationId(station.name) for station in path)
+
+        segments = []
+        for startStation, endStation in zip(path, path[1:]):
+            # The router rides the cheapest open line shared by consecutive stops
+            best = None
+            for lineCode in set(startStation.lineList).intersection(endStation.lineList):
+                line = network.line(lineCode)
+                startPosition = line.positionOf(startStation)
+                endPosition = line.positionOf(endStation)
+                first, last = network.reachableRange(lineCode, startPosition)
+                if not first <= endPosition <= last:
+                    continue
+                cost = self.rideCost(lineCode, startPosition, endPosition)
+                if best is None or cost < best[0]:
+                    best = (cost, lineCode, min(startPosition, endPosition), max(startPosition, endPosition))
+            if best:
+                segments.append(best[1:])
+        return stationIds, tuple(segments)
+
+    def stats(self):
+        """Returns a dictionary of hit, miss, eviction (LRU) and invalidation (disruption) counts and the current size."""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self.entries),
+                "maxEntries": self.maxEntries,
+            }
+
+    def clear(self):
+        """Removes every entry (statistics are kept)."""
+        with self.lock:
+            self.entries.clear()
+            self.byStation.clear()
+            self.byLine.clear()
+
+    def _remove(self, key):
+        """Removes an entry and its reverse index references. Must be called with self.lock held."""
+        _, _, _, stationIds, segments = self.entries.pop(key)
+        for stationId in stationIds:
+            self.byStation[stationId].discard(key)
+        for lineCode, _, _ in segments:
+            self.byLine[lineCode].discard(key)
+
+    def _onChange(self, version, segments, stationIds, improved):
+        """Network listener: evicts the entries affected by a disruption change (see the class docstring)."""
+        with self.lock:
+            # Notifications of concurrent changes can arrive out of order: the cache tracks the newest version
+            self.version = max(self.version, version)
+            affected = set()
+
+            for stationId in stationIds:
+                affected.update(self.byStation.get(stationId, ()))
+            for lineCode, start, end in segments:
+                for key in self.byLine.get(lineCode, ()):
+                    # Only routes riding through the changed stretch of the line
+                    if any(code == lineCode and rideStart < end and start < rideEnd
+                            for code, rideStart, rideEnd in self.entries[key][4]):
+                        affected.add(key)
+
+            changed = [("station", stationId) for stationId in stationIds] + [("segment",) + segment for segment in segments]
+            if improved:
+                since = self._degradedSince(changed)
+                affected.update(key for key, entry in self.entries.items() if entry[0] >= since)
+            else:
+                for item in changed:
+                    self.degradedSince.setdefault(item, version)
+
+            for key in affected:
+                self._remove(key)
+            self.invalidations += len(affected)
+
+    def _degradedSince(self, changed):
+        """
+        Returns the earliest version at which any of the changed items was degraded, forgetting those items.
+
+        If there is no record (the degradation predates the cache, or a different stretch of the line was
+        closed), any route in the cache may have avoided it, so 0 is returned.
+        """
+        versions = []
+        for item in changed:
+            if item in self.degradedSince:
+                versions.append(self.degradedSince.pop(item))
+            else:
+                sameLine = [v for other, v in self.degradedSince.items() if item[0] == other[0] == "segment" and other[1] == item[1]]
+                versions += sameLine or [0]
+        return min(versions) if versions else 0
@@ -0,0 +1,352 @@
+import heapq
+from array import array
+import MetroConstants as Constants
+import MetroMetrics
+from MetroRouteCache import RouteCache
+
+# Path costs closer than this (in miles or minutes) are considered equal
+_EPSILON = 1e-9
+
+# Routing modes: minimize track distance (miles) or travel time (minutes)
+DISTANCE = "distance"
+TIME = "time"
+
+class Router:
+    """
+    Finds the best path between two stations of a MetroNetwork.Network using the A* algorithm.
+
+    The network is only ever read. Everything a search writes -- g(n), f(n), parent links, the fringe --
+    lives in arrays local to that call, indexed by station id, so one Router can serve many threads
+    at once without locking and nothing carries over from one query to the next.
+
+    Routes minimize either track distance (DISTANCE) or travel time (TIME). By time, riding between
+    stations costs the minutes between them and each transfer at a station with several platforms
+    (codes) costs Constants.TRANSFER_PENALTY_MINUTES.
+
+    Optionally, routes are memoized in a MetroRouteCache.RouteCache that is kept consistent with the
+    network's disruption state.
+
+    Searches are instrumented through MetroMetrics (counters per query, search and reconstruction timers),
+    which costs next to nothing unless metrics are switched on.
+
+    Args:
+        network (MetroNetwork.Network): Prebuilt network to route on.
+        cacheSize (int): Maximum number of routes to cache, or 0 to disable the route cache.
+        mode (str): DISTANCE or TIME.
+    """
+
+    # Name of the search algorithm, as reported to MetroMetrics
+    engine = "router"
+
+    def __init__(self, network, cacheSize=0, mode=DISTANCE):
+        assert mode in (DISTANCE, TIME)
+        self.network = network
+        self.mode = mode
+        self.timeBased = mode == TIME
+        self.routeCache = RouteCache(network, cacheSize, self.rideCost) if cacheSize else None
+
+    def heuristic(self, stationId, destId):
+        """
+        h(n): lower bound on the cost from a station to the destination (see _heuristicRow()).
+        """
+        return self._heuristicRow(destId)[stationId]
+
+    def rideCost(self, lineCode, startPosition, endPosition):
+        """Returns the cost of boarding a line at one position and riding it to another, including any delay."""
+        line = self.network.line(lineCode)
+        if self.timeBased:
+            return self.network.lineDelays.get(lineCode, 0.0) + line.minutesBetween(startPosition, endPosition)
+        return self.network.linePenalties.get(lineCode, 0.0) + line.milesBetween(startPosition, endPosition)
+
+    def costToReachStation(self, startId, endId, lineCode):
+        """
+        Calculates the cost (in distance or time) of riding a line from one station to another, the g(n) step
+        in A*. Includes the line's delay, if any (see MetroNetwork.Network.setLineDelay).
+
+        Args:
+            startId (int): Station id to board at.
+            endId (int): Station id to get off at.
+            lineCode (str): Line ridden; must serve both stations.
+        """
+        line = self.network.line(lineCode)
+        stations = self.network.stations
+        return self.rideCost(lineCode, line.positionOf(stations[startId]), line.positionOf(stations[endId]))
+
+    def findShortestPath(self, startCode, destCode, stats=None):
+        """
+        Finds the best path between two stations.
+
+        A node is expanded by "riding" each of its lines, i.e. every station on those lines is a successor.
+        The fringe is a binary heap ordered by f(n) with lazy deletion; among equal-cost paths the one with
+        fewer rides is preferred. Closed stations and segments are avoided and delayed lines cost extra to
+        board (see MetroNetwork.Network.closeStation, closeSegment, setLineDelay).
+
+        Args:
+            startCode (str): Starting station code (or name).
+            destCode (str): Destination station code (or name).
+            stats (dict): If given, search counters are added to it (see recordStats()).
+
+        Returns:
+            List of MetroData.Station: the start, every station to transfer at, and the destination.
+            None if the destination cannot be reached.
+        """
+        destId = self.network.stationId(destCode)
+        path, _ = self._route(self.network.stationId(startCode), destId, None, stats)
+        return path
+
+    def findShortestPaths(self, startCodes, destCode, stats=None):
+        """
+        Finds the best path from each of several stations to one destination.
+
+        Per-destination data (the heuristic row) is prepared once and shared by every search.
+
+        Args:
+            startCodes (list): Starting station codes (or names).
+            destCode (str): Destination station code (or name).
+            stats (dict): If given, search counters are added to it (see recordStats()).
+
+        Returns:
+            List of (start code, path, cost) tuples in the same order as startCodes. Paths are
+            as returned by findShortestPath; unreachable destinations have a path of None.
+        """
+        destId = self.network.stationId(destCode)
+        heuristicRow = self._heuristicRow(destId)
+
+        results = []
+        for startCode in startCodes:
+            path, cost = self._route(self.network.stationId(startCode), destId, heuristicRow, stats)
+            results.append((startCode, path, cost))
+        return results
+
+    def costsFrom(self, startCode, budget=None, stats=None):
+        """
+        Finds the cost from one station to every station in a single sweep (a one-to-all query, e.g. for
+        isochrones), instead of one search per destination.
+
+        This is Dijkstra's algorithm over the same successors as findShortestPath (riding each line from a
+        station reaches every station on it), with the same costs, closures, delays and transfer penalties,
+        so each station's cost equals that of the best path findShortestPath would find to it. Nothing
+        costlier than the budget is pushed, so the sweep only explores the area within it.
+
+        Args:
+            startCode (str): Starting station code (or name).
+            budget (float): Largest cost of interest (miles, or minutes when routing by time), or None for no limit.
+            stats (dict): If given, search counters are added to it (see recordStats()).
+
+        Returns:
+            array.array of doubles indexed by station id (see MetroNetwork.Network.stations): the cost from the
+            start, or inf for stations that are unreachable, closed or beyond the budget.
+        """
+        startId = self.network.stationId(startCode)
+        with MetroMetrics.metrics.timer("phase_seconds", phase="sweep"):
+            return self._sweep(startId, float("inf") if budget is None else budget, stats)
+
+    def cachedRoute(self, startId, destId):
+        """
+        Returns (path, cost) for two station ids if the route cache can answer without a search, otherwise None.
+        A miss isn't counted, since the search that follows looks the route up again.
+        """
+        if self.routeCache is None:
+            return None
+        cached = self.routeCache.get(startId, destId, countMiss=False)
+        if cached:
+            MetroMetrics.metrics.count("route_cache_hits_total", engine=self.engine, mode=self.mode)
+        return cached
+
+    def cacheStats(self):
+        """Returns the route cache statistics (see MetroRouteCache.RouteCache.stats), or None if it is disabled."""
+        return self.routeCache.stats() if self.routeCache else None
+
+    @staticmethod
+    def recordStats(stats, expanded, evaluations, pushes, fringePeak=0):
+        """
+        Adds one search's counters to a stats dictionary:
+            searches: number of searches run (route cache hits don't count).
+            expanded: nodes expanded (popped from the fringe and not stale).
+            evaluations: f(n) evaluations (candidate successors costed).
+            pushes: entries pushed onto the fringe.
+            fringePeak: largest fringe of any search.
+        """
+        stats["searches"] = stats.get("searches", 0) + 1
+        stats["expanded"] = stats.get("expanded", 0) + expanded
+        stats["evaluations"] = stats.get("evaluations", 0) + evaluations
+        stats["pushes"] = stats.get("pushes", 0) + pushes
+        stats["fringePeak"] = max(stats.get("fringePeak", 0), fringePeak)
+
+    def _searched(self, stats, expanded, evaluations, pushes, fringePeak):
+        """Reports the counters of a finished search to the stats dictionary (if any) and MetroMetrics."""
+        if stats is not None:
+            self.recordStats(stats, expanded, evaluations, pushes, fringePeak)
+        MetroMetrics.metrics.search(self.engine, self.mode, expanded, evaluations, pushes, fringePeak)
+
+    def _route(self, startId, destId, heuristicRow, stats=None):
+        """Returns (path, cost) from the route cache if possible, otherwise searches (and caches the result)."""
+        metrics = MetroMetrics.metrics
+        if heuristicRow is None:
+            heuristicRow = self._heuristicRow(destId)
+        if self.routeCache is None:
+            with metrics.timer("phase_seconds", phase="search"):
+                return self._search(startId, destId, heuristicRow, stats)
+
+        cached = self.routeCache.get(startId, destId)
+        if cached:
+            metrics.count("route_cache_hits_total", engine=self.engine, mode=self.mode)
+            return cached
+
+        # Read before searching, so a change made during the search keeps the result out of the cache
+        version = self.network.version
+        with metrics.timer("phase_seconds", phase="search"):
+            path, cost = self._search(startId, destId, heuristicRow, stats)
+        self.routeCache.put(startId, destId, version, path, cost)
+        return path, cost
+
+    def _heuristicRow(self, destId):
+        """
+        Returns h(n) for every station id with respect to one destination.
+
+        This is the destination's row of the distance matrix: track distance, or by time the travel time
+        counting transfer penalties (see MetroMatrix.DistanceMatrix). Both are exact when nothing is disrupted
+        and are sliced straight out of the matrix, so neither mode prepares more per query than the other.
+
+        Networks without a distance matrix use the ALT landmark bound instead (see MetroLandmarks.Landmarks), by
+        time raised to the track distance covered at the network's fastest speed where that is larger. It is
+        computed for each station as the search reaches it rather than for the whole network up front. Networks
+        without landmarks either (MetroLazy.LazyNetwork, which doesn't know every line) get zeros.
+        """
+        matrix = self.network.distanceMatrix
+        if matrix:
+            table = matrix.minutes if self.timeBased else matrix.distances
+            if table is not None:
+                return table[destId * matrix.size:(destId + 1) * matrix.size]
+        if self.network.landmarks is None:
+            return array("d", [0.0]) * self.network.size
+        return self.network.landmarks.lowerBounds(destId, self.timeBased, self.network.maxMilesPerMinute)
+
+    def _search(self, startId, destId, heuristicRow, stats=None):
+        """A* search between two station ids; returns (path, cost) or (None, inf). Counters go to stats, if given."""
+        costSoFar, parent = self._explore(startId, destId, heuristicRow, float("inf"), stats)
+        if costSoFar[destId] == float("inf"):
+            return None, float("inf")
+        return self._reconstructPath(parent, destId), costSoFar[destId]
+
+    def _sweep(self, startId, budget, stats=None):
+        """Dijkstra's algorithm from one station id to every station within the budget; returns the cost array."""
+        return self._explore(startId, -1, array("d", [0.0]) * self.network.size, budget, stats)[0]
+
+    def _explore(self, startId, destId, heuristicRow, budget, stats=None):
+        """
+        The search loop shared by _search() and _sweep(): A* from a station id, guided by heuristicRow, until the
+        destination is expanded, or over every station within the budget when destId is -1 (with a heuristic of
+        zeros, that is Dijkstra's algorithm). Nothing costlier than the budget is pushed.
+
+        Returns:
+            (costSoFar, parent): arrays indexed by station id of the cost from the start (inf where not reached)
+            and the previous stop on the best path (-1 for none). Costs are final for the destination and, when
+            the loop runs to the end, for every station.
+        """
+        network = self.network
+        n = network.size
+
+        # Per-query search state, indexed by station id
+        costSoFar = array("d", [float("inf")]) * n
+        rides = array("i", [0]) * n
+        parent = array("i", [-1]) * n
+        closed = bytearray(n)
+
+        closedStations = network.closedStations
+        if closedStations[startId] or (destId != -1 and closedStations[destId]):
+            return costSoFar, parent
+
+        if self.timeBased:
+            linePenalties = network.lineDelays
+            transferPenalty = Constants.TRANSFER_PENALTY_MINUTES
+        else:
+            linePenalties = network.linePenalties
+            transferPenalty = 0.0
+
+        # Heap entries are (f(n), rides, h(n), insertion count, station id). Among equal f(n), fewer rides come
+        # first, counting the one ride every station but the destination still needs; then stations nearer the
+        # destination. Without the extra ride, every station on a first ride that ties with the best route
+        # would be expanded before the destination, reached on a later ride.
+        costSoFar[startId] = 0.0
+        fringe = [(heuristicRow[startId], 0, heuristicRow[startId], 0, startId)]
+        pushes = 1
+        expanded = 0
+        evaluations = 0
+        fringePeak = 0
+
+        while fringe:
+            # The fringe only grows between pops, so its size here is the peak since the last one
+            if len(fringe) > fringePeak:
+                fringePeak = len(fringe)
+            _, _, _, _, currentId = heapq.heappop(fringe)
+
+            # Stale entry: the station was already expanded via a cheaper path
+            if closed[currentId]:
+                continue
+            closed[currentId] = 1
+            expanded += 1
+
+            if currentId == destId:
+                break
+
+            currentCost = costSoFar[currentId]
+            if transferPenalty and currentId != startId and network.multiPlatform[currentId]:
+                currentCost += transferPenalty
+
+            # The lines serving the station come from Network.linesOf, the one place a network (e.g. a
+            # MetroLazy.LazyNetwork) decides what a station connects to
+            stationRides = rides[currentId] + 1
+            for lineCode, position in network.linesOf(currentId):
+                line = network.lineInfos[lineCode]
+                cumulative = line.cumulativeMinutes if self.timeBased else line.cumulativeMiles
+                boardedAt = cumulative[position]
+                boardingCost = currentCost + linePenalties.get(lineCode, 0.0)
+                if boardingCost > budget:
+                    continue
+                lineStationIds = network.lineStationIds[lineCode]
+
+                # Expand the node. Every station on the line up to a closed segment is reachable without a transfer.
+                first, last = network.reachableRange(lineCode, position)
+                for otherPosition in self._stopsBetween(lineCode, first, last, destId):
+                    stationId = lineStationIds[otherPosition]
+                    if closed[stationId] or closedStations[stationId]:
+                        continue
+
+                    gn = boardingCost + abs(cumulative[otherPosition] - boardedAt)
+                    evaluations += 1
+                    if gn > budget:
+                        continue
+
+                    # Costs are sums of floats, so "equal" paths (e.g. riding through a station versus
+                    # getting off and back on) can differ by rounding; treat those as ties.
+                    oldGn = costSoFar[stationId]
+                    if gn < oldGn - _EPSILON or (gn < oldGn + _EPSILON and stationRides < rides[stationId]):
+                        costSoFar[stationId] = gn
+                        rides[stationId] = stationRides
+                        parent[stationId] = currentId
+                        hn = heuristicRow[stationId]
+                        heapq.heappush(fringe, (gn + hn, stationRides + (stationId != destId), hn, pushes, stationId))
+                        pushes += 1
+
+        self._searched(stats, expanded, evaluations, pushes, fringePeak)
+        return costSoFar, parent
+
+    def _stopsBetween(self, lineCode, first, last, destId):
+        """
+        Returns the positions along a line, from first to last (inclusive), that _explore() considers getting
+        off at when riding it towards destId (-1 for a sweep). Router considers every one; subclasses searching
+        a smaller graph (e.g. MetroContraction.ContractedRouter) skip some.
+        """
+        return range(first, last + 1)
+
+    def _reconstructPath(self, parent, destId):
+        """Follows parent links back from the destination; returns the stations in travel order."""
+        with MetroMetrics.metrics.timer("phase_seconds", phase="reconstruction"):
+            path = []
+            stationId = destId
+            while stationId != -1:
+                path.append(self.network.stations[stationId])
+                stationId = parent[stationId]
+            path.reverse()
+        return path
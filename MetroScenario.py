@@ -0,0 +1,384 @@
+"""
+What-if scenarios: copy-on-write versions of a network with hypothetical closures and delays, evaluated in
+parallel against the unchanged network.
+
+A Scenario shares every topology table of its base network (stations, lines, compressed rows, distance
+matrix, landmarks) by reference and only has disruption state of its own, so any router can route on it
+and deriving one costs little more than its changes. A scenario is described by its list of changes, e.g.
+
+    {"name": "Gallery Place closed", "changes": [["closeStation", "B01"]]}
+    {"name": "Red line single-tracking", "changes": [["setLineDelay", "RD", 12]]}
+
+which is all that is sent to worker processes: each worker loads the network snapshot once (memory-mapped,
+so the large tables are shared between processes) and rebuilds scenarios on top of it. The unchanged
+network's costs are computed once for the whole pool and shared the same way (see CostTable).
+
+Usage: MetroScenario -s <network snapshot> -i <scenarios .json/.jsonl> -o <output .jsonl> [-t] [-P <pairs csv>] [-p <processes>]
+
+Each scenario's result compares its costs with the base network's for every pair of stations (or the pairs
+in the pairs file): how many pairs became unreachable or more expensive, and by how much. -t compares travel
+times instead of distances.
+"""
+import getopt, json, math, mmap, os, sys, tempfile, threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import MetroMetrics
+from MetroNetwork import Network
+from MetroRouter import Router, DISTANCE, TIME
+
+# Costs closer than this (in miles or minutes) are considered unchanged
+_EPSILON = 1e-9
+
+class Scenario(Network):
+    """
+    A copy-on-write version of a network for what-if analysis.
+
+    The scenario starts from the base network's disruption state at the time it is derived and from then on
+    is independent of it: changes to either don't affect the other. Everything else is the base's own
+    tables, shared by reference and never copied. The scenario's own state is its closed-station flags (one
+    byte per station, which routers index directly) and the closed segments and delays of the lines it
+    changes.
+
+    Changes are made with the usual Network methods (closeStation(), closeSegment(), setLineDelay() etc.) and
+    recorded in "changes", so the scenario can be rebuilt elsewhere, e.g. in another process.
+
+    Args:
+        base (MetroNetwork.Network): Network (or scenario) to derive from.
+        name (str): Name to report the scenario under.
+        changes (list): Changes to apply, see apply().
+    """
+
+    # Network methods that can be recorded as changes, with the kind of each of their arguments
+    OPERATIONS = {
+        "closeStation": ("station",),
+        "reopenStation": ("station",),
+        "closeSegment": ("line", "station", "station"),
+        "reopenSegment": ("line", "station", "station"),
+        "setLineDelay": ("line", "minutes"),
+    }
+
+    def __init__(self, base, name=None, changes=()):
+        # Share the base's tables by reference, then replace the disruption state with copies of its own
+        self.__dict__.update(base.__dict__)
+        self.base = base
+        self.name = name
+        self.changes = list(getattr(base, "changes", []))
+
+        self.closedStations = bytearray(base.closedStations)
+        self.closedEdges = dict(base.closedEdges)
+        self.lineDelays = dict(base.lineDelays)
+        self.linePenalties = dict(base.linePenalties)
+
+        self.version = 0
+        self.listeners = []
+        self.lock = threading.Lock()
+
+        for change in changes:
+            self.apply(change)
+
+    def line(self, lineCode):
+        return self.base.line(lineCode)
+
+    def linesOf(self, stationId):
+        # Topology is the base's, which may load it on demand (see MetroLazy.LazyNetwork)
+        return self.base.linesOf(stationId)
+
+    def neighborsOf(self, stationId):
+        return self.base.neighborsOf(stationId)
+
+    def apply(self, change):
+        """
+        Applies one change, given as a list of an operation (one of OPERATIONS) and its arguments, e.g.
+        ["closeStation", "B01"], ["closeSegment", "RD", "A01", "B03"] or ["setLineDelay", "RD", 12].
+
+        Raises:
+            ValueError: For an unknown operation, the wrong number of arguments, or an unknown station or line
+                code, with a message naming the problem (e.g. "unknown station code ZZZ in ['closeStation', 'ZZZ']").
+        """
+        if not isinstance(change, (list, tuple)) or not change or not isinstance(change[0], str) or \
+                change[0] not in self.OPERATIONS:
+            raise ValueError("Unknown scenario change: " + str(change))
+        kinds = self.OPERATIONS[change[0]]
+        if len(change) != len(kinds) + 1:
+            raise ValueError(change[0] + " takes " + str(len(kinds)) + " argument(s) (" + ", ".join(kinds) +
+                             "), got " + str(change))
+        for kind, value in zip(kinds, change[1:]):
+            if kind == "station" and (not isinstance(value, str) or value not in self.stationIds):
+                raise ValueError("unknown station code " + str(value) + " in " + str(change))
+            if kind == "line" and (not isinstance(value, str) or value not in self.lineInfos):
+                raise ValueError("unknown line code " + str(value) + " in " + str(change))
+            if kind == "minutes" and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                      or not math.isfinite(value) or value < 0):
+                raise ValueError("delay must be a non-negative number of minutes in " + str(change))
+        getattr(self, change[0])(*change[1:])
+
+    def closeStation(self, code):
+        Network.closeStation(self, code)
+        self.changes.append(["closeStation", code])
+
+    def reopenStation(self, code):
+        Network.reopenStation(self, code)
+        self.changes.append(["reopenStation", code])
+
+    def closeSegment(self, lineCode, fromCode, toCode):
+        Network.closeSegment(self, lineCode, fromCode, toCode)
+        self.changes.append(["closeSegment", lineCode, fromCode, toCode])
+
+    def reopenSegment(self, lineCode, fromCode, toCode):
+        Network.reopenSegment(self, lineCode, fromCode, toCode)
+        self.changes.append(["reopenSegment", lineCode, fromCode, toCode])
+
+    def setLineDelay(self, lineCode, minutes):
+        Network.setLineDelay(self, lineCode, minutes)
+        self.changes.append(["setLineDelay", lineCode, minutes])
+
+def compareCosts(baseCosts, scenarioCosts, destIds):
+    """
+    Compares the costs from one station with and without a scenario's changes.
+
+    Args:
+        baseCosts, scenarioCosts (array.array): Costs to every station id, see MetroRouter.Router.costsFrom.
+        destIds (iterable): Station ids to compare.
+
+    Returns:
+        Dictionary of counts and totals: pairs, unreachable (in the base network), newlyUnreachable, worse,
+        better, totalIncrease (over pairs reachable in both) and maxIncrease.
+    """
+    inf = float("inf")
+    impact = {"pairs": 0, "unreachable": 0, "newlyUnreachable": 0, "worse": 0, "better": 0,
+              "totalIncrease": 0.0, "maxIncrease": 0.0}
+    for destId in destIds:
+        impact["pairs"] += 1
+        before, after = baseCosts[destId], scenarioCosts[destId]
+        if before == inf:
+            impact["unreachable"] += 1
+        elif after == inf:
+            impact["newlyUnreachable"] += 1
+        elif after > before + _EPSILON:
+            impact["worse"] += 1
+            impact["totalIncrease"] += after - before
+            impact["maxIncrease"] = max(impact["maxIncrease"], after - before)
+        elif after < before - _EPSILON:
+            impact["better"] += 1
+            impact["totalIncrease"] += after - before
+    return impact
+
+class CostTable:
+    """
+    The base network's costs from a set of start stations to every station, as rows of doubles in one file.
+
+    The file is written once (see evaluateScenarios) and memory-mapped by each worker process, so the rows are
+    read in place and shared between processes rather than held by each.
+
+    Args:
+        path (str): File of len(startIds) rows of <size> doubles, in the order of startIds.
+        startIds (list): Start station ids, one per row.
+        size (int): Number of stations (doubles per row).
+    """
+
+    def __init__(self, path, startIds, size):
+        self.rows = {startId: row for row, startId in enumerate(startIds)}
+        self.size = size
+        if not startIds or not size:
+            self.doubles = memoryview(array("d"))
+            return
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.doubles = memoryview(self.data).cast("d")
+
+    def __getitem__(self, startId):
+        """Returns the costs from a start station id to every station id."""
+        row = self.rows[startId] * self.size
+        return self.doubles[row:row + self.size]
+
+    @staticmethod
+    def create(path, rowCount, size):
+        """Creates (or truncates) a table file with room for rowCount rows of size doubles."""
+        with open(path, "wb") as f:
+            f.truncate(rowCount * size * 8)
+
+    @staticmethod
+    def writeRows(path, firstRow, rows):
+        """Writes consecutive rows (array.array of doubles) starting at row index firstRow."""
+        with open(path, "r+b") as f:
+            for row, costs in enumerate(rows, firstRow):
+                f.seek(row * len(costs) * 8)
+                f.write(costs.tobytes())
+
+def evaluate(base, scenario, mode=DISTANCE, pairs=None, baseCosts=None):
+    """
+    Measures a scenario's impact on routes: one MetroRouter.Router.costsFrom sweep per start station on each
+    network, rather than one search per pair.
+
+    Args:
+        base (MetroNetwork.Network): Network to compare against.
+        scenario (Scenario): Scenario derived from it.
+        mode (str): MetroRouter.DISTANCE or MetroRouter.TIME.
+        pairs (dict): Start code to destination codes to compare, or None for every pair of distinct stations.
+        baseCosts (CostTable): The base network's costs (in this mode) for every start station, or None to
+            compute them here.
+
+    Returns:
+        Dictionary with the scenario's name, changes and mode, and the totals of compareCosts() plus
+        meanIncrease (over the pairs that got worse or better).
+    """
+    baseRouter = Router(base, mode=mode)
+    scenarioRouter = Router(scenario, mode=mode)
+
+    totals = None
+    for startId, destIds in startsAndDestinations(base, pairs):
+        startCode = base.stations[startId].codeList[0]
+        startCosts = baseCosts[startId] if baseCosts is not None else baseRouter.costsFrom(startCode)
+        impact = compareCosts(startCosts, scenarioRouter.costsFrom(startCode), destIds)
+        if totals is None:
+            totals = impact
+        else:
+            for name, value in impact.items():
+                totals[name] = max(totals[name], value) if name == "maxIncrease" else totals[name] + value
+
+    totals = totals or compareCosts([], [], [])
+    changed = totals["worse"] + totals["better"]
+    totals["meanIncrease"] = round(totals["totalIncrease"] / changed, 3) if changed else 0.0
+    totals["totalIncrease"] = round(totals["totalIncrease"], 3)
+    totals["maxIncrease"] = round(totals["maxIncrease"], 3)
+    return dict({"name": scenario.name, "changes": scenario.changes, "mode": mode}, **totals)
+
+def startsAndDestinations(network, pairs, errors=None):
+    """
+    Returns a generator of (start id, destination ids) for the pairs to compare (see evaluate()). Without
+    pairs, the destinations of each start are generated as they are compared rather than listed up front.
+
+    Pairs naming an unknown station are left out, so one bad pair doesn't stop the comparison; if errors is
+    given, a result dictionary (start, destination and error, e.g. "unknown station code ZZZ") is appended to
+    it for each of them.
+    """
+    if pairs is None:
+        size = network.size
+        return ((startId, (destId for destId in range(size) if destId != startId)) for startId in range(size))
+
+    starts = {}
+    for startCode, destCodes in pairs.items():
+        for destCode in destCodes:
+            unknown = [code for code in (startCode, destCode) if code not in network.stationIds]
+            if unknown:
+                if errors is not None:
+                    errors.append({"start": startCode, "destination": destCode,
+                                   "error": "unknown station code " + unknown[0]})
+                continue
+            starts.setdefault(network.stationId(startCode), []).append(network.stationId(destCode))
+    return iter(starts.items())
+
+# Base network and its cost table for the current worker process, loaded once by _initWorker / _evaluateScenario
+_base = None
+_baseCosts = None
+
+def _initWorker(snapshotPath):
+    """Process pool initializer: loads the (memory-mapped, so shared) network snapshot once per worker."""
+    global _base
+    MetroMetrics.initWorker()
+    _base = Network.load(snapshotPath)
+
+def _sweepBase(costsPath, mode, firstRow, startIds):
+    """Worker task: writes the base network's costs from consecutive start stations to the cost table file."""
+    router = Router(_base, mode=mode)
+    CostTable.writeRows(costsPath, firstRow, [router.costsFrom(_base.stations[startId].codeList[0]) for startId in startIds])
+
+def _evaluateScenario(spec, mode, pairs, costsPath, startIds):
+    """Worker task: builds one scenario on the worker's base network and evaluates it."""
+    global _baseCosts
+    if _baseCosts is None:
+        _baseCosts = CostTable(costsPath, startIds, _base.size)
+
+    try:
+        scenario = Scenario(_base, spec.get("name"), spec.get("changes", []))
+    except (KeyError, ValueError, TypeError) as e:
+        return {"name": spec.get("name"), "changes": spec.get("changes"), "mode": mode, "error": str(e)}
+    return evaluate(_base, scenario, mode, pairs, _baseCosts)
+
+def evaluateScenarios(snapshotPath, specs, mode=DISTANCE, pairs=None, processes=None):
+    """
+    Evaluates many scenarios in parallel, each against the same base network.
+
+    The base network's costs are computed once, split across the pool, into a temporary CostTable file
+    (8 bytes per start station and station) that every worker then maps, instead of each worker computing
+    and keeping its own copy.
+
+    Args:
+        snapshotPath (str): Network snapshot (see MetroNetwork.Network.save) loaded by each worker.
+        specs (list): Scenario descriptions, dictionaries with "name" and "changes" (see Scenario.apply).
+        mode (str): MetroRouter.DISTANCE or MetroRouter.TIME.
+        pairs (dict): See evaluate().
+        processes (int): Number of worker processes; defaults to the number of CPUs.
+
+    Returns:
+        Generator of result dictionaries (see evaluate(); "error" instead of totals for an invalid
+        scenario), in no particular order. Pairs naming an unknown station come first, as one dictionary
+        each with start, destination and error (see startsAndDestinations()), and are left out of every
+        scenario's totals.
+    """
+    base = Network.load(snapshotPath)
+    pairErrors = []
+    startIds = [startId for startId, _ in startsAndDestinations(base, pairs, pairErrors)]
+    yield from pairErrors
+    chunk = max(1, -(-len(startIds) // ((processes or os.cpu_count() or 1) * 4)))
+
+    with tempfile.TemporaryDirectory() as directory, \
+            ProcessPoolExecutor(max_workers=processes, initializer=_initWorker, initargs=(snapshotPath,)) as executor:
+        costsPath = os.path.join(directory, "base.costs")
+        CostTable.create(costsPath, len(startIds), base.size)
+        sweeps = [executor.submit(_sweepBase, costsPath, mode, first, startIds[first:first + chunk])
+                  for first in range(0, len(startIds), chunk)]
+        for future in sweeps:
+            future.result()
+
+        futures = [executor.submit(_evaluateScenario, spec, mode, pairs, costsPath, startIds) for spec in specs]
+        for future in as_completed(futures):
+            yield future.result()
+
+def readScenarios(path):
+    """Reads scenario descriptions from a JSON list or a JSON lines file."""
+    with open(path, "r") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def main(argv):
+    usage = ("MetroScenario -s <network snapshot> -i <scenarios .json/.jsonl> -o <output .jsonl> [-t] "
+             "[-P <pairs csv>] [-p <processes>]")
+    try:
+        opts,_ = getopt.getopt(argv, "hs:i:o:tP:p:")
+    except getopt.GetoptError:
+        print(usage)
+        exit()
+
+    opts = dict(opts)
+    if "-h" in opts or "-s" not in opts or "-i" not in opts or "-o" not in opts:
+        print(usage)
+        exit()
+
+    pairs = None
+    if "-P" in opts:
+        from MetroBatch import readPairs
+        pairs = {}
+        for startCode, destCode in readPairs(opts["-P"]):
+            pairs.setdefault(startCode, []).append(destCode)
+
+    mode = TIME if "-t" in opts else DISTANCE
+    processes = int(opts["-p"]) if "-p" in opts else None
+    written = 0
+    errors = 0
+    with open(opts["-o"], "w") as f:
+        for result in evaluateScenarios(opts["-s"], readScenarios(opts["-i"]), mode, pairs, processes):
+            f.write(json.dumps(result) + "\n")
+            if "error" in result:
+                print(("Pair " + result["start"] + "," + result["destination"] if "start" in result
+                       else "Scenario " + str(result["name"])) + ": " + result["error"], file=sys.stderr)
+                errors += 1
+            else:
+                written += 1
+    print("Evaluated " + str(written) + " scenarios into " + opts["-o"] +
+          (" (" + str(errors) + " errors)" if errors else ""))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,372 @@
+"""
+Routing service: a long-running asyncio HTTP server answering routing queries from one warm, in-memory network.
+
+Endpoints (all responses are JSON):
+    GET  /route?from=<code>&to=<code>[&mode=distance|time]    Best route between two stations.
+    POST /batch   {"pairs": [[from, to], ...], "mode": ...}     Best routes for many pairs.
+    GET  /reach?from=<code>[&budget=<cost>][&mode=...]          Cost to every station within a budget.
+    GET  /status                                               Network, disruption and service state.
+
+Searches are CPU-bound, so they run on a worker pool and the event loop only parses requests and writes
+responses. Queries the route cache can answer are answered on the event loop without a search, and identical
+concurrent queries (same stations, mode and network version) are coalesced into one search. When
+Constants.SERVICE_MAX_PENDING searches (counting each pair of a batch) are already queued or running, new
+ones are turned away with 503 and a Retry-After header rather than queueing without bound.
+
+Usage: MetroService -s <network snapshot> | -k <API key> [-H <host>] [-p <port>] [-w <workers>]
+"""
+import asyncio, getopt, json, math, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qsl
+import MetroConstants as Constants
+import MetroMetrics
+from MetroRouter import Router, DISTANCE, TIME
+
+_USAGE = "MetroService -s <network snapshot> | -k <API key> [-H <host>] [-p <port>] [-w <workers>]"
+
+class _HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        Exception.__init__(self, message)
+        self.status = status
+        self.headers = headers or {}
+
+def routeResult(startCode, destCode, mode, path, cost):
+    """Returns the JSON-ready description of one route (path as returned by MetroRouter.Router.findShortestPath)."""
+    return {
+        "from": startCode,
+        "to": destCode,
+        "mode": mode,
+        "cost": round(cost, 3) if path else None,
+        "unit": "minutes" if mode == TIME else "miles",
+        "transfers": len(path) - 2 if path and len(path) > 1 else 0,
+        "path": [{"name": station.name, "codes": list(station.codeList)} for station in path] if path else None,
+    }
+
+class RoutingService:
+    """
+    Serves routing queries for one network over HTTP.
+
+    The network is shared by a router per mode, each with a route cache, and every search runs on a thread
+    pool. Searches hold the GIL, so threads don't add throughput on a busy service; they keep the event loop
+    responsive while searches run (and the route cache answers repeat queries without searching).
+
+    Args:
+        network (MetroNetwork.Network): Network to route on; disruptions applied to it take effect immediately.
+        workers (int): Worker threads running searches.
+        maxPending (int): Most searches queued or running at once, counting each pair of a batch. A batch
+            larger than this is only accepted when nothing else is pending.
+        cacheSize (int): Route cache size per mode (see MetroRouteCache.RouteCache), or 0 to disable it.
+    """
+
+    def __init__(self, network, workers=Constants.SERVICE_WORKERS, maxPending=Constants.SERVICE_MAX_PENDING,
+                 cacheSize=Constants.SERVICE_CACHE_SIZE):
+        self.network = network
+        self.routers = {mode: Router(network, cacheSize, mode) for mode in (DISTANCE, TIME)}
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.maxPending = maxPending
+        self.pending = 0
+        # (mode, start id, destination id, network version) -> future of the search answering it
+        self.inflight = {}
+        self.started = time.time()
+        self.counts = {"requests": 0, "searches": 0, "cached": 0, "coalesced": 0, "rejected": 0}
+
+    async def start(self, host=Constants.SERVICE_HOST, port=Constants.SERVICE_PORT):
+        """Starts listening; returns the asyncio server."""
+        return await asyncio.start_server(self._handleConnection, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    async def route(self, startCode, destCode, mode=DISTANCE):
+        """Returns the route result (see routeResult) for one pair, sharing the search with identical queries."""
+        network = self.network
+        startId, destId = self._stationId(startCode), self._stationId(destCode)
+        cached = self.routers[mode].cachedRoute(startId, destId)
+        if cached:
+            self.counts["cached"] += 1
+            return routeResult(startCode, destCode, mode, *cached)
+
+        key = (mode, startId, destId, network.version)
+        future = self.inflight.get(key)
+        if future is not None:
+            self.counts["coalesced"] += 1
+            MetroMetrics.metrics.count("service_coalesced_total")
+        else:
+            future = self._submit(1, self._search, mode, startId, destId)
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+        # Shielded, so a client going away doesn't cancel the search others are waiting on
+        path, cost = await asyncio.shield(future)
+        return routeResult(startCode, destCode, mode, path, cost)
+
+    async def batch(self, pairs, mode=DISTANCE):
+        """
+        Returns the route results for many (start, destination) pairs, in order. Pairs the route cache can't
+        answer are searched in one pooled task.
+        """
+        if not isinstance(pairs, list):
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "pairs must be a list")
+        if len(pairs) > Constants.SERVICE_MAX_BATCH:
+            raise _HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                             "At most " + str(Constants.SERVICE_MAX_BATCH) + " pairs per batch")
+
+        router = self.routers[mode]
+        routes = [None] * len(pairs)
+        uncached = []
+        for i, pair in enumerate(pairs):
+            if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+                raise _HttpError(HTTPStatus.BAD_REQUEST, "Each pair must be [from, to]")
+            routes[i] = router.cachedRoute(self._stationId(pair[0]), self._stationId(pair[1]))
+            if routes[i] is None:
+                uncached.append(i)
+        self.counts["cached"] += len(pairs) - len(uncached)
+
+        if uncached:
+            searched = await self._submit(len(uncached), self._searchBatch, mode, [pairs[i] for i in uncached])
+            for i, route in zip(uncached, searched):
+                routes[i] = route
+        return [routeResult(startCode, destCode, mode, path, cost)
+                for (startCode, destCode), (path, cost) in zip(pairs, routes)]
+
+    async def reach(self, startCode, budget=None, mode=DISTANCE):
+        """Returns the stations reachable from one station within a budget, cheapest first (see Router.costsFrom)."""
+        startId = self._stationId(startCode)
+        costs = await self._submit(1, self.routers[mode].costsFrom, self.network.stations[startId].codeList[0], budget)
+        stations = self.network.stations
+        return {
+            "from": startCode,
+            "mode": mode,
+            "budget": budget,
+            "unit": "minutes" if mode == TIME else "miles",
+            "stations": [{"name": stations[stationId].name, "codes": list(stations[stationId].codeList),
+                          "cost": round(costs[stationId], 3)}
+                         for stationId in sorted(range(len(costs)), key=costs.__getitem__) if costs[stationId] < float("inf")],
+        }
+
+    def status(self):
+        """Returns the network, disruption and service state."""
+        network = self.network
+        return {
+            "stations": network.size,
+            "lines": list(network.lineCodes),
+            "version": network.version,
+            "closedStations": [network.stations[stationId].name for stationId in range(network.size)
+                               if network.closedStations[stationId]],
+            "closedSegments": {lineCode: [[network.lineInfos[lineCode].stations[position - 1],
+                                           network.lineInfos[lineCode].stations[position]] for position in edges]
+                               for lineCode, edges in network.closedEdges.items()},
+            "lineDelays": dict(network.lineDelays),
+            "pending": self.pending,
+            "maxPending": self.maxPending,
+            "inflight": len(self.inflight),
+            "routeCache": {mode: router.cacheStats() for mode, router in self.routers.items()},
+            "uptimeSeconds": round(time.time() - self.started, 3),
+            "counts": dict(self.counts),
+        }
+
+    def _stationId(self, code):
+        if not isinstance(code, str):
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "Station codes must be strings")
+        try:
+            return self.network.stationId(code)
+        except KeyError:
+            raise _HttpError(HTTPStatus.NOT_FOUND, "Unknown station: " + str(code))
+
+    def _submit(self, searches, function, *args):
+        """
+        Runs a task of one or more searches on the worker pool, or raises 503 if that would take the pending
+        searches over the limit (a task is always accepted when nothing is pending).
+        """
+        if self.pending and self.pending + searches > self.maxPending:
+            self.counts["rejected"] += 1
+            MetroMetrics.metrics.count("service_rejected_total")
+            raise _HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many pending searches", {"Retry-After": "1"})
+
+        self.pending += searches
+        self.counts["searches"] += searches
+        future = asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        future.add_done_callback(lambda _: self._release(searches))
+        return future
+
+    def _release(self, searches):
+        self.pending -= searches
+
+    def _search(self, mode, startId, destId):
+        """Worker task: returns (path, cost) for one pair."""
+        stations = self.network.stations
+        _, path, cost = self.routers[mode].findShortestPaths([stations[startId].codeList[0]], stations[destId].codeList[0])[0]
+        return path, cost
+
+    def _searchBatch(self, mode, pairs):
+        """Worker task: returns [(path, cost)] for each pair, routing all pairs with one destination together."""
+        groups = {}
+        for i, (startCode, destCode) in enumerate(pairs):
+            groups.setdefault(destCode, []).append(i)
+
+        routes = [None] * len(pairs)
+        router = self.routers[mode]
+        for destCode, indices in groups.items():
+            results = router.findShortestPaths([pairs[i][0] for i in indices], destCode)
+            for i, (_, path, cost) in zip(indices, results):
+                routes[i] = (path, cost)
+        return routes
+
+    async def _dispatch(self, method, target, body):
+        """Returns the JSON-ready response body for a request, or raises _HttpError."""
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+
+        if url.path == "/route" and method == "GET":
+            if "from" not in query or "to" not in query:
+                raise _HttpError(HTTPStatus.BAD_REQUEST, "from and to are required")
+            return await self.route(query["from"], query["to"], self._mode(query.get("mode")))
+
+        if url.path == "/batch" and method == "POST":
+            try:
+                request = json.loads(body.decode("utf-8"))
+                pairs = request["pairs"]
+            except (ValueError, KeyError, TypeError):
+                raise _HttpError(HTTPStatus.BAD_REQUEST, "Expected a JSON object with \"pairs\"")
+            return {"routes": await self.batch(pairs, self._mode(request.get("mode")))}
+
+        if url.path == "/reach" and method == "GET":
+            if "from" not in query:
+                raise _HttpError(HTTPStatus.BAD_REQUEST, "from is required")
+            try:
+                budget = float(query["budget"]) if "budget" in query else None
+            except ValueError:
+                budget = math.nan
+            if budget is not None and not (math.isfinite(budget) and budget >= 0):
+                raise _HttpError(HTTPStatus.BAD_REQUEST, "budget must be a finite, non-negative number")
+            return await self.reach(query["from"], budget, self._mode(query.get("mode")))
+
+        if url.path == "/status" and method == "GET":
+            return self.status()
+
+        if url.path in ("/route", "/batch", "/reach", "/status"):
+            raise _HttpError(HTTPStatus.METHOD_NOT_ALLOWED, method + " not allowed on " + url.path)
+        raise _HttpError(HTTPStatus.NOT_FOUND, "Unknown endpoint: " + url.path)
+
+    def _mode(self, mode):
+        if mode is None:
+            return DISTANCE
+        if not isinstance(mode, str) or mode not in self.routers:
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "mode must be " + DISTANCE + " or " + TIME)
+        return mode
+
+    async def _handleConnection(self, reader, writer):
+        """Serves HTTP/1.1 requests on one connection (kept alive unless the client asks otherwise)."""
+        metrics = MetroMetrics.metrics
+        try:
+            while True:
+                try:
+                    requestLine = await self._readLine(reader, HTTPStatus.BAD_REQUEST, "Request line too long")
+                    if not requestLine.strip():
+                        break
+
+                    headers = {}
+                    while True:
+                        line = await self._readLine(reader, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Header too long")
+                        if not line.strip():
+                            break
+                        name, _, value = line.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                except _HttpError as e:
+                    # The rest of the oversized line is still unread, so the connection can't be reused
+                    self.counts["requests"] += 1
+                    self._write(writer, e.status, {"error": str(e)}, e.headers, False)
+                    await writer.drain()
+                    metrics.count("service_requests_total", endpoint="", status=int(e.status))
+                    break
+
+                start = time.perf_counter()
+                self.counts["requests"] += 1
+                method = target = ""
+                version = "HTTP/1.0"
+                extraHeaders = {}
+                try:
+                    method, target, version = requestLine.decode("latin-1").split()
+                    length = int(headers.get("content-length", 0))
+                    if length > Constants.SERVICE_MAX_BODY:
+                        raise _HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+                    body = await reader.readexactly(length) if length else b""
+                    status, response = HTTPStatus.OK, await self._dispatch(method, target, body)
+                except _HttpError as e:
+                    status, response, extraHeaders = e.status, {"error": str(e)}, e.headers
+                except ValueError:
+                    status, response = HTTPStatus.BAD_REQUEST, {"error": "Malformed request"}
+                except Exception as e:
+                    status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": type(e).__name__ + ": " + str(e)}
+
+                keepAlive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                self._write(writer, status, response, extraHeaders, keepAlive)
+                await writer.drain()
+
+                endpoint = urlsplit(target).path
+                metrics.count("service_requests_total", endpoint=endpoint, status=int(status))
+                metrics.observe("service_request_seconds", time.perf_counter() - start, endpoint=endpoint)
+                if not keepAlive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _readLine(reader, status, message):
+        """Reads one line of the request head, raising _HttpError(status, message) if it exceeds the stream limit."""
+        try:
+            return await reader.readline()
+        except (asyncio.LimitOverrunError, ValueError):
+            raise _HttpError(status, message)
+
+    @staticmethod
+    def _write(writer, status, response, headers, keepAlive):
+        # Strict JSON: NaN and Infinity are not JSON, so a response holding one is a bug, reported as such
+        try:
+            body = json.dumps(response, allow_nan=False).encode("utf-8")
+        except ValueError as e:
+            status, headers = HTTPStatus.INTERNAL_SERVER_ERROR, {}
+            body = json.dumps({"error": "ValueError: " + str(e)}).encode("utf-8")
+        lines = ["HTTP/1.1 %d %s" % (status, status.phrase),
+                 "Content-Type: application/json",
+                 "Content-Length: " + str(len(body)),
+                 "Connection: " + ("keep-alive" if keepAlive else "close")]
+        lines += [name + ": " + value for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+
+async def serve(network, host, port, workers):
+    """Runs the service until cancelled."""
+    service = RoutingService(network, workers)
+    server = await service.start(host, port)
+    print("Routing service listening on http://%s:%d" % server.sockets[0].getsockname()[:2])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+def main(argv):
+    try:
+        opts,_ = getopt.getopt(argv, "hk:s:H:p:w:")
+    except getopt.GetoptError:
+        print (_USAGE)
+        exit()
+
+    opts = dict(opts)
+    if "-h" in opts or not ("-k" in opts or "-s" in opts):
+        print (_USAGE)
+        exit()
+
+    from AStarRail import loadNetwork
+    network = loadNetwork(opts.get("-k"), opts.get("-s"))
+    try:
+        asyncio.run(serve(network, opts.get("-H", Constants.SERVICE_HOST), int(opts.get("-p", Constants.SERVICE_PORT)),
+                          int(opts.get("-w", Constants.SERVICE_WORKERS))))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,153 @@
+"""
+Local stand-in for the WMATA API. Serves recorded responses (fixtures) over HTTP so that MetroInterface,
+and everything built on it, can run without an API key or network access -- see MetroBenchmark.
+
+Fixtures are MetroCache.ResponseCache entries: recording is just building the network with the response
+cache pointed at the fixture directory (-r). Requests are matched on the same key the cache uses (endpoint
+and query parameters, ignoring the API key); anything not recorded gets a 404.
+
+Live feeds change from one request to the next, so their fixtures hold a sequence of "responses" instead
+(see writeSequence and MetroFeeds.recordFeeds), served one per request; the last one then repeats.
+
+Usage: MetroStubServer -d <fixture directory> [-p <port>]
+       MetroStubServer -r -k <API key> -d <fixture directory>   (record fixtures from the WMATA API)
+"""
+import getopt, hashlib, json, os, sys, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+import MetroConstants as Constants
+from MetroCache import ResponseCache
+
+_USAGE = "MetroStubServer -d <fixture directory> [-p <port>] | -r -k <API key> -d <fixture directory>"
+
+def loadFixtures(directory):
+    """Returns a dictionary of cache key (see MetroCache.ResponseCache.makeKey) to the list of recorded responses."""
+    fixtures = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), "r") as f:
+                entry = json.load(f)
+            responses = entry["responses"] if "responses" in entry else [entry["response"]]
+            fixtures[entry["key"]] = [json.dumps(response).encode("utf-8") for response in responses]
+    return fixtures
+
+def writeSequence(directory, url, params, responses):
+    """Writes a fixture replaying several responses to one query in turn, e.g. successive polls of a feed."""
+    key = ResponseCache.makeKey(url, params)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+    with open(path, "w") as f:
+        json.dump({"key": key, "responses": responses}, f)
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        key = ResponseCache.makeKey(Constants.API_BASE_URL + url.path, dict(parse_qsl(url.query)))
+        responses = self.server.fixtures.get(key)
+        body = None
+        with self.server.lock:
+            self.server.requests += 1
+            if responses:
+                served = self.server.served.get(key, 0)
+                self.server.served[key] = served + 1
+                body = responses[min(served, len(responses) - 1)]
+
+        if body is None:
+            self.server.misses.append(key)
+            self.send_response(404)
+            body = json.dumps({"statusCode": 404, "message": "No fixture for " + key}).encode("utf-8")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubServer:
+    """
+    HTTP server replaying fixtures, run on a background thread.
+
+    Pass url as the baseUrl of a MetroInterface (with caching disabled, so every query goes over HTTP).
+
+    Args:
+        directory (str): Fixture directory.
+        host (str): Interface to listen on.
+        port (int): Port to listen on; 0 picks a free one (see url).
+    """
+
+    def __init__(self, directory, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.fixtures = loadFixtures(directory)
+        self.httpd.requests = 0
+        self.httpd.misses = []
+        # Cache key -> number of times served, to step through response sequences
+        self.httpd.served = {}
+        self.httpd.lock = threading.Lock()
+        self.url = "http://%s:%d" % self.httpd.server_address[:2]
+        self.thread = None
+
+    def requestCount(self):
+        """Returns the number of requests served so far."""
+        return self.httpd.requests
+
+    def misses(self):
+        """Returns the cache keys of requests that had no fixture."""
+        return list(self.httpd.misses)
+
+    def rewind(self):
+        """Restarts every response sequence from its first response."""
+        with self.httpd.lock:
+            self.httpd.served.clear()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def record(apiKey, directory):
+    """Records fixtures: builds the network from the WMATA API, caching every response in the fixture directory."""
+    from MetroInterface import MetroInterface
+    from MetroNetwork import Network
+    Network.build(MetroInterface(apiKey, cacheDirectory=directory), matrixPath=None)
+
+def main(argv):
+    try:
+        opts,_ = getopt.getopt(argv, "hrk:d:p:")
+    except getopt.GetoptError:
+        print (_USAGE)
+        exit()
+
+    opts = dict(opts)
+    if "-h" in opts or "-d" not in opts or ("-r" in opts and "-k" not in opts):
+        print (_USAGE)
+        exit()
+
+    if "-r" in opts:
+        record(opts["-k"], opts["-d"])
+        return
+
+    server = StubServer(opts["-d"], port=int(opts.get("-p", 8000)))
+    print("Serving " + str(len(server.httpd.fixtures)) + " fixtures at " + server.url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
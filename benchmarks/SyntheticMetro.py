@@ -0,0 +1,253 @@
+"""
+Generates the benchmark fixtures: WMATA API responses for a synthetic network, in the
+MetroCache.ResponseCache format that MetroStubServer replays.
+
+The lines, station codes and names follow the WMATA network, but segment distances and travel
+times are generated (from a fixed seed), so the fixtures are reproducible and need no API key.
+Station coordinates start from the real ones at the termini and junctions, with the stations between them
+spread out by generated distance (see coordinates).
+The live feeds (incidents and train positions) get a short scripted sequence of polls, see feedResponses.
+Responses from the real API can be recorded instead with "MetroStubServer -r" (see its usage).
+
+Usage: python3 benchmarks/SyntheticMetro.py [-d <fixture directory>]
+"""
+import getopt, heapq, os, random, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import MetroConstants as Constants
+from MetroCache import ResponseCache
+from MetroGTFS import haversineMiles
+from MetroStubServer import writeSequence
+
+_USAGE = "SyntheticMetro [-d <fixture directory>]"
+_SEED = 6511
+
+NAMES = {
+    "A01": "Metro Center", "A02": "Farragut North", "A03": "Dupont Circle", "A04": "Woodley Park",
+    "A05": "Cleveland Park", "A06": "Van Ness-UDC", "A07": "Tenleytown-AU", "A08": "Friendship Heights",
+    "A09": "Bethesda", "A10": "Medical Center", "A11": "Grosvenor-Strathmore", "A12": "North Bethesda",
+    "A13": "Twinbrook", "A14": "Rockville", "A15": "Shady Grove",
+    "B01": "Gallery Place", "B02": "Judiciary Square", "B03": "Union Station", "B35": "NoMa-Gallaudet U",
+    "B04": "Rhode Island Ave", "B05": "Brookland-CUA", "B06": "Fort Totten", "B07": "Takoma",
+    "B08": "Silver Spring", "B09": "Forest Glen", "B10": "Wheaton", "B11": "Glenmont",
+    "C01": "Metro Center", "C02": "McPherson Square", "C03": "Farragut West", "C04": "Foggy Bottom-GWU",
+    "C05": "Rosslyn", "C06": "Arlington Cemetery", "C07": "Pentagon", "C08": "Pentagon City",
+    "C09": "Crystal City", "C10": "Ronald Reagan Washington National Airport", "C11": "Potomac Yard",
+    "C12": "Braddock Road", "C13": "King St-Old Town", "C14": "Eisenhower Avenue", "C15": "Huntington",
+    "D01": "Federal Triangle", "D02": "Smithsonian", "D03": "L'Enfant Plaza", "D04": "Federal Center SW",
+    "D05": "Capitol South", "D06": "Eastern Market", "D07": "Potomac Ave", "D08": "Stadium-Armory",
+    "D09": "Minnesota Ave", "D10": "Deanwood", "D11": "Cheverly", "D12": "Landover", "D13": "New Carrollton",
+    "E01": "Mt Vernon Sq 7th St-Convention Center", "E02": "Shaw-Howard U", "E03": "U Street",
+    "E04": "Columbia Heights", "E05": "Georgia Ave-Petworth", "E06": "Fort Totten", "E07": "West Hyattsville",
+    "E08": "Hyattsville Crossing", "E09": "College Park-U of Md", "E10": "Greenbelt",
+    "F01": "Gallery Place", "F02": "Archives", "F03": "L'Enfant Plaza", "F04": "Waterfront", "F05": "Navy Yard-Ballpark",
+    "F06": "Anacostia", "F07": "Congress Heights", "F08": "Southern Avenue", "F09": "Naylor Road",
+    "F10": "Suitland", "F11": "Branch Ave",
+    "G01": "Benning Road", "G02": "Capitol Heights", "G03": "Addison Road", "G04": "Morgan Boulevard",
+    "G05": "Downtown Largo",
+    "J02": "Van Dorn Street", "J03": "Franconia-Springfield",
+    "K01": "Court House", "K02": "Clarendon", "K03": "Virginia Square-GMU", "K04": "Ballston-MU",
+    "K05": "East Falls Church", "K06": "West Falls Church", "K07": "Dunn Loring", "K08": "Vienna",
+    "N01": "McLean", "N02": "Tysons", "N03": "Greensboro", "N04": "Spring Hill", "N06": "Wiehle-Reston East",
+}
+
+# Stations with two platforms (codes)
+TOGETHER = {"A01": "C01", "C01": "A01", "B01": "F01", "F01": "B01", "B06": "E06", "E06": "B06", "D03": "F03", "F03": "D03"}
+
+_ORANGE_TRUNK = ["C05", "C04", "C03", "C02", "C01", "D01", "D02", "D03", "D04", "D05", "D06", "D07", "D08"]
+LINES = {
+    "RD": ("Red", ["A15", "A14", "A13", "A12", "A11", "A10", "A09", "A08", "A07", "A06", "A05", "A04", "A03",
+                   "A02", "A01", "B01", "B02", "B03", "B35", "B04", "B05", "B06", "B07", "B08", "B09", "B10", "B11"]),
+    "OR": ("Orange", ["K08", "K07", "K06", "K05", "K04", "K03", "K02", "K01"] + _ORANGE_TRUNK
+                     + ["D09", "D10", "D11", "D12", "D13"]),
+    "SV": ("Silver", ["N06", "N04", "N03", "N02", "N01", "K05", "K04", "K03", "K02", "K01"] + _ORANGE_TRUNK
+                     + ["G01", "G02", "G03", "G04", "G05"]),
+    "BL": ("Blue", ["J03", "J02", "C13", "C12", "C11", "C10", "C09", "C08", "C07", "C06"] + _ORANGE_TRUNK
+                   + ["G01", "G02", "G03", "G04", "G05"]),
+    "YL": ("Yellow", ["C15", "C14", "C13", "C12", "C11", "C10", "C09", "C08", "C07", "F03", "F02", "F01", "E01"]),
+    "GR": ("Green", ["F11", "F10", "F09", "F08", "F07", "F06", "F05", "F04", "F03", "F02", "F01", "E01", "E02",
+                     "E03", "E04", "E05", "E06", "E07", "E08", "E09", "E10"]),
+}
+
+# (latitude, longitude) of the termini and junctions; the other stations are placed between them
+ANCHORS = {
+    "A01": (38.8983, -77.0281), "B01": (38.8984, -77.0219), "D03": (38.8848, -77.0219), "C05": (38.8964, -77.0718),
+    "K05": (38.8859, -77.1568), "C07": (38.8693, -77.0539), "C13": (38.8063, -77.0609), "E01": (38.9055, -77.0219),
+    "B06": (38.9518, -77.0022), "D08": (38.8866, -76.9771), "A15": (39.1198, -77.1646), "B11": (39.0617, -77.0535),
+    "K08": (38.8776, -77.2718), "D13": (38.9480, -76.8717), "N06": (38.9477, -77.3403), "G05": (38.9006, -76.8448),
+    "J03": (38.7665, -77.1679), "C15": (38.7937, -77.0752), "F11": (38.8265, -76.9124), "E10": (39.0111, -76.9110),
+}
+
+# Typical train speed in MPH; each segment's time is its distance at this speed plus a dwell
+_SPEED = 33.0
+_DWELL_MINUTES = 0.5
+
+def segments(seed=_SEED):
+    """Returns {(code, code): (miles, minutes)} for every pair of adjacent stations, in both directions."""
+    rng = random.Random(seed)
+    result = {}
+    for _, codes in LINES.values():
+        for i in range(1, len(codes)):
+            pair = (codes[i - 1], codes[i])
+            if pair in result:
+                continue
+            miles = round(rng.uniform(0.4, 2.6), 2)
+            minutes = round(miles * 60 / _SPEED * rng.uniform(0.9, 1.2) + _DWELL_MINUTES)
+            result[pair] = result[pair[::-1]] = (miles, max(minutes, 1))
+    return result
+
+def _group(code):
+    return min(code, TOGETHER.get(code, code))
+
+def _shortest(source, segmentInfo, metric):
+    """Dijkstra over station groups; returns {group: cost} for one metric (0: miles, 1: minutes)."""
+    neighbors = {}
+    for (a, b), info in segmentInfo.items():
+        neighbors.setdefault(_group(a), []).append((_group(b), info[metric]))
+
+    costs = {source: 0}
+    fringe = [(0, source)]
+    while fringe:
+        cost, current = heapq.heappop(fringe)
+        if cost > costs[current]:
+            continue
+        for other, weight in neighbors.get(current, []):
+            if cost + weight < costs.get(other, float("inf")):
+                costs[other] = cost + weight
+                heapq.heappush(fringe, (cost + weight, other))
+    return costs
+
+def coordinates(segmentInfo):
+    """
+    Returns {code: (latitude, longitude)} for every station. Along each line, stations between two placed ones
+    are spread out in proportion to their generated distances. The coordinates are then pulled toward Metro
+    Center until every segment is at least as long on track as in a straight line, so a straight-line
+    heuristic (see MetroLazy.LazyRouter) stays a lower bound on the generated track distances.
+    """
+    placed = {_group(code): point for code, point in ANCHORS.items()}
+    for _, codes in LINES.values():
+        fixed = [i for i, code in enumerate(codes) if _group(code) in placed]
+        for first, last in zip(fixed, fixed[1:]):
+            miles = [0.0]
+            for i in range(first + 1, last + 1):
+                miles.append(miles[-1] + segmentInfo[(codes[i - 1], codes[i])][0])
+            (latitude1, longitude1), (latitude2, longitude2) = placed[_group(codes[first])], placed[_group(codes[last])]
+            for i in range(first + 1, last):
+                fraction = miles[i - first] / miles[-1]
+                placed[_group(codes[i])] = (latitude1 + (latitude2 - latitude1) * fraction,
+                                            longitude1 + (longitude2 - longitude1) * fraction)
+
+    center = ANCHORS["A01"]
+    def scaled(point, scale):
+        return tuple(round(c + (p - c) * scale, 6) for p, c in zip(point, center))
+
+    scale = 1.0
+    while any(haversineMiles(*scaled(placed[_group(a)], scale), *scaled(placed[_group(b)], scale)) > miles
+              for (a, b), (miles, _) in segmentInfo.items()):
+        scale *= 0.95
+    return {code: scaled(placed[_group(code)], scale) for code in NAMES}
+
+def _stationToStation(sources, destinations, segmentInfo):
+    infos = []
+    for source in sources:
+        miles = _shortest(_group(source), segmentInfo, 0)
+        minutes = _shortest(_group(source), segmentInfo, 1)
+        for dest in destinations:
+            if dest != source:
+                infos.append({
+                    Constants.STATION_STATION_SOURCE: source,
+                    Constants.STATION_STATION_DEST: dest,
+                    Constants.STATION_STATION_MILES: round(miles[_group(dest)], 2),
+                    Constants.STATION_STATION_TIME: minutes[_group(dest)],
+                })
+    return {Constants.STATION_STATION_TOP: infos}
+
+def responses(seed=_SEED):
+    """Returns a list of (url, params, response) for every query MetroNetwork.Network.build makes."""
+    segmentInfo = segments(seed)
+
+    lines = [{Constants.LINES_DISPLAY_NAME: name, Constants.LINES_LINE_CODE: lineCode,
+              Constants.LINES_START_CODE: codes[0], Constants.LINES_END_CODE: codes[-1]}
+             for lineCode, (name, codes) in LINES.items()]
+
+    points = coordinates(segmentInfo)
+    stations = []
+    for code, name in sorted(NAMES.items()):
+        lineCodes = [lineCode for lineCode, (_, codes) in LINES.items() if code in codes] + [None] * 4
+        stations.append({
+            Constants.STATION_LIST_CODE: code, Constants.STATION_LIST_NAME: name,
+            Constants.STATION_LIST_LC1: lineCodes[0], Constants.STATION_LIST_LC2: lineCodes[1],
+            Constants.STATION_LIST_LC3: lineCodes[2], Constants.STATION_LIST_LC4: lineCodes[3],
+            Constants.STATION_LIST_ST1: TOGETHER.get(code, ""), Constants.STATION_LIST_ST2: "",
+            Constants.STATION_LIST_LAT: points[code][0], Constants.STATION_LIST_LON: points[code][1],
+        })
+
+    result = [(Constants.URL_LINES_LIST, {}, {Constants.LINES_TOP: lines}),
+              (Constants.URL_STATION_LIST, {}, {Constants.STATION_LIST_TOP: stations})]
+
+    for lineCode, (_, codes) in LINES.items():
+        start, end = codes[0], codes[-1]
+        path = []
+        for i, code in enumerate(codes):
+            feet = round(segmentInfo[(codes[i - 1], code)][0] * Constants.FEET_PER_MILE) if i else 0
+            path.append({Constants.STATION_PATH_DIST_PREV: feet, "LineCode": lineCode, "SeqNum": i + 1,
+                         Constants.STATION_PATH_CODE: code, "StationName": NAMES[code]})
+
+        result.append((Constants.URL_STATION_PATH, {"FromStationCode": start, "ToStationCode": end},
+                       {Constants.STATION_PATH_TOP: path}))
+        result.append((Constants.URL_STATION_STATION_INFO, {"FromStationCode": start, "ToStationCode": end},
+                       _stationToStation([start], [end], segmentInfo)))
+        result.append((Constants.URL_STATION_STATION_INFO, {"FromStationCode": start},
+                       _stationToStation([start], sorted(NAMES), segmentInfo)))
+    return result
+
+def _train(trainId, lineCode, circuit, seconds, service=Constants.TRAIN_SERVICE_NORMAL):
+    return {Constants.TRAIN_ID: trainId, Constants.TRAIN_LINE: lineCode, Constants.TRAIN_CIRCUIT: circuit,
+            Constants.TRAIN_DESTINATION: LINES[lineCode][1][-1] if lineCode else None,
+            Constants.TRAIN_SECONDS_AT_LOCATION: seconds, Constants.TRAIN_SERVICE_TYPE: service}
+
+def feedResponses():
+    """
+    Returns a list of (url, params, responses) for the live feeds, one response per poll:
+
+        1. No incidents, every train moving.
+        2. A "Delay" incident on Red; an Orange train held for 7 minutes (4 beyond Constants.TRAIN_HOLD_SECONDS).
+        3. Unchanged.
+        4. The incident cleared and the Orange train moving again.
+    """
+    moving = [_train("%03d" % (i + 1), lineCode, 1000 + 10 * i, 20) for i, lineCode in enumerate(LINES)]
+    moving.append(_train("900", None, 2000, 3600, "NoPassengers"))
+    held = [dict(train, SecondsAtLocation=420) if train[Constants.TRAIN_LINE] == "OR" else train for train in moving]
+    delay = {Constants.INCIDENT_ID: "1", Constants.INCIDENT_TYPE: Constants.INCIDENT_TYPE_DELAY,
+             Constants.INCIDENT_DESCRIPTION: "Red Line: Expect delays due to a disabled train.",
+             Constants.INCIDENT_LINES: "RD;"}
+
+    incidents = [[], [delay], [delay], []]
+    trains = [moving, held, held, moving]
+    return [(Constants.URL_INCIDENTS, {}, [{Constants.INCIDENTS_TOP: i} for i in incidents]),
+            (Constants.URL_TRAIN_POSITIONS, {"contentType": "json"}, [{Constants.TRAIN_POSITIONS_TOP: t} for t in trains])]
+
+def writeFixtures(directory, seed=_SEED):
+    """Replaces the fixtures in a directory with freshly generated ones."""
+    cache = ResponseCache(directory)
+    cache.clear()
+    for url, params, response in responses(seed):
+        cache.put(url, params, response)
+    for url, params, sequence in feedResponses():
+        writeSequence(directory, url, params, sequence)
+
+def main(argv):
+    try:
+        opts,_ = getopt.getopt(argv, "hd:")
+    except getopt.GetoptError:
+        print (_USAGE)
+        exit()
+
+    opts = dict(opts)
+    if "-h" in opts:
+        print (_USAGE)
+        exit()
+    writeFixtures(opts.get("-d", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
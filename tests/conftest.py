@@ -0,0 +1,105 @@
+"""
+Shared fixtures: the benchmark's synthetic network (benchmarks/fixtures), served by a local MetroStubServer.
+
+Run with "python3 -m pytest tests" from the repository root.
+"""
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import MetroBenchmark
+import MetroConstants as Constants
+from MetroInterface import MetroInterface
+from MetroNetwork import Network
+from MetroRateLimit import TokenBucket
+from MetroStubServer import StubServer
+
+FIXTURE_DIRECTORY = MetroBenchmark.FIXTURE_DIRECTORY
+
+def stubInterface(server, rateLimiter=None):
+    """Returns a MetroInterface sending every query to a stub server: no response cache and, by default, no rate limit."""
+    return MetroInterface("test", cacheDirectory=None, baseUrl=server.url,
+                          rateLimiter=rateLimiter or TokenBucket(1e9, 1e9))
+
+@pytest.fixture
+def stub():
+    """A StubServer replaying the fixtures, with feed sequences starting from their first response."""
+    with StubServer(FIXTURE_DIRECTORY) as server:
+        yield server
+
+@pytest.fixture(scope="session")
+def snapshotPath(tmp_path_factory):
+    """Snapshot of the network built from the fixtures (built once per test run)."""
+    network, _ = MetroBenchmark.buildNetwork(FIXTURE_DIRECTORY)
+    path = str(tmp_path_factory.mktemp("network") / "network.snapshot")
+    network.save(path)
+    return path
+
+@pytest.fixture
+def network(snapshotPath):
+    """A fresh network without disruptions, so tests can close stations and delay lines freely."""
+    return Network.load(snapshotPath)
+
+def referenceRounds(network, startId, timeBased=False):
+    """
+    Brute-force reference costs, independent of the routers: relaxes every ride on every line from every
+    station, one round per ride, until nothing improves. Follows the routing rules (closed stations and
+    segments, line delays, and by time the transfer penalty at stations with several platforms).
+
+    Returns:
+        List of rows indexed by station id; row k holds the cheapest cost from the start using at most k + 1 rides.
+        The last row holds the cheapest costs overall.
+    """
+    inf = float("inf")
+    costs = [inf] * network.size
+    if network.closedStations[startId]:
+        return [costs]
+    costs[startId] = 0.0
+    penalties = network.lineDelays if timeBased else network.linePenalties
+
+    rows = []
+    while True:
+        nextCosts = list(costs)
+        for stationId, cost in enumerate(costs):
+            if cost == inf or network.closedStations[stationId]:
+                continue
+            if timeBased and stationId != startId and network.multiPlatform[stationId]:
+                cost += Constants.TRANSFER_PENALTY_MINUTES
+            for lineCode, line in network.lineInfos.items():
+                ids = list(network.lineStationIds[lineCode])
+                if stationId not in ids:
+                    continue
+                position = ids.index(stationId)
+                cumulative = line.cumulativeMinutes if timeBased else line.cumulativeMiles
+                closedEdges = network.closedEdges.get(lineCode, ())
+                for otherPosition, otherId in enumerate(ids):
+                    low, high = min(position, otherPosition), max(position, otherPosition)
+                    if network.closedStations[otherId] or any(low < edge <= high for edge in closedEdges):
+                        continue
+                    rideCost = cost + penalties.get(lineCode, 0.0) + abs(cumulative[otherPosition] - cumulative[position])
+                    if rideCost < nextCosts[otherId] - 1e-9:
+                        nextCosts[otherId] = rideCost
+        if nextCosts == costs:
+            return rows or [costs]
+        rows.append(nextCosts)
+        costs = nextCosts
+
+def referenceCosts(network, startId, timeBased=False):
+    """Cheapest cost from a station id to every station id (inf if unreachable), see referenceRounds()."""
+    return referenceRounds(network, startId, timeBased)[-1]
+
+def randomDisruption(network, rng):
+    """
+    Applies one random disruption change to a network: closes or reopens a station or a stretch of line,
+    or changes a line's delay.
+    """
+    codes = [station.codeList[0] for station in network.stations]
+    lineCodes = sorted(network.lineInfos)
+    change = rng.choice(["closeStation", "reopenStation", "closeSegment", "reopenSegment", "setLineDelay"])
+    if change in ("closeStation", "reopenStation"):
+        getattr(network, change)(rng.choice(codes))
+    elif change in ("closeSegment", "reopenSegment"):
+        lineCode = rng.choice(lineCodes)
+        getattr(network, change)(lineCode, *rng.sample(network.lineInfos[lineCode].stations, 2))
+    else:
+        network.setLineDelay(rng.choice(lineCodes), rng.choice([0, 0, 5, 10]))
@@ -0,0 +1,82 @@
+import random, threading
+import pytest
+from conftest import randomDisruption, referenceCosts
+from MetroContraction import ContractedGraph, ContractedRouter
+from MetroRouter import Router, DISTANCE, TIME
+
+@pytest.mark.parametrize("mode", [DISTANCE, TIME])
+def test_routers_follow_incremental_updates(network, mode):
+    rng = random.Random(10)
+    routers = [Router(network, mode=mode), ContractedRouter(network, ContractedGraph(network), mode=mode)]
+    for _ in range(25):
+        randomDisruption(network, rng)
+        for startId in rng.sample(range(network.size), 3):
+            expected = referenceCosts(network, startId, mode == TIME)
+            for destId in range(network.size):
+                if destId == startId:
+                    continue
+                for router in routers:
+                    path, cost = router._search(startId, destId, router._heuristicRow(destId))
+                    assert cost == pytest.approx(expected[destId]), (router.engine, startId, destId)
+                    assert (path is None) == (cost == float("inf"))
+
+@pytest.mark.parametrize("mode", [DISTANCE, TIME])
+def test_contracted_router_matches_router_on_every_pair(network, mode):
+    router = Router(network, mode=mode)
+    contracted = ContractedRouter(network, mode=mode)
+    for destId in range(network.size):
+        heuristicRow = router._heuristicRow(destId)
+        for startId in range(network.size):
+            if startId != destId:
+                _, cost = router._search(startId, destId, heuristicRow)
+                path, contractedCost = contracted._search(startId, destId, heuristicRow)
+                assert contractedCost == pytest.approx(cost)
+                assert path[0] is network.stations[startId] and path[-1] is network.stations[destId]
+
+def test_reverting_every_change_restores_the_costs(network):
+    router = Router(network)
+    before = [router.costsFrom(code) for code in ("A15", "C04", "F11")]
+    network.closeStation("B01")
+    network.closeSegment("OR", "K05", "C05")
+    network.setLineDelay("GR", 10)
+    assert [router.costsFrom(code) for code in ("A15", "C04", "F11")] != before
+
+    network.reopenStation("B01")
+    network.reopenSegment("OR", "K02", "K04")
+    network.reopenSegment("OR", "K05", "K04")
+    network.reopenSegment("OR", "K02", "C05")
+    network.setLineDelay("GR", 0)
+    assert [router.costsFrom(code) for code in ("A15", "C04", "F11")] == before
+    assert not network.closedEdges and not network.lineDelays
+
+def test_listeners_see_each_change_once(network):
+    changes = []
+    network.addListener(lambda *change: changes.append(change))
+    network.closeStation("B01")
+    network.closeStation("F01")
+    network.closeSegment("RD", "A03", "A01")
+    network.setLineDelay("RD", 5)
+    network.reopenStation("B01")
+
+    stationId = network.stationId("B01")
+    assert changes == [
+        (1, [], [stationId], False),
+        # Closed already: F01 is another platform of the same station
+        (2, [("RD", 12, 14)], [], False),
+        (3, [("RD", 0, len(network.lineInfos["RD"].stations) - 1)], [], False),
+        (4, [], [stationId], True),
+    ]
+    assert network.version == 4
+
+def test_listeners_may_change_the_network(network):
+    # Listeners run after the lock is released: one reacting to a closure with another change doesn't deadlock
+    def closeNeighbor(version, segments, stationIds, improved):
+        if stationIds == [network.stationId("B01")] and not improved:
+            network.closeStation("B02")
+
+    network.addListener(closeNeighbor)
+    thread = threading.Thread(target=network.closeStation, args=("B01",), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert network.closedStations[network.stationId("B02")] and network.version == 2
@@ -0,0 +1,63 @@
+import MetroConstants as Constants
+from conftest import stubInterface
+from MetroFeeds import FeedPoller, INCIDENTS, TRAIN_POSITIONS
+from MetroStubServer import StubServer, writeSequence
+
+def incident(incidentId, lines, incidentType=Constants.INCIDENT_TYPE_DELAY):
+    return {Constants.INCIDENT_ID: incidentId, Constants.INCIDENT_TYPE: incidentType,
+            Constants.INCIDENT_DESCRIPTION: "Expect delays.", Constants.INCIDENT_LINES: lines}
+
+def train(trainId, lineCode, seconds, service=Constants.TRAIN_SERVICE_NORMAL):
+    return {Constants.TRAIN_ID: trainId, Constants.TRAIN_LINE: lineCode, Constants.TRAIN_CIRCUIT: 1000,
+            Constants.TRAIN_DESTINATION: None, Constants.TRAIN_SECONDS_AT_LOCATION: seconds,
+            Constants.TRAIN_SERVICE_TYPE: service}
+
+def writeFeeds(directory, incidents, trains):
+    """Writes feed fixtures replaying one response per poll."""
+    writeSequence(directory, Constants.URL_INCIDENTS, {},
+                  [{Constants.INCIDENTS_TOP: poll} for poll in incidents])
+    writeSequence(directory, Constants.URL_TRAIN_POSITIONS, {"contentType": "json"},
+                  [{Constants.TRAIN_POSITIONS_TOP: poll} for poll in trains])
+
+def test_scripted_feeds(stub, network):
+    poller = FeedPoller(stubInterface(stub), network)
+    delays = []
+    for _ in range(4):
+        changes = [poller.poll(INCIDENTS), poller.poll(TRAIN_POSITIONS)]
+        delays.append((dict(network.lineDelays), [bool(change) for change in changes]))
+
+    assert delays == [
+        ({}, [False, True]),
+        ({"RD": Constants.INCIDENT_DELAY_MINUTES, "OR": 4}, [True, True]),
+        ({"RD": Constants.INCIDENT_DELAY_MINUTES, "OR": 4}, [False, False]),
+        ({}, [True, True]),
+    ]
+
+def test_incident_moving_to_another_line(tmp_path, network):
+    writeFeeds(str(tmp_path), [[incident("1", "RD;")], [incident("1", "OR;")], [incident("1", "OR;", "Alert")]],
+               [[]])
+    with StubServer(str(tmp_path)) as server:
+        poller = FeedPoller(stubInterface(server), network)
+        poller.poll(INCIDENTS)
+        assert network.lineDelays == {"RD": Constants.INCIDENT_DELAY_MINUTES}
+        assert "changed" in poller.poll(INCIDENTS)
+        assert network.lineDelays == {"OR": Constants.INCIDENT_DELAY_MINUTES}
+        poller.poll(INCIDENTS)
+        assert network.lineDelays == {}
+
+def test_held_train_leaving_its_line(tmp_path, network):
+    writeFeeds(str(tmp_path), [[]], [
+        [train("1", "GR", 420), train("2", "BL", 480)],
+        [train("1", None, 420, "NoPassengers"), train("2", "BL", 480)],
+        [train("1", None, 420, "NoPassengers")],
+    ])
+    with StubServer(str(tmp_path)) as server:
+        poller = FeedPoller(stubInterface(server), network)
+        poller.poll(TRAIN_POSITIONS)
+        assert network.lineDelays == {"GR": 4, "BL": 5}
+        # Out of service: the train has no line any more
+        assert "changed" in poller.poll(TRAIN_POSITIONS)
+        assert network.lineDelays == {"BL": 5}
+        # Gone from the feed
+        assert "removed" in poller.poll(TRAIN_POSITIONS)
+        assert network.lineDelays == {}
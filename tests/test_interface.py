@@ -0,0 +1,26 @@
+import time
+from conftest import stubInterface
+from MetroNetwork import Network
+from MetroRateLimit import TokenBucket
+
+def test_build_requests_each_query_once(stub):
+    network = Network.build(stubInterface(stub), matrixPath=None)
+
+    assert not stub.misses()
+    assert network.size == 92 and len(network.lineInfos) == 6
+    # Lines and stations, then the path, speed and rail times of each line: nothing is fetched twice
+    assert stub.requestCount() == 2 + 3 * 6
+    assert set(stub.httpd.served.values()) == {1}
+
+def test_build_is_paced_by_the_rate_limit(stub):
+    # One token up front, then 40 per second: the other 19 requests take at least 19 / 40 seconds
+    start = time.monotonic()
+    Network.build(stubInterface(stub, TokenBucket(40, 1)), matrixPath=None)
+    assert time.monotonic() - start >= 19 / 40 * 0.95
+
+def test_build_matches_the_snapshot(stub, network):
+    built = Network.build(stubInterface(stub), matrixPath=None)
+    assert [station.name for station in built.stations] == [station.name for station in network.stations]
+    for lineCode, line in built.lineInfos.items():
+        assert line.stations == network.lineInfos[lineCode].stations
+        assert list(line.segmentMiles) == list(network.lineInfos[lineCode].segmentMiles)
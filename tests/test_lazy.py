@@ -0,0 +1,34 @@
+import pytest
+from conftest import stubInterface
+from MetroLazy import LazyNetwork, LazyRouter
+from MetroRouter import Router
+
+PAIRS = [("A15", "A12"), ("A15", "B11"), ("K08", "D13"), ("N06", "C15"), ("J03", "E10"), ("F11", "A09")]
+
+def test_straight_line_heuristic_is_a_lower_bound(stub, network):
+    lazy = LazyNetwork(stubInterface(stub))
+    router = LazyRouter(lazy)
+    for destCode in ("A01", "B11", "C15", "N06"):
+        row = router._heuristicRow(lazy.stationId(destCode))
+        assert max(row) > 0
+        # Never more than the track distance (the matrix row of the full network)
+        destId = network.stationId(destCode)
+        exact = network.distanceMatrix.distances[destId * network.size:(destId + 1) * network.size]
+        for station in network.stations:
+            code = station.codeList[0]
+            assert row[lazy.stationId(code)] <= exact[network.stationId(code)] + 1e-9
+
+def test_routes_match_the_full_network(stub, network):
+    lazy = LazyNetwork(stubInterface(stub))
+    lazyRouter, router = LazyRouter(lazy), Router(network)
+    lazyStats, zeroStats = {}, {}
+    for startCode, destCode in PAIRS:
+        startId, destId = lazy.stationId(startCode), lazy.stationId(destCode)
+        _, cost = lazyRouter._search(startId, destId, lazyRouter._heuristicRow(destId), lazyStats)
+        _, expected = router._search(network.stationId(startCode), network.stationId(destCode),
+                                     router._heuristicRow(network.stationId(destCode)))
+        assert cost == pytest.approx(expected), (startCode, destCode)
+        # The same search without the straight-line bound
+        _, zeroCost = lazyRouter._search(startId, destId, [0.0] * lazy.size, zeroStats)
+        assert zeroCost == pytest.approx(expected)
+    assert lazyStats["expanded"] < zeroStats["expanded"]
@@ -0,0 +1,36 @@
+import pytest
+import MetroBenchmark
+import MetroConstants as Constants
+from conftest import referenceCosts
+from MetroMatrix import DistanceMatrix
+from MetroRouter import Router, DISTANCE, TIME
+
+def test_rows_are_exact_costs(network):
+    matrix, n = network.distanceMatrix, network.size
+    for startId in range(n):
+        miles = referenceCosts(network, startId)
+        minutes = referenceCosts(network, startId, True)
+        # Travel times count boarding at the start as a transfer
+        penalty = Constants.TRANSFER_PENALTY_MINUTES if network.multiPlatform[startId] else 0.0
+        for destId in range(n):
+            assert matrix.distances[destId * n + startId] == pytest.approx(miles[destId])
+            expected = minutes[destId] + penalty if destId != startId else 0.0
+            assert matrix.minutes[destId * n + startId] == pytest.approx(expected)
+
+def test_save_and_load(network, tmp_path):
+    path = str(tmp_path / "distances.matrix")
+    network.distanceMatrix.save(path)
+    matrix = DistanceMatrix.load(path)
+    assert matrix.names == network.distanceMatrix.names and matrix.inputs == network.distanceMatrix.inputs
+    assert list(matrix.distances) == list(network.distanceMatrix.distances)
+    assert list(matrix.minutes) == list(network.distanceMatrix.minutes)
+
+def test_routing_by_time_expands_no_more_than_by_distance(network):
+    stats = {}
+    for mode in (DISTANCE, TIME):
+        router = Router(network, mode=mode)
+        stats[mode] = {}
+        for startCode, destCode in MetroBenchmark.SINGLE_PAIRS:
+            router.findShortestPath(startCode, destCode, stats=stats[mode])
+    assert stats[TIME]["expanded"] <= stats[DISTANCE]["expanded"]
+    assert stats[TIME]["evaluations"] <= stats[DISTANCE]["evaluations"]
@@ -0,0 +1,55 @@
+import random
+import pytest
+from conftest import randomDisruption, referenceCosts, referenceRounds
+from MetroRaptor import RaptorRouter
+from MetroRouter import DISTANCE, TIME
+
+def expectedPareto(rows, destId, maxTransfers):
+    """The (transfers, cost) pairs that beat every route with fewer transfers, from referenceRounds() rows."""
+    pareto = []
+    for transfers, row in enumerate(rows[:maxTransfers + 1]):
+        if row[destId] < float("inf") and (not pareto or row[destId] < pareto[-1][1] - 1e-9):
+            pareto.append((transfers, row[destId]))
+    return pareto
+
+@pytest.mark.parametrize("mode", [DISTANCE, TIME])
+def test_cheapest_cost_follows_disruptions(network, mode):
+    rng = random.Random(13)
+    router = RaptorRouter(network, mode)
+    for _ in range(25):
+        randomDisruption(network, rng)
+        for startId in rng.sample(range(network.size), 3):
+            expected = referenceCosts(network, startId, mode == TIME)
+            for destId in range(network.size):
+                if destId == startId:
+                    continue
+                pareto = router._scan(startId, destId, 8, None)
+                cost = pareto[-1][1] if pareto else float("inf")
+                assert cost == pytest.approx(expected[destId]), (network.stations[startId], network.stations[destId])
+
+@pytest.mark.parametrize("mode", [DISTANCE, TIME])
+@pytest.mark.parametrize("maxTransfers", [1, 8])
+def test_pareto_set_matches_bounded_rounds(network, mode, maxTransfers):
+    rng = random.Random(14)
+    router = RaptorRouter(network, mode)
+    for trial in range(10):
+        if trial:
+            randomDisruption(network, rng)
+        for startId in rng.sample(range(network.size), 4):
+            rows = referenceRounds(network, startId, mode == TIME)
+            for destId in range(network.size):
+                if destId == startId:
+                    continue
+                pareto = router._scan(startId, destId, maxTransfers, None)
+                assert [(transfers, pytest.approx(cost)) for transfers, cost, _ in pareto] == \
+                    expectedPareto(rows, destId, maxTransfers), (network.stations[startId], network.stations[destId])
+                for transfers, _, path in pareto:
+                    assert len(path) == transfers + 2
+                    assert path[0] is network.stations[startId] and path[-1] is network.stations[destId]
+
+def test_closed_and_identical_endpoints(network):
+    router = RaptorRouter(network)
+    assert router.findParetoPaths("A15", "A15") == [(0, 0.0, [network.stations[network.stationId("A15")]])]
+    network.closeStation("A15")
+    assert router.findParetoPaths("A15", "B11") == []
+    assert router.findShortestPath("B11", "A15") is None
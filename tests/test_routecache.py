@@ -0,0 +1,84 @@
+import random
+import pytest
+from conftest import randomDisruption, referenceCosts
+from MetroRouter import Router, DISTANCE, TIME
+
+@pytest.mark.parametrize("mode", [DISTANCE, TIME])
+def test_cached_routes_follow_disruptions(network, mode):
+    # Every route the cache answers must still be the best one after any sequence of disruption changes
+    rng = random.Random(9)
+    router = Router(network, cacheSize=300, mode=mode)
+    startIds = rng.sample(range(network.size), 6)
+    for _ in range(30):
+        randomDisruption(network, rng)
+        for startId in startIds:
+            expected = referenceCosts(network, startId, mode == TIME)
+            for destId in rng.sample(range(network.size), 15) + startIds:
+                if destId != startId:
+                    _, cost = router._route(startId, destId, None)
+                    assert cost == pytest.approx(expected[destId]), (network.stations[startId], network.stations[destId])
+    assert router.cacheStats()["hits"] > 0 and router.cacheStats()["invalidations"] > 0
+
+def test_only_affected_routes_are_invalidated(network):
+    router = Router(network, cacheSize=100)
+    path = router.findShortestPath("A15", "A12")
+    router.findShortestPath("C15", "D13")
+    assert router.cacheStats()["size"] == 2
+
+    # Far from both routes: nothing is evicted
+    network.closeStation("N02")
+    router.findShortestPath("A15", "A12")
+    assert router.cacheStats()["invalidations"] == 0 and router.cacheStats()["hits"] == 1
+
+    # On the Red line route's stretch only
+    network.closeSegment("RD", "A14", "A13")
+    assert router.cacheStats()["invalidations"] == 1
+    assert router.findShortestPath("A15", "A12") is None
+    assert router.findShortestPath("C15", "D13") is not None
+    assert router.cacheStats()["hits"] == 2
+
+    # Reopening makes the cached "unreachable" answer stale too
+    network.reopenSegment("RD", "A14", "A13")
+    assert router.findShortestPath("A15", "A12") == path
+
+def test_line_delays_invalidate_routes_riding_the_line(network):
+    router = Router(network, cacheSize=100)
+    router.findShortestPath("A15", "A12")
+    router.findShortestPath("C15", "D13")
+
+    network.setLineDelay("RD", 10)
+    assert router.cacheStats()["invalidations"] == 1
+    router.findShortestPath("A15", "A12")
+
+    # Clearing the delay evicts the route computed while it applied, but not the older one elsewhere
+    network.setLineDelay("RD", 0)
+    assert router.cacheStats()["invalidations"] == 2
+    assert router.cachedRoute(network.stationId("C15"), network.stationId("D13")) is not None
+
+def test_routes_searched_during_a_change_are_not_cached(network):
+    router = Router(network, cacheSize=100)
+    startId, destId = network.stationId("A15"), network.stationId("B11")
+    version = network.version
+    path, cost = router._search(startId, destId, router._heuristicRow(destId))
+    network.closeStation("B05")
+    router.routeCache.put(startId, destId, version, path, cost)
+    assert router.routeCache.get(startId, destId) is None
+
+def test_least_recently_used_routes_are_evicted(network):
+    router = Router(network, cacheSize=3)
+    for destCode in ("A01", "A02", "A03", "A04", "A05"):
+        router.findShortestPath("A15", destCode)
+    stats = router.cacheStats()
+    assert stats["size"] == 3 and stats["evictions"] == 2
+    assert router.cachedRoute(network.stationId("A15"), network.stationId("A01")) is None
+    assert router.cachedRoute(network.stationId("A15"), network.stationId("A05")) is not None
+
+def test_route_dependencies(network):
+    router = Router(network, cacheSize=10)
+    path = router.findShortestPath("A15", "E10")
+    stationIds, segments = router.routeCache.routeDependencies(path)
+    assert stationIds == tuple(network.stationId(station.name) for station in path)
+    assert len(segments) == len(path) - 1
+    for (lineCode, start, end), (boardAt, alightAt) in zip(segments, zip(path, path[1:])):
+        line = network.lineInfos[lineCode]
+        assert sorted((line.positionOf(boardAt), line.positionOf(alightAt))) == [start, end]
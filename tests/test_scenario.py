@@ -0,0 +1,36 @@
+import re
+import pytest
+from MetroScenario import Scenario, evaluate, evaluateScenarios, startsAndDestinations
+
+@pytest.mark.parametrize("change, message", [
+    (["closeStation", "ZZZ"], "unknown station code ZZZ"),
+    (["closeSegment", "RD", "A15", "ZZZ"], "unknown station code ZZZ"),
+    (["setLineDelay", "XX", 5], "unknown line code XX"),
+    (["setLineDelay", "RD", "soon"], "delay must be a non-negative number of minutes"),
+    (["closeStation"], "closeStation takes 1 argument(s) (station)"),
+    (["closeSegment", "RD", "A15", "D13"], "A15 and D13 must both be on the RD line"),
+    (["demolish", "A01"], "Unknown scenario change"),
+    ("closeStation", "Unknown scenario change"),
+])
+def test_invalid_changes_are_reported_readably(network, change, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        Scenario(network, "bad", [change])
+
+def test_unknown_pairs_are_left_out(network):
+    errors = []
+    pairs = {"A15": ["B11", "ZZZ"], "YYY": ["A01"]}
+    starts = list(startsAndDestinations(network, pairs, errors))
+    assert starts == [(network.stationId("A15"), [network.stationId("B11")])]
+    assert errors == [{"start": "A15", "destination": "ZZZ", "error": "unknown station code ZZZ"},
+                      {"start": "YYY", "destination": "A01", "error": "unknown station code YYY"}]
+    result = evaluate(network, Scenario(network, "Red closed", [["closeSegment", "RD", "A14", "A13"]]), pairs=pairs)
+    assert result["pairs"] == 1 and result["newlyUnreachable"] == 1
+
+def test_evaluate_scenarios_reports_errors(snapshotPath):
+    specs = [{"name": "ok", "changes": [["closeStation", "B01"]]}, {"name": "bad", "changes": [["closeStation", "NOPE"]]}]
+    pairs = {"A15": ["D13", "ZZZ"]}
+    results = list(evaluateScenarios(snapshotPath, specs, pairs=pairs, processes=1))
+    assert results[0] == {"start": "A15", "destination": "ZZZ", "error": "unknown station code ZZZ"}
+    byName = {result["name"]: result for result in results[1:]}
+    assert byName["ok"]["pairs"] == 1 and "error" not in byName["ok"]
+    assert byName["bad"]["error"] == "unknown station code NOPE in ['closeStation', 'NOPE']"
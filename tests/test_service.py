@@ -0,0 +1,38 @@
+import asyncio, json
+import pytest
+from MetroService import RoutingService
+
+def get(service, target):
+    """Sends one GET request to a running service; returns (status, parsed body)."""
+    async def request():
+        server = await service.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(("GET " + target + " HTTP/1.0\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+
+    head, _, body = asyncio.run(request()).partition(b"\r\n\r\n")
+    # Strict JSON: fails on NaN or Infinity
+    return int(head.split()[1]), json.loads(body, parse_constant=lambda name: pytest.fail(name))
+
+@pytest.mark.parametrize("budget", ["nan", "inf", "-inf", "-1", "abc"])
+def test_reach_rejects_invalid_budgets(network, budget):
+    service = RoutingService(network, workers=1)
+    status, response = get(service, "/reach?from=C04&budget=" + budget)
+    service.close()
+    assert status == 400 and "budget" in response["error"]
+
+def test_reach_within_a_budget(network):
+    service = RoutingService(network, workers=1)
+    status, response = get(service, "/reach?from=C04&budget=5")
+    zero = get(service, "/reach?from=C04&budget=0")[1]
+    service.close()
+    assert status == 200 and response["budget"] == 5
+    costs = [station["cost"] for station in response["stations"]]
+    assert costs == sorted(costs) and costs[0] == 0 and costs[-1] <= 5 and len(costs) > 1
+    assert [station["codes"] for station in zero["stations"]] == [["C04"]]